@@ -0,0 +1,172 @@
+"""
+Benchmark beban end-to-end: berapa update/detik yang sanggup diproses dispatcher, dan berapa p99 latensinya?
+
+Update sintetis (pesan private, mention di grup, dan callback menu pengaturan) diumpankan ke dp.feed_update dengan
+laju tetap atau Poisson, melewati seluruh middleware dan handler sebenarnya. Bot API, Mistral, dan Supabase diganti
+stand-in lokal dari load_harness.py (proses terpisah) dengan latensi yang bisa diatur. Hasilnya: throughput,
+persentil latensi per jenis update dan per handler, serta jumlah request per backend, dalam laporan JSON yang bisa
+dibandingkan antar commit (--output hasil.json, lalu --baseline hasil.json pada commit berikutnya).
+
+Penjadwal pesan keluar tetap menegakkan batas laju Telegram per chat, jadi --users dan --groups ikut menentukan
+latensi. Flood control dan cache balasan mengikuti konfigurasi biasa; gunakan --env NAMA=NILAI untuk mengubahnya.
+
+Gangguan Mistral (--mistral-error-rate, --mistral-stall-rate, --mistral-drop-rate, --mistral-fault-models) menguji retry,
+hedging, dan circuit breaker di bawah beban, mis. model utama 503 dengan Retry-After sementara model cadangan sehat.
+
+Contoh: python benchmarks/bench_dispatcher_load.py --rate 50 --duration 20 --mix private=6,group=3,callback=1 --output hasil.json
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+import load_harness
+from load_harness import BOT_USERNAME, BOT_USER_ID, StubBackends, StubOptions
+
+_PROMPT_WORDS = (
+    "jelaskan ringkas cara kerja cache LRU dan kapan sebaiknya dipakai dalam aplikasi web yang sibuk "
+    "bandingkan asyncio dengan thread untuk beban I/O tulis contoh kode python dengan penjelasan langkah demi langkah"
+).split()
+_CALLBACK_DATA = ("settings_main", "settings_change_language", "settings_change_model", "setlang_en", "setlang_id")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in ("private", "group", "callback"):
+            raise argparse.ArgumentTypeError(f"Jenis update tidak dikenal: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+class SyntheticUpdates:
+    def __init__(self, users: int, groups: int, prompt_words: int, seed: int, model_ids: List[str]):
+        self.random = random.Random(seed)
+        self.users = users
+        self.groups = groups
+        self.prompt_words = prompt_words
+        self.callback_data = _CALLBACK_DATA + tuple(f"setmodel_{model_id}" for model_id in model_ids)
+        self.update_ids = iter(range(1, 1 << 62))
+
+    def _user(self) -> Dict[str, Any]:
+        user_id = 10_000 + self.random.randrange(self.users)
+        return {"id": user_id, "is_bot": False, "first_name": f"Pengguna {user_id}", "language_code": "id"}
+
+    def _prompt(self) -> str:
+        return " ".join(self.random.choice(_PROMPT_WORDS) for _ in range(self.prompt_words))
+
+    def make(self, kind: str) -> Dict[str, Any]:
+        update_id = next(self.update_ids)
+        user = self._user()
+        now = int(time.time())
+        if kind == "private":
+            chat = {"id": user["id"], "type": "private"}
+            return {"update_id": update_id, "message": {"message_id": update_id, "date": now, "chat": chat, "from": user, "text": self._prompt()}}
+        if kind == "group":
+            chat = {"id": -1_000_000_000_000 - self.random.randrange(self.groups), "type": "supergroup", "title": "Grup uji"}
+            text = f"@{BOT_USERNAME} {self._prompt()}"
+            return {"update_id": update_id, "message": {"message_id": update_id, "date": now, "chat": chat, "from": user, "text": text}}
+        bot_user = {"id": BOT_USER_ID, "is_bot": True, "first_name": "Load Harness", "username": BOT_USERNAME}
+        menu_message = {"message_id": update_id, "date": now, "chat": {"id": user["id"], "type": "private"}, "from": bot_user, "text": "menu"}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user["id"]), "message": menu_message,
+            "data": self.random.choice(self.callback_data),
+        }}
+
+
+def schedule(rate: float, duration: float, mix: Dict[str, float], arrival: str, rng: random.Random) -> List[Tuple[float, str]]:
+    """Daftar (detik_sejak_mulai, jenis_update) untuk model kedatangan open-loop."""
+    kinds, weights = list(mix), list(mix.values())
+    offsets, elapsed = [], 0.0
+    while True:
+        elapsed += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if elapsed >= duration:
+            return offsets
+        offsets.append((elapsed, rng.choices(kinds, weights)[0]))
+
+
+async def run(args, stubs: StubBackends, stub_options: StubOptions):
+    from aiogram.types import Update
+    from config import AVAILABLE_MISTRAL_MODELS
+
+    recorder = load_harness.LatencyRecorder()
+    bot, dp = await load_harness.start_bot_under_test(recorder)
+    await stubs.reset_stats()
+
+    generator = SyntheticUpdates(args.users, args.groups, args.prompt_words, args.seed, list(AVAILABLE_MISTRAL_MODELS))
+    plan = schedule(args.rate, args.duration, args.mix, args.arrival, random.Random(args.seed))
+    # Update dibuat dan divalidasi sebelum pengukuran agar biaya generator tidak ikut terhitung
+    updates = [(offset, kind, Update.model_validate(generator.make(kind), context={"bot": bot})) for offset, kind in plan]
+    print(f"{len(updates)} update dalam {args.duration}s (~{args.rate}/s, {args.arrival}), campuran {args.mix}")
+
+    tasks = set()
+    started = time.perf_counter()
+    for offset, kind, update in updates:
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(recorder.feed(dp, bot, kind, update, started + offset))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=args.drain_timeout)
+
+    await load_harness.stop_bot_under_test()
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "log_level")}
+    return load_harness.build_report(recorder, await stubs.stats(), len(updates), parameters, stub_options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20.0, help="Update per detik yang ditawarkan")
+    parser.add_argument("--duration", type=float, default=10.0, help="Lama pengumpanan update (detik)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("private=6,group=3,callback=1"), help="Bobot jenis update")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--users", type=int, default=200, help="Jumlah pengguna berbeda")
+    parser.add_argument("--groups", type=int, default=20, help="Jumlah grup berbeda")
+    parser.add_argument("--prompt-words", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Batas tunggu update yang masih berjalan")
+    parser.add_argument("--telegram-latency-ms", type=float, default=StubOptions.telegram_latency_ms)
+    parser.add_argument("--mistral-ttft-ms", type=float, default=StubOptions.mistral_ttft_ms)
+    parser.add_argument("--mistral-tokens", type=int, default=StubOptions.mistral_tokens)
+    parser.add_argument("--mistral-token-interval-ms", type=float, default=StubOptions.mistral_token_interval_ms)
+    parser.add_argument("--supabase-latency-ms", type=float, default=StubOptions.supabase_latency_ms)
+    parser.add_argument("--mistral-fault-models", default="", help="Model yang diberi gangguan (dipisah koma); kosong = semua")
+    parser.add_argument("--mistral-error-rate", type=float, default=0.0, help="Peluang request chat dijawab error HTTP")
+    parser.add_argument("--mistral-error-status", type=int, default=StubOptions.mistral_error_status)
+    parser.add_argument("--mistral-retry-after", type=float, default=0.0, help="Nilai header Retry-After pada error (0 = tanpa header)")
+    parser.add_argument("--mistral-stall-rate", type=float, default=0.0, help="Peluang request macet sebelum token pertama")
+    parser.add_argument("--mistral-stall-ms", type=float, default=StubOptions.mistral_stall_ms)
+    parser.add_argument("--mistral-drop-rate", type=float, default=0.0, help="Peluang koneksi putus di tengah stream")
+    parser.add_argument("--log-level", default="ERROR", help="Level log bot selama pengukuran")
+    parser.add_argument("--env", action="append", default=[], metavar="NAMA=NILAI", help="Override konfigurasi bot, boleh berulang")
+    parser.add_argument("--output", help="Tulis laporan JSON ke file ini")
+    parser.add_argument("--baseline", help="Laporan JSON sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)-8s - %(module)s - %(message)s")
+
+    stub_options = StubOptions(
+        telegram_latency_ms=args.telegram_latency_ms, mistral_ttft_ms=args.mistral_ttft_ms, mistral_tokens=args.mistral_tokens,
+        mistral_token_interval_ms=args.mistral_token_interval_ms, supabase_latency_ms=args.supabase_latency_ms,
+        mistral_fault_models=args.mistral_fault_models, mistral_error_rate=args.mistral_error_rate,
+        mistral_error_status=args.mistral_error_status, mistral_retry_after_seconds=args.mistral_retry_after,
+        mistral_stall_rate=args.mistral_stall_rate, mistral_stall_ms=args.mistral_stall_ms,
+        mistral_drop_rate=args.mistral_drop_rate, fault_seed=args.seed,
+    )
+    stubs = StubBackends(stub_options)
+    stubs.start()
+    try:
+        load_harness.prepare_environment(stubs, dict(item.split("=", 1) for item in args.env))
+        report = asyncio.run(run(args, stubs, stub_options))
+    finally:
+        stubs.stop()
+    load_harness.print_report(report, load_harness.load_baseline(args.baseline))
+    load_harness.write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: throughput JsonI18n.gettext dengan katalog hasil kompilasi dibanding implementasi lama.
+
+Implementasi lama (lookup locale, lookup kedua ke default locale, log warning di setiap miss, lalu .format() di
+handler) disalin di bawah sebagai acuan. Katalog diambil dari locales/ milik repo; satu kunci dihapus dari satu
+locale agar jalur fallback ikut terukur. Keluaran kedua implementasi diverifikasi identik sebelum diukur.
+
+Contoh: python benchmarks/bench_i18n_gettext.py --calls 200000
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LOCALES_DIR  # noqa: E402
+from json_i18n_service import JsonI18n  # noqa: E402
+
+
+class ReferenceJsonI18n:
+    """gettext versi lama, dipertahankan sebagai acuan keluaran dan kecepatan."""
+
+    def __init__(self, locales_data: Dict[str, Dict[str, str]], default_locale: str = "en"):
+        self.locales_data = locales_data
+        self.default_locale = default_locale
+
+    def gettext(self, key: str, default: Optional[str] = None, locale_override: Optional[str] = None, **kwargs: Any) -> str:
+        loc_to_use = locale_override if locale_override else self.default_locale
+        lang_data = self.locales_data.get(loc_to_use)
+        if not lang_data and loc_to_use != self.default_locale:
+            logging.warning(f"Data locale '{loc_to_use}' tidak ditemukan, fallback ke default '{self.default_locale}' untuk kunci '{key}'.")
+            lang_data = self.locales_data.get(self.default_locale)
+        if not lang_data:
+            return default if default is not None else key
+        translated_string = lang_data.get(key)
+        if translated_string is None:
+            if loc_to_use != self.default_locale:
+                default_lang_data = self.locales_data.get(self.default_locale)
+                if default_lang_data:
+                    translated_string = default_lang_data.get(key)
+            if translated_string is None:
+                logging.warning(f"Kunci '{key}' tidak ditemukan di locale '{loc_to_use}' atau di default locale. Menggunakan fallback.")
+                return default if default is not None else key
+        try:
+            return translated_string.format(**kwargs) if kwargs else translated_string
+        except KeyError:
+            return translated_string
+
+
+def prepare_locales(target_dir: str, locale: str, removed_key: str):
+    for filename in os.listdir(LOCALES_DIR):
+        if filename.endswith(".json"):
+            shutil.copy(os.path.join(LOCALES_DIR, filename), target_dir)
+    path = os.path.join(target_dir, f"{locale}.json")
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data.pop(removed_key, None)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def measure(calls: int, func) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000, help="Jumlah panggilan per skenario")
+    parser.add_argument("--locale", default="id", help="Locale yang diukur (satu kuncinya dihapus untuk jalur fallback)")
+    args = parser.parse_args()
+    # Log warning tetap diformat dan dikirim ke handler (biaya nyata versi lama), tetapi tidak dicetak
+    logging.basicConfig(level=logging.WARNING, handlers=[logging.NullHandler()], force=True)
+
+    with tempfile.TemporaryDirectory() as locales_dir:
+        prepare_locales(locales_dir, args.locale, removed_key="thinking_message")
+        new = JsonI18n(path=locales_dir, default_locale="en")
+        old = ReferenceJsonI18n(new.locales_data, default_locale="en")
+
+        scenarios = [
+            ("teks biasa", "welcome_message", {}),
+            ("fallback ke default", "thinking_message", {}),
+            ("template + kwargs", "current_model_label", {"current_model_name": "Mistral Large"}),
+            ("kunci tidak dikenal", "no_such_key", {}),
+        ]
+        print(f"{'skenario':<22} | {'lama ops/s':>12} | {'baru ops/s':>12} | {'x':>6}")
+        for name, key, kwargs in scenarios:
+            expected = old.gettext(key, locale_override=args.locale, **kwargs)
+            assert new.gettext(key, locale_override=args.locale, **kwargs) == expected, f"Keluaran berbeda untuk '{key}'!"
+            old_rate = measure(args.calls, lambda: old.gettext(key, locale_override=args.locale, **kwargs))
+            new_rate = measure(args.calls, lambda: new.gettext(key, locale_override=args.locale, **kwargs))
+            print(f"{name:<22} | {old_rate:>12,.0f} | {new_rate:>12,.0f} | {new_rate / old_rate:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: throughput sanitizer markdown untuk balasan panjang yang banyak berisi kode.
+
+Membandingkan implementasi lama (pemindaian per karakter, disalin di bawah sebagai acuan) dengan
+markdown_utils.ensure_valid_markdown, lalu mensimulasikan streaming: versi lama menyanitasi ulang seluruh teks
+di setiap edit progres, versi baru memakai MarkdownSanitizer.feed()/tail(). Keluaran keduanya diverifikasi identik.
+
+Contoh: python benchmarks/bench_markdown_sanitizer.py --sizes 4,16,64,100 --chunk-chars 40 --edit-every 80
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_utils import MarkdownSanitizer, ensure_valid_markdown  # noqa: E402
+
+
+def reference_ensure_valid_markdown(text: str) -> str:
+    """Implementasi lama ensure_valid_markdown, dipertahankan sebagai acuan keluaran dan kecepatan."""
+    stack = []
+    result = []
+    i = 0
+    single_char_symbols = {'*', '`', '~'}
+    multi_char_symbols = {'```'}
+    while i < len(text):
+        processed_multichar = False
+        if i + 3 <= len(text):
+            current_segment = text[i:i+3]
+            if current_segment in multi_char_symbols:
+                if stack and stack[-1] == current_segment:
+                    stack.pop()
+                else:
+                    stack.append(current_segment)
+                result.append(current_segment)
+                i += 3
+                processed_multichar = True
+        if processed_multichar:
+            continue
+        if text[i] in single_char_symbols:
+            if stack and stack[-1] == text[i]:
+                stack.pop()
+            else:
+                stack.append(text[i])
+            result.append(text[i])
+        else:
+            result.append(text[i])
+        i += 1
+    while stack:
+        result.append(stack.pop())
+    return ''.join(result)
+
+
+_PROSE = [
+    "Here is how you can **fix** the issue. ", "The `config` object is *optional*. ", "Note: use ~strikethrough~ sparingly. ",
+    "Run `pip install -r requirements.txt` first. ", "This works because `a * b` is evaluated lazily. ",
+]
+_CODE = [
+    "def area(w, h):\n    return w * h\n", "for i in range(10):\n    total += i ** 2\n", "ptr = *(int *)buf;\n",
+    "query = f\"SELECT * FROM users WHERE id = {user_id}\"\n", "x = `echo $HOME`\n", "# ~/.config/app.toml\n",
+]
+
+
+def make_reply(size_bytes: int, seed: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size_bytes:
+        if rng.random() < 0.5:
+            block = "```python\n" + "".join(rng.choice(_CODE) for _ in range(rng.randint(2, 8))) + "```\n"
+        else:
+            block = "".join(rng.choice(_PROSE) for _ in range(rng.randint(1, 4))) + "\n"
+        parts.append(block)
+        length += len(block)
+    if rng.random() < 0.5:
+        parts.append("```js\nconsole.log(`unterminated")  # Balasan terpotong: tag masih terbuka
+    return "".join(parts)[:size_bytes]
+
+
+def split_chunks(text: str, chunk_chars: int):
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+def best_of(repeats: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def stream_reference(chunks, edit_every: int) -> str:
+    text = ""
+    since_edit = 0
+    for chunk in chunks:
+        text += chunk
+        since_edit += len(chunk)
+        if since_edit >= edit_every:
+            reference_ensure_valid_markdown(text)
+            since_edit = 0
+    return reference_ensure_valid_markdown(text)
+
+
+def stream_incremental(chunks, edit_every: int) -> str:
+    sanitizer = MarkdownSanitizer()
+    safe_parts = []
+    since_edit = 0
+    for chunk in chunks:
+        safe_parts.append(sanitizer.feed(chunk))
+        since_edit += len(chunk)
+        if since_edit >= edit_every:
+            safe_prefix = "".join(safe_parts)
+            safe_parts = [safe_prefix]
+            _ = safe_prefix + sanitizer.tail()
+            since_edit = 0
+    return "".join(safe_parts) + sanitizer.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="4,16,64,100", help="Ukuran balasan dalam KB, dipisah koma")
+    parser.add_argument("--chunk-chars", type=int, default=40, help="Ukuran potongan stream (karakter)")
+    parser.add_argument("--edit-every", type=int, default=80, help="Edit progres setiap N karakter (STREAM_EDIT_MIN_DELTA_CHARS)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'ukuran':>8} | {'lama MB/s':>10} | {'baru MB/s':>10} | {'x':>6} | {'stream lama':>12} | {'stream baru':>12} | {'x':>7}")
+    for size_kb in (int(item) for item in args.sizes.split(",")):
+        reply = make_reply(size_kb * 1024, seed=size_kb)
+        chunks = split_chunks(reply, args.chunk_chars)
+        expected = reference_ensure_valid_markdown(reply)
+        assert ensure_valid_markdown(reply) == expected, "Keluaran berbeda dari implementasi lama!"
+        assert stream_incremental(chunks, args.edit_every) == expected, "Keluaran streaming berbeda!"
+
+        megabytes = len(reply.encode("utf-8")) / 1_000_000
+        old_full = best_of(args.repeats, lambda: reference_ensure_valid_markdown(reply))
+        new_full = best_of(args.repeats, lambda: ensure_valid_markdown(reply))
+        old_stream = best_of(max(1, args.repeats // 2), lambda: stream_reference(chunks, args.edit_every))
+        new_stream = best_of(args.repeats, lambda: stream_incremental(chunks, args.edit_every))
+        print(
+            f"{size_kb:>6}KB | {megabytes / old_full:>10.1f} | {megabytes / new_full:>10.1f} | {old_full / new_full:>5.1f}x | "
+            f"{old_stream * 1000:>10.1f}ms | {new_stream * 1000:>10.2f}ms | {old_stream / new_stream:>6.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: apakah N pengguna bersamaan masih mengantre di belakang satu sama lain saat memanggil Supabase?
+
+Klien Supabase diganti dengan klien palsu yang meniru latensi jaringan (time.sleep) pada setiap execute().
+Mode "blocking" memanggil execute() langsung di dalam coroutine (perilaku lama), mode "executor"
+memakai fungsi storage_service yang sebenarnya di atas SupabaseBackend.
+
+Contoh: python benchmarks/bench_supabase_concurrency.py --users 50 --rtt-ms 80
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+
+import storage_service  # noqa: E402
+import supabase_backend  # noqa: E402
+
+
+class _FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.status_code = 200
+        self.error = None
+
+
+class _FakeQuery:
+    def __init__(self, rtt: float):
+        self._rtt = rtt
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self._rtt)
+        return _FakeResponse({"preferred_language_code": "en"})
+
+
+class _FakeSupabaseClient:
+    def __init__(self, rtt: float):
+        self._rtt = rtt
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self._rtt)
+
+
+async def _blocking_lookup(user_id: int):
+    # Perilaku lama: execute() sinkron langsung di event loop
+    return storage_service.storage_backend.client.table("user_preferences").select("preferred_language_code").eq("user_id", user_id).maybe_single().execute()
+
+
+async def _run(label: str, coro_factory, users: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(coro_factory(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {users} pengguna: {elapsed * 1000:8.1f} ms total, {elapsed * 1000 / users:6.1f} ms/pengguna")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    storage_service.storage_backend = supabase_backend.SupabaseBackend(_FakeSupabaseClient(args.rtt_ms / 1000))
+    print(f"RTT simulasi {args.rtt_ms} ms, SUPABASE_MAX_WORKERS={supabase_backend.SUPABASE_MAX_WORKERS}")
+
+    blocking = await _run("blocking", _blocking_lookup, args.users)
+    executor = await _run("executor", storage_service.get_user_language_preference, args.users)
+    print(f"Percepatan: {blocking / executor:.1f}x")
+    await storage_service.close_storage()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
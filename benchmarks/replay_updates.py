@@ -0,0 +1,152 @@
+"""
+Replay rekaman update produksi (update_recorder.py) ke dispatcher dengan stand-in lokal dari load_harness.py.
+
+Rekaman dibuat dengan UPDATE_RECORDER_PATH; beberapa file (rotasi .1, .2, ... atau satu file per worker) digabung
+berdasarkan waktu kedatangan. Jarak antar-update dipertahankan pada --speed 1, dipercepat N kali pada --speed N,
+atau dihapus sama sekali pada --speed 0 (secepat mungkin, opsional dibatasi --max-in-flight). Laporannya sama dengan
+bench_dispatcher_load.py: throughput, persentil latensi per jenis update dan per handler, dan request per backend,
+jadi biaya sebuah perubahan terukur pada bentuk trafik nyata (tempelan panjang, ledakan mention, badai callback).
+
+Contoh: python benchmarks/replay_updates.py rekaman/updates.jsonl* --speed 4 --output replay.json --baseline replay-lama.json
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import load_harness
+from load_harness import StubBackends, StubOptions
+
+
+def read_recording(path: str) -> Tuple[Optional[str], List[Tuple[float, Dict[str, Any]]]]:
+    """(username bot dari header, daftar (waktu_kedatangan, update)) dari satu file rekaman."""
+    bot_username, records = None, []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Baris terakhir bisa terpotong jika proses berhenti saat menulis
+                logging.warning(f"{path}:{line_number}: baris rusak dilewati")
+                continue
+            if "recording" in record:
+                bot_username = bot_username or record.get("bot_username")
+            else:
+                records.append((record["t"], record["u"]))
+    return bot_username, records
+
+
+def merge_recordings(paths: List[str]) -> Tuple[Optional[str], Iterator[Tuple[float, Dict[str, Any]]]]:
+    bot_username, streams = None, []
+    for path in paths:
+        file_bot_username, records = read_recording(path)
+        bot_username = bot_username or file_bot_username
+        streams.append(sorted(records, key=lambda record: record[0]))
+    return bot_username, heapq.merge(*streams, key=lambda record: record[0])
+
+
+def update_kind(update: Dict[str, Any]) -> str:
+    if "callback_query" in update:
+        return "callback"
+    message = update.get("message") or update.get("edited_message")
+    if message is None:
+        return next((key for key in update if key != "update_id"), "unknown")
+    scope = "private" if message.get("chat", {}).get("type") == "private" else "group"
+    is_command = str(message.get("text", "")).startswith("/")
+    return f"{scope}_command" if is_command else scope
+
+
+async def run(args, records: List[Tuple[float, Dict[str, Any]]], stubs: StubBackends, stub_options: StubOptions):
+    from aiogram.types import Update
+
+    recorder = load_harness.LatencyRecorder()
+    bot, dp = await load_harness.start_bot_under_test(recorder)
+    await stubs.reset_stats()
+
+    updates = [
+        (recorded_at - records[0][0], update_kind(raw), Update.model_validate(raw, context={"bot": bot}))
+        for recorded_at, raw in records
+    ]
+    span = updates[-1][0] if updates else 0.0
+    pace = f"{args.speed}x" if args.speed > 0 else "secepat mungkin"
+    print(f"Replay {len(updates)} update (rentang rekaman {span:.1f}s) dengan kecepatan {pace}")
+
+    in_flight = asyncio.Semaphore(args.max_in_flight) if args.max_in_flight > 0 else None
+    tasks = set()
+
+    async def feed(kind: str, update: Update, arrival: float):
+        try:
+            await recorder.feed(dp, bot, kind, update, arrival)
+        finally:
+            if in_flight is not None:
+                in_flight.release()
+
+    started = time.perf_counter()
+    for offset, kind, update in updates:
+        if args.speed > 0:
+            delay = started + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if in_flight is not None:
+            await in_flight.acquire()
+        arrival = started + offset / args.speed if args.speed > 0 else time.perf_counter()
+        task = asyncio.create_task(feed(kind, update, arrival))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=args.drain_timeout)
+
+    await load_harness.stop_bot_under_test()
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "log_level")}
+    return load_harness.build_report(recorder, await stubs.stats(), len(updates), parameters, stub_options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="+", help="File rekaman JSONL (boleh beberapa, digabung berdasarkan waktu)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pengali kecepatan replay; 0 = secepat mungkin")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Batas update yang diproses bersamaan (0 = tanpa batas)")
+    parser.add_argument("--limit", type=int, default=0, help="Hanya replay N update pertama")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Batas tunggu update yang masih berjalan")
+    parser.add_argument("--telegram-latency-ms", type=float, default=StubOptions.telegram_latency_ms)
+    parser.add_argument("--mistral-ttft-ms", type=float, default=StubOptions.mistral_ttft_ms)
+    parser.add_argument("--mistral-tokens", type=int, default=StubOptions.mistral_tokens)
+    parser.add_argument("--mistral-token-interval-ms", type=float, default=StubOptions.mistral_token_interval_ms)
+    parser.add_argument("--supabase-latency-ms", type=float, default=StubOptions.supabase_latency_ms)
+    parser.add_argument("--log-level", default="ERROR", help="Level log bot selama pengukuran")
+    parser.add_argument("--env", action="append", default=[], metavar="NAMA=NILAI", help="Override konfigurasi bot, boleh berulang")
+    parser.add_argument("--output", help="Tulis laporan JSON ke file ini")
+    parser.add_argument("--baseline", help="Laporan JSON sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)-8s - %(module)s - %(message)s")
+
+    bot_username, merged = merge_recordings(args.recordings)
+    records = list(merged)
+    if args.limit > 0:
+        records = records[:args.limit]
+    if not records:
+        parser.error("Rekaman tidak berisi update")
+
+    stub_options = StubOptions(
+        telegram_latency_ms=args.telegram_latency_ms, mistral_ttft_ms=args.mistral_ttft_ms, mistral_tokens=args.mistral_tokens,
+        mistral_token_interval_ms=args.mistral_token_interval_ms, supabase_latency_ms=args.supabase_latency_ms,
+        bot_username=bot_username or load_harness.BOT_USERNAME,
+    )
+    stubs = StubBackends(stub_options)
+    stubs.start()
+    try:
+        load_harness.prepare_environment(stubs, dict(item.split("=", 1) for item in args.env))
+        report = asyncio.run(run(args, records, stubs, stub_options))
+    finally:
+        stubs.stop()
+    load_harness.print_report(report, load_harness.load_baseline(args.baseline))
+    load_harness.write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from json_i18n_service import JsonI18n 
-from config import TELEGRAM_BOT_TOKEN, LOCALES_DIR, DEFAULT_LANGUAGE 
+from config import TELEGRAM_BOT_TOKEN, LOCALES_DIR, DEFAULT_LANGUAGE, TELEGRAM_API_BASE_URL
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
+# Server Bot API alternatif (mis. server palsu lokal untuk pengujian); default api.telegram.org
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE_URL)) if TELEGRAM_API_BASE_URL else None
+bot = Bot(token=TELEGRAM_BOT_TOKEN, session=bot_session)
 dp = Dispatcher()
 
 
@@ -28,18 +28,181 @@ if not MISTRAL_API_KEY:
     print("ERROR: MISTRAL_API_KEY tidak ditemukan di .env")
     raise ValueError("MISTRAL_API_KEY tidak ditemukan di .env. Mohon periksa file .env Anda.")
 
+# Mode penerimaan update: "polling" (default) atau "webhook" (server aiohttp, lihat webhook_server.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL") # URL publik HTTPS; kosong = tidak didaftarkan (uji lokal)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") # Dikirim Telegram di header X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_LISTEN_HOST = os.getenv("WEBHOOK_LISTEN_HOST", "0.0.0.0")
+WEBHOOK_LISTEN_PORT = int(os.getenv("WEBHOOK_LISTEN_PORT", "8080"))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    print("PERINGATAN: WEBHOOK_SECRET tidak diatur. Endpoint webhook tidak memverifikasi pengirim update.")
+
+# Sharding multi-proses: >1 menjalankan supervisor yang membagi update ke N proses worker berdasarkan user/chat
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_HEALTH_INTERVAL_SECONDS = float(os.getenv("WORKER_HEALTH_INTERVAL_SECONDS", "5"))
+WORKER_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT_SECONDS", "30"))
+
+# Penjadwal admisi Mistral: batas panggilan paralel per model dan panjang antrian sebelum permintaan ditolak.
+# Override per model lewat env, contoh: MISTRAL_MODEL_CONCURRENCY="mistral-large-latest=2,codestral-latest=3"
+MISTRAL_DEFAULT_CONCURRENCY = int(os.getenv("MISTRAL_DEFAULT_CONCURRENCY", "4"))
+MISTRAL_MODEL_CONCURRENCY = {
+    model_id.strip(): int(limit)
+    for model_id, limit in (
+        item.split("=", 1) for item in os.getenv("MISTRAL_MODEL_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
+MISTRAL_QUEUE_MAX_LENGTH = int(os.getenv("MISTRAL_QUEUE_MAX_LENGTH", "50"))
+QUEUE_POSITION_UPDATE_INTERVAL_SECONDS = float(os.getenv("QUEUE_POSITION_UPDATE_INTERVAL_SECONDS", "3"))
+
+# Flood control (token bucket): laju isi ulang per menit dan kapasitas burst per jenis chat
+FLOOD_CONTROL_ENABLED = os.getenv("FLOOD_CONTROL_ENABLED", "true").lower() in ("1", "true", "yes")
+FLOOD_PRIVATE_RATE_PER_MINUTE = float(os.getenv("FLOOD_PRIVATE_RATE_PER_MINUTE", "20"))
+FLOOD_PRIVATE_BURST = float(os.getenv("FLOOD_PRIVATE_BURST", "5"))
+FLOOD_GROUP_USER_RATE_PER_MINUTE = float(os.getenv("FLOOD_GROUP_USER_RATE_PER_MINUTE", "10"))
+FLOOD_GROUP_USER_BURST = float(os.getenv("FLOOD_GROUP_USER_BURST", "3"))
+FLOOD_GROUP_CHAT_RATE_PER_MINUTE = float(os.getenv("FLOOD_GROUP_CHAT_RATE_PER_MINUTE", "30"))
+FLOOD_GROUP_CHAT_BURST = float(os.getenv("FLOOD_GROUP_CHAT_BURST", "10"))
+FLOOD_BUCKET_MAX_ENTRIES = int(os.getenv("FLOOD_BUCKET_MAX_ENTRIES", "100000"))
+FLOOD_BUCKET_IDLE_SECONDS = float(os.getenv("FLOOD_BUCKET_IDLE_SECONDS", "600"))
+FLOOD_NOTICE_INTERVAL_SECONDS = float(os.getenv("FLOOD_NOTICE_INTERVAL_SECONDS", "30"))
+
+# Cache balasan exact-match (opt-in per jenis chat, mis. "group,supergroup"; kosong = nonaktif).
+# RESPONSE_CACHE_SQLITE_PATH kosong = hanya tier memori.
+RESPONSE_CACHE_CHAT_TYPES = {item.strip() for item in os.getenv("RESPONSE_CACHE_CHAT_TYPES", "").split(",") if item.strip()}
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_SQLITE_PATH", "")
+RESPONSE_CACHE_SQLITE_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_SQLITE_MAX_ROWS", "50000"))
+
+# Pool HTTP klien Mistral. MISTRAL_SERVER_URL bisa diarahkan ke server stub lokal untuk pengujian.
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL", "")
+# HTTP/2 butuh paket h2 (httpx[http2] di requirements.txt); jika tidak terpasang, pool kembali ke HTTP/1.1.
+MISTRAL_HTTP2_ENABLED = os.getenv("MISTRAL_HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+MISTRAL_POOL_MAX_CONNECTIONS = int(os.getenv("MISTRAL_POOL_MAX_CONNECTIONS", "20"))
+MISTRAL_POOL_MAX_KEEPALIVE = int(os.getenv("MISTRAL_POOL_MAX_KEEPALIVE", "10"))
+MISTRAL_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("MISTRAL_KEEPALIVE_EXPIRY_SECONDS", "120"))
+MISTRAL_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MISTRAL_CONNECT_TIMEOUT_SECONDS", "5"))
+MISTRAL_POOL_TIMEOUT_SECONDS = float(os.getenv("MISTRAL_POOL_TIMEOUT_SECONDS", "10"))
+MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS = float(os.getenv("MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS", "30"))
+MISTRAL_TOTAL_TIMEOUT_SECONDS = float(os.getenv("MISTRAL_TOTAL_TIMEOUT_SECONDS", "120"))
+MISTRAL_POOL_WARM_CONNECTIONS = int(os.getenv("MISTRAL_POOL_WARM_CONNECTIONS", "2"))
+MISTRAL_KEEP_WARM_INTERVAL_SECONDS = float(os.getenv("MISTRAL_KEEP_WARM_INTERVAL_SECONDS", "0"))
+
+# Ketahanan panggilan Mistral: retry, hedging ke model cadangan, dan circuit breaker per model.
+# MISTRAL_FALLBACK_MODEL kosong = tanpa hedging/failover; MISTRAL_HEDGE_DELAY_SECONDS 0 = hanya failover.
+MISTRAL_MAX_RETRIES = int(os.getenv("MISTRAL_MAX_RETRIES", "2"))
+MISTRAL_RETRY_BASE_DELAY_SECONDS = float(os.getenv("MISTRAL_RETRY_BASE_DELAY_SECONDS", "0.5"))
+MISTRAL_RETRY_MAX_DELAY_SECONDS = float(os.getenv("MISTRAL_RETRY_MAX_DELAY_SECONDS", "8"))
+MISTRAL_FALLBACK_MODEL = os.getenv("MISTRAL_FALLBACK_MODEL", "")
+MISTRAL_HEDGE_DELAY_SECONDS = float(os.getenv("MISTRAL_HEDGE_DELAY_SECONDS", "4"))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Penjadwal pesan keluar Telegram: anggaran laju global dan per chat, penanganan RetryAfter, penggabungan edit.
+# TELEGRAM_API_BASE_URL bisa diarahkan ke server Bot API lokal/palsu untuk pengujian (kosong = api.telegram.org).
+OUTBOUND_SCHEDULER_ENABLED = os.getenv("OUTBOUND_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "")
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", "30"))
+TELEGRAM_PRIVATE_CHAT_RATE_PER_SECOND = float(os.getenv("TELEGRAM_PRIVATE_CHAT_RATE_PER_SECOND", "1"))
+TELEGRAM_PRIVATE_CHAT_BURST = float(os.getenv("TELEGRAM_PRIVATE_CHAT_BURST", "3"))
+TELEGRAM_GROUP_CHAT_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_CHAT_RATE_PER_MINUTE", "20"))
+TELEGRAM_GROUP_CHAT_BURST = float(os.getenv("TELEGRAM_GROUP_CHAT_BURST", "5"))
+TELEGRAM_RETRY_AFTER_MAX_RETRIES = int(os.getenv("TELEGRAM_RETRY_AFTER_MAX_RETRIES", "3"))
+
+# Endpoint metrik Prometheus (GET /metrics), hanya untuk akses lokal. Port 0 = nonaktif.
+# Dengan WORKER_PROCESSES > 1, worker ke-i mendengarkan di METRICS_PORT + 1 + i.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Watchdog event loop (opt-in): stall di atas ambang dicatat beserta call site yang memblokir.
+# Laporan ditulis ke log secara berkala dan tersedia di GET /debug/loop-stalls pada endpoint metrik.
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "false").lower() in ("1", "true", "yes")
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100"))
+LOOP_WATCHDOG_SAMPLE_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_SAMPLE_INTERVAL_MS", "20"))
+LOOP_WATCHDOG_REPORT_INTERVAL_SECONDS = float(os.getenv("LOOP_WATCHDOG_REPORT_INTERVAL_SECONDS", "300"))
+
+# Perekam update teranonimkan (JSONL) untuk replay uji performa (benchmarks/replay_updates.py). Kosong = nonaktif.
+# Tanpa UPDATE_RECORDER_SALT, pseudonim id berubah setiap bot dimulai ulang (dalam satu run, worker berbagi salt dari
+# supervisor). Atur UPDATE_RECORDER_SALT agar rekaman dari beberapa run bisa digabung per pengguna/chat.
+UPDATE_RECORDER_PATH = os.getenv("UPDATE_RECORDER_PATH", "")
+UPDATE_RECORDER_MAX_BYTES = int(os.getenv("UPDATE_RECORDER_MAX_BYTES", str(64 * 1024 * 1024)))
+UPDATE_RECORDER_BACKUP_COUNT = int(os.getenv("UPDATE_RECORDER_BACKUP_COUNT", "5"))
+UPDATE_RECORDER_SALT = os.getenv("UPDATE_RECORDER_SALT", "")
+
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOCALES_DIR = os.path.join(CURRENT_DIR, "locales")
+# Hot reload katalog terjemahan: interval pengecekan perubahan locales/*.json (0 = nonaktif)
+I18N_RELOAD_INTERVAL_SECONDS = float(os.getenv("I18N_RELOAD_INTERVAL_SECONDS", "5"))
 
 DEFAULT_LANGUAGE = "en"
 SUPPORTED_LANGUAGES = ["en", "id", "ru", "fr"]
 
 MISTRAL_SYSTEM_PROMPT = os.getenv("MISTRAL_SYSTEM_PROMPT", None) 
 
+# Streaming balasan Mistral: pesan "Thinking..." diedit bertahap selama token masuk.
+# Edit digabung agar tidak lebih sering dari interval dan tidak lebih kecil dari delta minimum (batas edit Telegram).
+MISTRAL_STREAMING_ENABLED = os.getenv("MISTRAL_STREAMING_ENABLED", "true").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.5"))
+STREAM_EDIT_MIN_DELTA_CHARS = int(os.getenv("STREAM_EDIT_MIN_DELTA_CHARS", "80"))
+
+# Backend penyimpanan sesi, riwayat, dan preferensi: "supabase" (PostgREST) atau "sqlite" (file lokal mode WAL,
+# untuk deployment satu node dan pengujian offline; aman dipakai bersama oleh proses worker).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SQLITE_STORAGE_PATH = os.getenv("SQLITE_STORAGE_PATH", "data/bot_storage.sqlite3")
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-MAX_HISTORY_MESSAGES = 10 
+# Jendela kandidat riwayat yang dimuat per sesi. Batas sebenarnya untuk prompt adalah anggaran token per model
+# (MODEL_HISTORY_TOKEN_BUDGETS); pesan lama yang keluar dari anggaran dilipat ke ringkasan bergulir.
+MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "40"))
+
+HISTORY_TOKEN_BUDGET_DEFAULT = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+MODEL_HISTORY_TOKEN_BUDGETS = {
+    "mistral-small-latest": 8000,
+    "open-mistral-nemo": 4000,
+    "pixtral-12b-2409": 4000,
+    "codestral-latest": 12000,
+    "open-codestral-mamba": 8000,
+}
+
+# Ringkasan bergulir untuk pesan yang keluar dari anggaran token, dibuat async dengan model murah
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "open-mistral-nemo")
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "512"))
+
+# Jumlah maksimum query Supabase yang dijalankan bersamaan di thread pool (lihat supabase_backend._execute)
+SUPABASE_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+
+# Cache in-process untuk baris user_preferences (bahasa + model), diperbarui write-through saat disimpan
+PREFERENCE_CACHE_MAX_SIZE = int(os.getenv("PREFERENCE_CACHE_MAX_SIZE", "10000"))
+PREFERENCE_CACHE_TTL_SECONDS = float(os.getenv("PREFERENCE_CACHE_TTL_SECONDS", "600"))
+
+# Ring buffer riwayat percakapan in-memory (N pesan terakhir per sesi), dievikasi LRU bila melewati batas
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "5000"))
+HISTORY_CACHE_MAX_TOTAL_CHARS = int(os.getenv("HISTORY_CACHE_MAX_TOTAL_CHARS", "50000000"))
+
+# Write-behind untuk insert chat_messages: baris digabung menjadi bulk insert (per ukuran batch atau interval)
+HISTORY_WRITE_BEHIND_ENABLED = os.getenv("HISTORY_WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_WRITE_BATCH_SIZE = int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "50"))
+HISTORY_WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_WRITE_FLUSH_INTERVAL_SECONDS", "1.0"))
+HISTORY_WRITE_MAX_RETRIES = int(os.getenv("HISTORY_WRITE_MAX_RETRIES", "3"))
+HISTORY_WRITE_QUEUE_MAX = int(os.getenv("HISTORY_WRITE_QUEUE_MAX", "10000"))
+
+# Retensi riwayat (history_retention.py): pesan sesi lama setelah /newchat dihapus di latar belakang setelah jeda
+# (agar baris write-behind dan balasan yang masih streaming ikut terhapus), lalu sweep berkala menegakkan batas umur
+# dan jumlah sesi per pengguna. Penghapusan berjalan dalam batch dengan jeda antar-batch. 0 = batas tidak dipakai.
+# Antrian penghapusan /newchat hanya ada di memori; sweep selalu membersihkan sesi non-aktif yang tertinggal setelah
+# crash/restart, jadi sesi lama tetap terhapus walau kedua batas di bawah bernilai 0 (paling lambat satu interval sweep).
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_MAX_SESSIONS_PER_USER = int(os.getenv("RETENTION_MAX_SESSIONS_PER_USER", "0"))
+RETENTION_SWEEP_INTERVAL_SECONDS = float(os.getenv("RETENTION_SWEEP_INTERVAL_SECONDS", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.2"))
+RETENTION_SESSION_PURGE_DELAY_SECONDS = float(os.getenv("RETENTION_SESSION_PURGE_DELAY_SECONDS", "30"))
 
-if not (SUPABASE_URL and SUPABASE_SERVICE_KEY):
+if STORAGE_BACKEND == "supabase" and not (SUPABASE_URL and SUPABASE_SERVICE_KEY):
     print("PERINGATAN: SUPABASE_URL atau SUPABASE_SERVICE_KEY tidak ditemukan di .env. Fitur riwayat percakapan tidak akan aktif.")
@@ -0,0 +1,136 @@
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import MAX_HISTORY_MESSAGES, HISTORY_CACHE_MAX_SESSIONS, HISTORY_CACHE_MAX_TOTAL_CHARS
+
+
+def _as_message(role: str, content: str, created_at: Optional[str]) -> Dict[str, str]:
+    # created_at menandai posisi pesan untuk ringkasan bergulir (history_budget); tidak dikirim ke model
+    message = {"role": role, "content": content}
+    if created_at:
+        message["created_at"] = created_at
+    return message
+
+
+class _SessionHistory:
+    __slots__ = ("user_id", "messages", "chars")
+
+    def __init__(self, user_id: int, max_messages: int):
+        self.user_id = user_id
+        self.messages: Deque[Tuple[str, str, Optional[str]]] = deque(maxlen=max_messages)
+        self.chars = 0
+
+
+class ConversationCache:
+    """
+    Ring buffer riwayat percakapan per sesi di depan tabel chat_messages.
+    Setiap sesi menyimpan N pesan terakhir sebagai tuple (role, content, created_at). Sesi yang paling lama tidak dipakai
+    dievikasi (LRU) jika jumlah sesi atau total karakter melewati batas.
+    Cache juga mengingat sesi aktif per pengguna agar get_current_session_id tidak perlu query.
+    """
+
+    def __init__(self, max_messages: int, max_sessions: int, max_total_chars: int):
+        self.max_messages = max(1, max_messages)
+        self.max_sessions = max(1, max_sessions)
+        self.max_total_chars = max_total_chars
+        self._sessions: "OrderedDict[str, _SessionHistory]" = OrderedDict()
+        self._current_session_by_user: Dict[int, str] = {}
+        self._total_chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_current_session(self, user_id: int) -> Optional[str]:
+        return self._current_session_by_user.get(user_id)
+
+    def set_current_session(self, user_id: int, session_id: str):
+        """Mengingat sesi aktif yang dibaca dari storage; riwayatnya baru di-cache saat hydrate."""
+        self._current_session_by_user[user_id] = session_id
+        if len(self._current_session_by_user) > 2 * self.max_sessions:
+            # Pengguna yang riwayatnya tidak (lagi) di-cache dilupakan agar peta ini tetap terbatas
+            self._current_session_by_user = {
+                cached_user_id: cached_session_id for cached_user_id, cached_session_id in self._current_session_by_user.items()
+                if cached_session_id in self._sessions or cached_user_id == user_id
+            }
+
+    def get_history(self, session_id: str, limit: int) -> Optional[List[Dict[str, str]]]:
+        """Mengembalikan maksimal `limit` pesan terakhir, atau None jika sesi tidak ada di cache."""
+        entry = self._sessions.get(session_id)
+        if entry is None or limit > self.max_messages:
+            self.misses += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        messages = list(entry.messages)[-limit:] if limit > 0 else []
+        return [_as_message(role, content, created_at) for role, content, created_at in messages]
+
+    def hydrate(self, user_id: int, session_id: str, messages: List[Dict[str, str]]):
+        """Mengisi cache dari hasil query (urutan lama -> baru). Dipanggil hanya setelah cold miss."""
+        self._drop_session(session_id)
+        entry = _SessionHistory(user_id, self.max_messages)
+        for item in messages[-self.max_messages:]:
+            entry.messages.append((item["role"], item["content"], item.get("created_at")))
+            entry.chars += len(item["content"])
+        self._sessions[session_id] = entry
+        self._total_chars += entry.chars
+        self._current_session_by_user[user_id] = session_id
+        self._enforce_limits()
+
+    def append(self, session_id: str, role: str, content: str, created_at: Optional[str] = None):
+        """Menambahkan pesan ke sesi yang sudah ada di cache (write-through); sesi yang tidak ter-cache diabaikan."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+        if len(entry.messages) == entry.messages.maxlen:
+            dropped_chars = len(entry.messages[0][1])
+            entry.chars -= dropped_chars
+            self._total_chars -= dropped_chars
+        entry.messages.append((role, content, created_at))
+        entry.chars += len(content)
+        self._total_chars += len(content)
+        self._sessions.move_to_end(session_id)
+        self._enforce_limits()
+
+    def start_session(self, user_id: int, session_id: str):
+        """Dipanggil oleh start_new_chat_session: sesi lama dibuang, sesi baru langsung hangat (kosong)."""
+        self.invalidate_user(user_id)
+        self.hydrate(user_id, session_id, [])
+
+    def invalidate_user(self, user_id: int):
+        old_session_id = self._current_session_by_user.pop(user_id, None)
+        if old_session_id:
+            self._drop_session(old_session_id)
+
+    def _drop_session(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return
+        self._total_chars -= entry.chars
+        if self._current_session_by_user.get(entry.user_id) == session_id:
+            del self._current_session_by_user[entry.user_id]
+
+    def _enforce_limits(self):
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._total_chars > self.max_total_chars):
+            oldest_session_id = next(iter(self._sessions))
+            self._drop_session(oldest_session_id)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "total_chars": self._total_chars,
+            "max_total_chars": self.max_total_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+conversation_cache = ConversationCache(
+    max_messages=MAX_HISTORY_MESSAGES,
+    max_sessions=HISTORY_CACHE_MAX_SESSIONS,
+    max_total_chars=HISTORY_CACHE_MAX_TOTAL_CHARS,
+)
@@ -0,0 +1,225 @@
+"""
+Flood control berbasis token bucket.
+
+Outer middleware ini berjalan sebelum RequestContextMiddleware dan I18n, sehingga update yang ditolak tidak memicu
+query Supabase maupun panggilan Mistral. Bucket disimpan di memori per pengguna dan per chat grup, dengan batas
+jumlah entri dan eviksi bucket yang lama tidak aktif.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.enums import ChatType
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from bot_setup import i18n
+from config import (
+    SUPPORTED_LANGUAGES,
+    DEFAULT_LANGUAGE,
+    FLOOD_PRIVATE_RATE_PER_MINUTE,
+    FLOOD_PRIVATE_BURST,
+    FLOOD_GROUP_USER_RATE_PER_MINUTE,
+    FLOOD_GROUP_USER_BURST,
+    FLOOD_GROUP_CHAT_RATE_PER_MINUTE,
+    FLOOD_GROUP_CHAT_BURST,
+    FLOOD_BUCKET_MAX_ENTRIES,
+    FLOOD_BUCKET_IDLE_SECONDS,
+    FLOOD_NOTICE_INTERVAL_SECONDS
+)
+
+# (kapasitas, token per detik)
+BucketRate = Tuple[float, float]
+
+# Eviksi bucket idle juga dijalankan setiap N akses, bukan hanya saat bucket baru dibuat
+_EVICTION_CHECK_EVERY = 64
+
+
+def _rate(per_minute: float, burst: float) -> BucketRate:
+    return (max(1.0, burst), per_minute / 60.0)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "last_notice_at")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+        self.last_notice_at = 0.0
+
+
+class TokenBucketStore:
+    """
+    Kumpulan token bucket dengan urutan LRU berdasarkan akses terakhir.
+    Bucket yang tidak disentuh lebih dari idle_seconds (atau melebihi max_entries) dibuang saat bucket baru dibuat
+    dan setiap _EVICTION_CHECK_EVERY akses, jadi memori tetap turun walau tidak ada pengguna baru. Bucket yang dibuang
+    setara dengan bucket penuh, jadi eviksi tidak pernah membuat pengguna lebih ketat dibatasi.
+    """
+
+    def __init__(self, max_entries: int, idle_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[Tuple[str, int], _Bucket]" = OrderedDict()
+        self._gets_since_eviction = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Tuple[str, int], rate: BucketRate, now: float) -> _Bucket:
+        capacity, refill_per_second = rate
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(capacity, now)
+            self._evict(now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_per_second)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+            self._gets_since_eviction += 1
+            if self._gets_since_eviction >= _EVICTION_CHECK_EVERY:
+                self._evict(now)
+        return bucket
+
+    def _evict(self, now: float):
+        # Urutan LRU: berhenti di bucket pertama yang masih aktif, jadi biayanya sebanding dengan jumlah yang dibuang
+        self._gets_since_eviction = 0
+        while self._buckets:
+            oldest_key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_entries and now - oldest.updated_at <= self.idle_seconds:
+                break
+            del self._buckets[oldest_key]
+            self.evictions += 1
+
+
+class FloodController:
+    """Memutuskan apakah update boleh diproses. Di grup, bucket pengguna dan bucket chat harus sama-sama punya token."""
+
+    def __init__(self):
+        self.private_rate = _rate(FLOOD_PRIVATE_RATE_PER_MINUTE, FLOOD_PRIVATE_BURST)
+        self.group_user_rate = _rate(FLOOD_GROUP_USER_RATE_PER_MINUTE, FLOOD_GROUP_USER_BURST)
+        self.group_chat_rate = _rate(FLOOD_GROUP_CHAT_RATE_PER_MINUTE, FLOOD_GROUP_CHAT_BURST)
+        self.store = TokenBucketStore(FLOOD_BUCKET_MAX_ENTRIES, FLOOD_BUCKET_IDLE_SECONDS)
+        self.allowed = 0
+        self.rejected_user = 0
+        self.rejected_chat = 0
+        self.notices_sent = 0
+
+    def check(self, user_id: int, chat_id: int, chat_type: str) -> Tuple[bool, Optional[_Bucket]]:
+        """Mengembalikan (diizinkan, bucket_yang_habis). Token hanya dikurangi jika semua bucket mengizinkan."""
+        now = time.monotonic()
+        if chat_type == ChatType.PRIVATE:
+            buckets: List[Tuple[_Bucket, str]] = [(self.store.get(("user", user_id), self.private_rate, now), "user")]
+        else:
+            buckets = [
+                (self.store.get(("group_user", user_id), self.group_user_rate, now), "user"),
+                (self.store.get(("chat", chat_id), self.group_chat_rate, now), "chat"),
+            ]
+        for bucket, scope in buckets:
+            if bucket.tokens < 1.0:
+                if scope == "chat":
+                    self.rejected_chat += 1
+                else:
+                    self.rejected_user += 1
+                return False, bucket
+        for bucket, _ in buckets:
+            bucket.tokens -= 1.0
+        self.allowed += 1
+        return True, None
+
+    def should_notify(self, bucket: _Bucket) -> bool:
+        now = time.monotonic()
+        if now - bucket.last_notice_at < FLOOD_NOTICE_INTERVAL_SECONDS:
+            return False
+        bucket.last_notice_at = now
+        self.notices_sent += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.allowed + self.rejected_user + self.rejected_chat
+        return {
+            "allowed": self.allowed,
+            "rejected_user": self.rejected_user,
+            "rejected_chat": self.rejected_chat,
+            "shed_ratio": round((self.rejected_user + self.rejected_chat) / total, 4) if total else 0.0,
+            "notices_sent": self.notices_sent,
+            "buckets": len(self.store),
+            "bucket_evictions": self.store.evictions,
+        }
+
+
+flood_controller = FloodController()
+
+
+def _is_actionable_message(message: Message, data: Dict[str, Any]) -> bool:
+    """Pesan yang akan memicu kerja bot. Obrolan biasa di grup tidak dihitung agar tidak menghabiskan token chat."""
+    if message.chat.type == ChatType.PRIVATE:
+        return True
+    text = message.text or ""
+    if text.startswith("/"):
+        return True
+    bot_username = data.get("bot_username")
+    if bot_username and text.lower().startswith(f"@{bot_username.lower()}"):
+        return True
+    reply_author = message.reply_to_message.from_user if message.reply_to_message else None
+    return bool(reply_author and bot_username and reply_author.username == bot_username)
+
+
+def _notice_text(language_code: Optional[str]) -> str:
+    # Locale pengguna dari DB belum dimuat di titik ini; pakai bahasa klien Telegram agar tetap tanpa query
+    locale = (language_code or "").split("-")[0]
+    return i18n.gettext("flood_control_notice", locale_override=locale if locale in SUPPORTED_LANGUAGES else DEFAULT_LANGUAGE)
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """Outer middleware yang menolak update berlebih sebelum konteks pengguna dimuat."""
+
+    def __init__(self, controller: FloodController = flood_controller):
+        self.controller = controller
+        self._notice_tasks: Set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        if event.message and event.message.from_user and _is_actionable_message(event.message, data):
+            target: Any = event.message
+            chat = event.message.chat
+        elif event.callback_query and event.callback_query.message:
+            target = event.callback_query
+            chat = event.callback_query.message.chat
+        else:
+            return await handler(event, data)
+
+        user = target.from_user
+        allowed, exhausted_bucket = self.controller.check(user.id, chat.id, chat.type)
+        if allowed:
+            return await handler(event, data)
+
+        logging.info(f"Flood control: update {event.update_id} dari user {user.id} di chat {chat.id} ditolak.")
+        if self.controller.should_notify(exhausted_bucket):
+            task = asyncio.create_task(self._send_notice(target, _notice_text(user.language_code)))
+            self._notice_tasks.add(task)
+            task.add_done_callback(self._notice_tasks.discard)
+        elif isinstance(target, CallbackQuery):
+            # Tetap jawab callback agar tombol tidak berputar, tanpa teks
+            task = asyncio.create_task(self._send_notice(target, None))
+            self._notice_tasks.add(task)
+            task.add_done_callback(self._notice_tasks.discard)
+        return None
+
+    @staticmethod
+    async def _send_notice(target: Any, text: Optional[str]):
+        try:
+            if isinstance(target, CallbackQuery):
+                await target.answer(text)
+            else:
+                await target.reply(text)
+        except Exception as e:
+            logging.debug(f"Gagal mengirim pemberitahuan flood control: {e}")
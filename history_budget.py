@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from mistralai import Mistral
+
+from config import (
+    MISTRAL_SYSTEM_PROMPT,
+    MAX_HISTORY_MESSAGES,
+    HISTORY_TOKEN_BUDGET_DEFAULT,
+    MODEL_HISTORY_TOKEN_BUDGETS,
+    HISTORY_SUMMARY_ENABLED,
+    HISTORY_SUMMARY_MODEL,
+    HISTORY_SUMMARY_MAX_TOKENS
+)
+from mistral_integration import complete_chat
+from mistral_scheduler import mistral_scheduler, PRIORITY_BACKGROUND
+from storage_service import is_storage_enabled, get_session_summary, save_session_summary, get_messages_between
+
+# Overhead token per pesan (role + pemisah) dalam format chat
+_MESSAGE_OVERHEAD_TOKENS = 4
+# Potongan maksimum per pesan yang dikirim ke model peringkas
+_SUMMARY_INPUT_CHARS_PER_MESSAGE = 4000
+# Pesan lama (di luar jendela riwayat) yang diambil dari storage per putaran ringkasan
+_SUMMARY_FETCH_LIMIT = 100
+
+_SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the previous summary with the new messages into one concise summary that keeps facts, "
+    "decisions, names, code identifiers and open questions the assistant may need later. "
+    "Write in the language of the conversation. Reply with the summary only."
+)
+
+_summaries_in_flight: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimasi token lokal yang cepat (~3 karakter per token, sengaja konservatif untuk teks berisi kode)."""
+    return (len(text) + 2) // 3 + _MESSAGE_OVERHEAD_TOKENS
+
+
+def get_history_token_budget(model_id: str) -> int:
+    return MODEL_HISTORY_TOKEN_BUDGETS.get(model_id, HISTORY_TOKEN_BUDGET_DEFAULT)
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    # Dibandingkan sebagai datetime: Postgres memangkas nol di pecahan detik, isoformat() Python tidak
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def select_history_within_budget(messages: List[Dict[str, str]], budget_tokens: int) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Memilih pesan terbaru yang muat dalam anggaran token (urutan lama -> baru).
+    Pesan terakhir (prompt saat ini) selalu disertakan. Mengembalikan (pesan_dipakai, pesan_terbuang).
+    """
+    used_tokens = 0
+    first_kept = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        used_tokens += estimate_tokens(messages[index]["content"])
+        if used_tokens > budget_tokens and index < len(messages) - 1:
+            break
+        first_kept = index
+    # Jendela dimulai dari pesan user agar giliran percakapan tidak terpotong di tengah
+    while first_kept < len(messages) - 1 and messages[first_kept]["role"] != "user":
+        first_kept += 1
+    return messages[first_kept:], messages[:first_kept]
+
+
+def _unsummarized(dropped: List[Dict[str, str]], summarized_through: Optional[datetime]) -> List[Dict[str, str]]:
+    """Pesan terbuang (di dalam jendela) yang lebih baru dari posisi ringkasan."""
+    return [
+        message for message in dropped
+        if _parse_timestamp(message.get("created_at")) and (summarized_through is None or _parse_timestamp(message["created_at"]) > summarized_through)
+    ]
+
+
+async def _refresh_summary(
+    client: Mistral,
+    user_id: int,
+    session_id: str,
+    previous_summary: Optional[str],
+    summarized_through: Optional[str],
+    window_start: Optional[str],
+    in_window: List[Dict[str, str]],
+):
+    try:
+        new_messages = in_window
+        if window_start:
+            # Pesan yang sudah bergeser keluar jendela riwayat tetapi belum diringkas ada di storage
+            older = await get_messages_between(user_id, session_id, summarized_through, window_start, _SUMMARY_FETCH_LIMIT)
+            # Jika rentang lama belum habis, pesan di jendela menunggu putaran berikutnya agar urutan tetap utuh
+            new_messages = older if len(older) >= _SUMMARY_FETCH_LIMIT else older + in_window
+        if not new_messages:
+            return
+        transcript = "\n\n".join(f"{item['role']}: {item['content'][:_SUMMARY_INPUT_CHARS_PER_MESSAGE]}" for item in new_messages)
+        summary_request = [
+            {"role": "system", "content": _SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"Previous summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+        # Ringkasan ikut antrian model dengan prioritas terendah agar tidak merebut slot balasan pengguna
+        async with mistral_scheduler.slot(HISTORY_SUMMARY_MODEL, user_id, PRIORITY_BACKGROUND):
+            summary = await complete_chat(client, HISTORY_SUMMARY_MODEL, summary_request, max_tokens=HISTORY_SUMMARY_MAX_TOKENS)
+        if not summary:
+            logging.warning(f"Model ringkasan tidak mengembalikan teks untuk sesi {session_id}.")
+            return
+        summary = summary.strip()
+        await save_session_summary(user_id, session_id, summary, new_messages[-1]["created_at"])
+        logging.info(f"Ringkasan sesi {session_id} diperbarui dengan {len(new_messages)} pesan ({estimate_tokens(summary)} token).")
+    except Exception as e:
+        logging.error(f"Gagal membuat ringkasan sesi {session_id} untuk user {user_id}: {e}", exc_info=True)
+    finally:
+        _summaries_in_flight.discard(session_id)
+
+
+def _schedule_summary_refresh(
+    client: Mistral,
+    user_id: int,
+    session_id: str,
+    previous_summary: Optional[str],
+    summarized_through: Optional[str],
+    window_start: Optional[str],
+    in_window: List[Dict[str, str]],
+):
+    if session_id in _summaries_in_flight:
+        return
+    _summaries_in_flight.add(session_id)
+    task = asyncio.create_task(
+        _refresh_summary(client, user_id, session_id, previous_summary, summarized_through, window_start, in_window)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def build_prompt_messages(
+    client: Mistral,
+    model_id: str,
+    user_id: int,
+    session_id: Optional[str],
+    conversation: List[Dict[str, str]],
+) -> List[Dict[str, str]]:
+    """
+    Menyusun api_messages: system prompt, ringkasan bergulir (jika ada) dan riwayat terbaru dalam anggaran token model.
+    Pesan yang belum diringkas dan tidak ikut dikirim (keluar dari anggaran, atau sudah bergeser keluar jendela
+    MAX_HISTORY_MESSAGES) dilipat ke ringkasan secara async (tidak menunda balasan). Posisi ringkasan dilacak
+    lewat created_at pesan terakhir yang sudah diringkas.
+    """
+    api_messages: List[Dict[str, str]] = []
+    budget = get_history_token_budget(model_id)
+    if MISTRAL_SYSTEM_PROMPT:
+        api_messages.append({"role": "system", "content": MISTRAL_SYSTEM_PROMPT})
+        budget -= estimate_tokens(MISTRAL_SYSTEM_PROMPT)
+
+    summary_record: Dict[str, Optional[str]] = {"summary": None, "summarized_through": None}
+    if HISTORY_SUMMARY_ENABLED and session_id and is_storage_enabled():
+        summary_record = await get_session_summary(user_id, session_id)
+    if summary_record["summary"]:
+        summary_message = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary_record['summary']}"}
+        api_messages.append(summary_message)
+        budget -= estimate_tokens(summary_message["content"])
+
+    kept, dropped = select_history_within_budget(conversation, budget)
+    api_messages.extend({"role": message["role"], "content": message["content"]} for message in kept)
+
+    if HISTORY_SUMMARY_ENABLED and session_id and is_storage_enabled():
+        stored = [message for message in conversation if _parse_timestamp(message.get("created_at"))]
+        summarized_through = summary_record["summarized_through"]
+        through = _parse_timestamp(summarized_through)
+        window_start: Optional[str] = None
+        if summarized_through and through is None:
+            # Nilai lama (sidik jari hash): anggap semua pesan sebelum jendela sudah diringkas
+            pending = list(dropped)
+        else:
+            pending = _unsummarized(dropped, through)
+            # Jendela penuh berarti ada pesan yang lebih lama di storage; yang belum diringkas diambil di latar belakang
+            if stored and len(conversation) >= MAX_HISTORY_MESSAGES and (through is None or through < _parse_timestamp(stored[0]["created_at"])):
+                window_start = stored[0]["created_at"]
+        pending = [message for message in pending if message.get("created_at")]
+        if pending or window_start:
+            _schedule_summary_refresh(client, user_id, session_id, summary_record["summary"], summarized_through if through else None, window_start, pending)
+    return api_messages
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from metrics import RETENTION_PURGED_ROWS, CHAT_MESSAGES_TABLE_ROWS, CHAT_MESSAGES_TABLE_BYTES
+from storage_backend import StorageBackend, StorageError
+
+_EXCESS_SESSION_LOOKUP_LIMIT = 100
+_FIRST_SWEEP_DELAY_SECONDS = 60.0
+
+
+class RetentionJob:
+    """
+    Job latar belakang untuk penghapusan riwayat chat.
+    Sesi yang ditinggalkan lewat /newchat dihapus session_purge_delay detik kemudian, jadi /newchat tidak menunggu
+    DELETE dan baris yang masih di antrian write-behind (atau balasan yang masih streaming) ikut terhapus.
+    Antrian itu hanya ada di memori, jadi sweep berkala selalu membersihkan sesi non-aktif yang tertinggal (crash atau
+    restart sebelum jeda habis; /newchat selalu membuang sesi lama, jadi sesi selain sesi aktif tidak pernah dipakai lagi).
+    Sweep juga menghapus pesan yang lebih tua dari max_age_days dan sesi di luar max_sessions_per_user sesi terbaru,
+    lalu mencatat ukuran tabel chat_messages untuk melihat tren pertumbuhan. Semua penghapusan berjalan per batch
+    dengan jeda antar-batch; penghapusan sesi yang tertunda diselesaikan saat stop().
+    """
+
+    def __init__(
+        self,
+        max_age_days: float,
+        max_sessions_per_user: int,
+        sweep_interval: float,
+        batch_size: int,
+        batch_pause: float,
+        session_purge_delay: float,
+        size_history: int = 48,
+    ):
+        self.max_age_days = max_age_days
+        self.max_sessions_per_user = max_sessions_per_user
+        self.sweep_interval = max(1.0, sweep_interval)
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = max(0.0, batch_pause)
+        self.session_purge_delay = max(0.0, session_purge_delay)
+        self._backend: Optional[StorageBackend] = None
+        self._pending: Deque[Tuple[float, int, str]] = deque() # (jatuh tempo monotonic, user_id, session_id)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._run_sweeps = False
+        self._next_sweep = 0.0
+
+        self.rows_purged: Dict[str, int] = {"new_session": 0, "abandoned_session": 0, "max_age": 0, "max_sessions": 0}
+        self.sessions_purged = 0
+        self.failures = 0
+        self.sweeps = 0
+        self.last_sweep_seconds = 0.0
+        self._size_samples: Deque[Tuple[float, int, int]] = deque(maxlen=max(2, size_history)) # (waktu, baris, byte)
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    def start(self, backend: StorageBackend, run_sweeps: bool = True):
+        if self._task is not None:
+            return
+        self._backend = backend
+        self._stopping = False
+        self._run_sweeps = run_sweeps
+        self._next_sweep = time.monotonic() + min(_FIRST_SWEEP_DELAY_SECONDS, self.sweep_interval)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="history-retention")
+        policy = f"umur maks {self.max_age_days or '-'} hari, sesi maks {self.max_sessions_per_user or '-'} per pengguna"
+        logging.info(
+            f"Job retensi riwayat dimulai (batch {self.batch_size}, jeda {self.batch_pause}s, "
+            + (f"sweep tiap {self.sweep_interval:.0f}s, {policy})." if run_sweeps else "tanpa sweep di proses ini).")
+        )
+
+    def schedule_session_purge(self, user_id: int, session_id: str) -> bool:
+        """Menjadwalkan penghapusan pesan satu sesi. Mengembalikan False jika job tidak berjalan."""
+        if not self.is_running:
+            return False
+        self._pending.append((time.monotonic() + self.session_purge_delay, user_id, session_id))
+        self._wake.set()
+        return True
+
+    async def stop(self):
+        """Menghentikan sweep yang sedang berjalan dan menyelesaikan semua penghapusan sesi yang tertunda."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        logging.info(f"Job retensi riwayat dihentikan. Statistik: {self.stats()}")
+
+    def _seconds_until_next_work(self) -> Optional[float]:
+        deadlines = [self._pending[0][0]] if self._pending else []
+        if self._run_sweeps:
+            deadlines.append(self._next_sweep)
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._seconds_until_next_work())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                break
+            await self._purge_pending_sessions()
+            if self._run_sweeps and time.monotonic() >= self._next_sweep:
+                try:
+                    await self.sweep()
+                except StorageError:
+                    self.failures += 1
+                except Exception as e:
+                    self.failures += 1
+                    logging.error(f"Exception tak terduga saat sweep retensi riwayat: {e}", exc_info=True)
+                self._next_sweep = time.monotonic() + self.sweep_interval
+        # Saat berhenti, riwayat write-behind sudah di-flush, jadi sesi yang tertunda aman dihapus tanpa menunggu jeda
+        await self._purge_pending_sessions(force=True)
+
+    async def _purge_pending_sessions(self, force: bool = False):
+        while self._pending and (force or self._pending[0][0] <= time.monotonic()):
+            _, user_id, session_id = self._pending.popleft()
+            try:
+                deleted = await self._purge_session(user_id, session_id, "new_session")
+                logging.debug(f"Retensi: {deleted} pesan dari sesi lama {session_id} user {user_id} dihapus.")
+            except StorageError:
+                self.failures += 1
+            except Exception as e:
+                self.failures += 1
+                logging.error(f"Exception saat menghapus pesan sesi lama {session_id} user {user_id}: {e}", exc_info=True)
+
+    async def _pause(self):
+        if self.batch_pause > 0:
+            await asyncio.sleep(self.batch_pause)
+
+    async def _purge_session(self, user_id: int, session_id: str, reason: str) -> int:
+        total = 0
+        while True:
+            deleted = await self._backend.purge_session_messages(user_id, session_id, self.batch_size)
+            self._record_purged(reason, deleted)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            await self._pause()
+        await self._backend.delete_session_summary(session_id)
+        self.sessions_purged += 1
+        return total
+
+    async def _purge_expired(self) -> int:
+        older_than = (datetime.now(timezone.utc) - timedelta(days=self.max_age_days)).isoformat()
+        total = 0
+        while not self._stopping:
+            deleted = await self._backend.purge_expired_messages(older_than, self.batch_size)
+            if deleted is None:
+                break # Tidak didukung backend
+            self._record_purged("max_age", deleted)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            await self._pause()
+        return total
+
+    async def _purge_excess_sessions(self, max_sessions: int, reason: str) -> int:
+        total = 0
+        while not self._stopping:
+            sessions = await self._backend.find_excess_sessions(max_sessions, _EXCESS_SESSION_LOOKUP_LIMIT)
+            if not sessions:
+                break
+            # Sesi yang penghapusannya masih menunggu jeda dibiarkan: barisnya mungkin belum selesai ditulis
+            scheduled = {(user_id, session_id) for _, user_id, session_id in self._pending}
+            purged_any = False
+            for user_id, session_id in sessions:
+                if self._stopping:
+                    break
+                if (user_id, session_id) in scheduled:
+                    continue
+                total += await self._purge_session(user_id, session_id, reason)
+                purged_any = True
+                await self._pause()
+            if len(sessions) < _EXCESS_SESSION_LOOKUP_LIMIT or not purged_any:
+                break
+        return total
+
+    def _record_purged(self, reason: str, rows: int):
+        if rows > 0:
+            self.rows_purged[reason] += rows
+            RETENTION_PURGED_ROWS.labels(reason).inc(rows)
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Satu putaran retensi: sesi tertinggal, batas umur, batas jumlah sesi, lalu sampel ukuran tabel."""
+        started = time.perf_counter()
+        purged = {
+            # Cadangan untuk penghapusan /newchat yang hilang bersama antrian di memori
+            "abandoned_session": await self._purge_excess_sessions(1, "abandoned_session"),
+            "max_age": await self._purge_expired() if self.max_age_days > 0 else 0,
+            "max_sessions": await self._purge_excess_sessions(self.max_sessions_per_user, "max_sessions") if self.max_sessions_per_user > 0 else 0,
+        }
+        size = await self._backend.table_stats()
+        self.sweeps += 1
+        self.last_sweep_seconds = time.perf_counter() - started
+        if size is not None:
+            self._size_samples.append((time.time(), size["rows"], size["bytes"]))
+            CHAT_MESSAGES_TABLE_ROWS.set(size["rows"])
+            CHAT_MESSAGES_TABLE_BYTES.set(size["bytes"])
+        trend = self.table_trend()
+        logging.info(
+            f"Sweep retensi selesai dalam {self.last_sweep_seconds:.1f}s: {purged['abandoned_session']} pesan dari sesi "
+            f"tertinggal, {purged['max_age']} pesan kedaluwarsa, dan {purged['max_sessions']} pesan dari sesi berlebih dihapus"
+            + (f"; chat_messages {trend['rows']} baris ({trend['rows_change']:+d} sejak sweep sebelumnya), "
+               f"{trend['bytes'] / 1048576:.1f} MB ({trend['bytes_change'] / 1048576:+.1f} MB)." if trend else ".")
+        )
+        return {"purged": purged, "table": trend}
+
+    def table_trend(self) -> Optional[Dict[str, Any]]:
+        """Ukuran tabel terakhir, perubahan sejak sweep sebelumnya, dan laju pertumbuhan per hari dalam jendela sampel."""
+        if not self._size_samples:
+            return None
+        last_time, rows, size = self._size_samples[-1]
+        _, previous_rows, previous_size = self._size_samples[-2] if len(self._size_samples) > 1 else self._size_samples[-1]
+        first_time, first_rows, first_size = self._size_samples[0]
+        window_days = (last_time - first_time) / 86400
+        return {
+            "rows": rows,
+            "bytes": size,
+            "rows_change": rows - previous_rows,
+            "bytes_change": size - previous_size,
+            "window_hours": round(window_days * 24, 1),
+            "rows_per_day": round((rows - first_rows) / window_days) if window_days > 0 else 0,
+            "bytes_per_day": round((size - first_size) / window_days) if window_days > 0 else 0,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_session_purges": len(self._pending),
+            "sessions_purged": self.sessions_purged,
+            "rows_purged": dict(self.rows_purged),
+            "sweeps": self.sweeps,
+            "failures": self.failures,
+            "last_sweep_seconds": round(self.last_sweep_seconds, 2),
+            "table": self.table_trend(),
+        }
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class WriteBehindQueue:
+    """
+    Antrian write-behind untuk baris riwayat chat.
+    Baris dari semua pengguna dikumpulkan lalu ditulis sebagai bulk insert saat antrian mencapai batch_size
+    atau setiap flush_interval detik. Batch yang gagal dicoba ulang dengan backoff; sisa antrian di-flush saat stop().
+    """
+
+    def __init__(
+        self,
+        flush_func: Callable[[List[Dict[str, Any]]], Awaitable[bool]],
+        batch_size: int,
+        flush_interval: float,
+        max_retries: int,
+        max_queue: int,
+    ):
+        self._flush_func = flush_func
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(0, max_retries)
+        self.max_queue = max_queue
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._in_flight: List[List[Dict[str, Any]]] = [] # Batch yang sedang ditulis (sudah keluar dari _pending)
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_flushed = 0
+        self.batches_failed = 0
+        self.retries = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="history-write-behind")
+        logging.info(f"Write-behind riwayat dimulai (batch {self.batch_size}, interval {self.flush_interval}s).")
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Menambahkan baris ke antrian. Mengembalikan False jika antrian tidak berjalan atau penuh."""
+        if not self.is_running or len(self._pending) >= self.max_queue:
+            return False
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def queued_rows(self, session_id: str) -> List[Dict[str, Any]]:
+        """Baris sesi ini yang belum pasti tertulis (sedang di-flush atau masih antre), urutan lama -> baru."""
+        return [
+            row for rows in (*self._in_flight, self._pending)
+            for row in rows if row.get("session_id") == session_id
+        ]
+
+    async def stop(self):
+        """Menghentikan loop flush dan menulis semua baris yang masih tertunda."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+        logging.info(f"Write-behind riwayat dihentikan. Statistik: {self.stats()}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self._flush_pending()
+            except Exception as e:
+                logging.error(f"Exception tak terduga di loop write-behind riwayat: {e}", exc_info=True)
+            if self._stopping:
+                break
+
+    async def _flush_pending(self):
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._in_flight.append(batch)
+            try:
+                await self._flush_with_retry(batch)
+            finally:
+                self._in_flight.remove(batch)
+
+    async def _flush_with_retry(self, batch: List[Dict[str, Any]]):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                ok = await self._flush_func(batch)
+            except Exception as e:
+                logging.error(f"Exception saat bulk insert {len(batch)} baris riwayat: {e}", exc_info=True)
+                ok = False
+            self._record_flush_latency((time.perf_counter() - started) * 1000)
+            if ok:
+                self.rows_written += len(batch)
+                self.batches_flushed += 1
+                return
+            self.batches_failed += 1
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 10.0))
+        self.rows_dropped += len(batch)
+        logging.error(f"Batch riwayat berisi {len(batch)} baris dibuang setelah {self.max_retries + 1} percobaan.")
+
+    def _record_flush_latency(self, elapsed_ms: float):
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        attempts = self.batches_flushed + self.batches_failed
+        return {
+            "queue_depth": len(self._pending),
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "batches_flushed": self.batches_flushed,
+            "batches_failed": self.batches_failed,
+            "retries": self.retries,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / attempts, 2) if attempts else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
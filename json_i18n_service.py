@@ -1,70 +1,201 @@
+import asyncio
 import json
 import os
 import logging
-from typing import Dict, Optional, Any, Iterator 
+from string import Formatter
+from typing import Callable, Dict, FrozenSet, Optional, Any, Iterator, Set, Tuple
 from contextvars import ContextVar
-from contextlib import contextmanager 
+from contextlib import contextmanager
+
+
+def _template_fields(text: str) -> Optional[FrozenSet[str]]:
+    """Nama placeholder dalam template str.format. None jika template tidak valid (dipakai apa adanya)."""
+    try:
+        return frozenset(field_name for _, field_name, _, _ in Formatter().parse(text) if field_name)
+    except ValueError:
+        return None
+
+
+class _CompiledCatalogs:
+    """
+    Snapshot katalog yang sudah dikompilasi: satu dict datar per locale dengan fallback default locale sudah
+    digabung, plus placeholder template yang sudah diurai. Tidak pernah diubah setelah dibuat, jadi hot reload
+    cukup mengganti referensinya (swap atomik).
+    """
+
+    def __init__(self, locales_data: Dict[str, Dict[str, str]], default_locale: str):
+        self.locales_data = locales_data
+        default_messages = {key: value for key, value in locales_data.get(default_locale, {}).items() if isinstance(value, str)}
+        default_fields = {key: _template_fields(text) for key, text in default_messages.items()}
+        self.messages: Dict[str, Dict[str, str]] = {}
+        # Formatter (str.format terikat) untuk setiap template valid yang memuat kurung kurawal, termasuk escape {{ }}
+        self.formatters: Dict[str, Dict[str, Callable[..., str]]] = {}
+        self.problems: list = []
+
+        for locale, data in locales_data.items():
+            own = {key: value for key, value in data.items() if isinstance(value, str)}
+            messages = {**default_messages, **own}
+            fields: Dict[str, Optional[FrozenSet[str]]] = {}
+            for key, text in messages.items():
+                if "{" not in text and "}" not in text:
+                    continue
+                parsed = _template_fields(text)
+                if parsed is None and key in own:
+                    self.problems.append(f"template tidak valid untuk kunci '{key}' di locale '{locale}'")
+                fields[key] = parsed
+            self.messages[locale] = messages
+            self.formatters[locale] = {key: messages[key].format for key, parsed in fields.items() if parsed is not None}
+
+            if locale == default_locale:
+                continue
+            missing = sorted(set(default_messages) - set(own))
+            if missing:
+                self.problems.append(f"locale '{locale}' tidak memiliki {len(missing)} kunci (memakai '{default_locale}'): {missing}")
+            extra = sorted(set(own) - set(default_messages))
+            if extra:
+                self.problems.append(f"locale '{locale}' memiliki kunci yang tidak ada di '{default_locale}': {extra}")
+            for key in sorted(own.keys() & default_messages.keys()):
+                expected, actual = default_fields[key], fields.get(key, frozenset())
+                if expected is not None and actual is not None and actual != expected:
+                    self.problems.append(f"placeholder kunci '{key}' di locale '{locale}' berbeda dari '{default_locale}'")
+
+        if default_locale not in locales_data:
+            self.problems.append(f"default locale '{default_locale}' tidak ditemukan; tidak ada fallback terjemahan")
+
 
 class JsonI18n:
     def __init__(self, path: str, default_locale: str = "en"):
         self.path = path
         self.default_locale = default_locale
-        self.locales_data: Dict[str, Dict[str, str]] = {}
+        self._catalogs = _CompiledCatalogs({}, default_locale)
+        # Naik setiap kali snapshot katalog ditukar; dipakai cache hasil render untuk invalidasi
+        self.catalog_version = 0
+        self._file_state: Dict[str, Tuple[int, int]] = {}
+        # Masalah saat runtime (locale/kunci/placeholder tidak dikenal) dilaporkan sekali, bukan di setiap panggilan
+        self._reported: Set[Tuple[str, str]] = set()
+        self._watch_task: Optional[asyncio.Task] = None
         self._load_translations()
 
         self.context_locale: ContextVar[str] = ContextVar("json_i18n_context_locale", default=self.default_locale)
         logging.info(f"JsonI18n initialized. Default locale: '{self.default_locale}'. Loaded locales: {list(self.locales_data.keys())}")
 
-    def _load_translations(self):
-        if not os.path.isdir(self.path):
-            logging.error(f"Direktori locales '{self.path}' tidak ditemukan.")
-            return
+    @property
+    def locales_data(self) -> Dict[str, Dict[str, str]]:
+        return self._catalogs.locales_data
 
+    def _scan_files(self) -> Dict[str, Tuple[int, int]]:
+        state = {}
         for filename in os.listdir(self.path):
             if filename.endswith(".json"):
-                locale_code = filename[:-5]
-                file_path = os.path.join(self.path, filename)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        self.locales_data[locale_code] = json.load(f)
-                    logging.info(f"Berhasil memuat terjemahan untuk locale: {locale_code} dari {filename}")
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error saat mendekode JSON untuk locale {locale_code} dari {filename}: {e}")
-                except Exception as e:
-                    logging.error(f"Error saat memuat file {filename}: {e}")
+                stat = os.stat(os.path.join(self.path, filename))
+                state[filename] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def _load_translations(self) -> bool:
+        """Memuat dan mengompilasi semua locales/*.json, lalu menukar snapshot katalog. True jika berhasil ditukar."""
+        if not os.path.isdir(self.path):
+            logging.error(f"Direktori locales '{self.path}' tidak ditemukan.")
+            return False
+
+        file_state = self._scan_files()
+        previous = self._catalogs.locales_data
+        locales_data: Dict[str, Dict[str, str]] = {}
+        for filename in sorted(file_state):
+            locale_code = filename[:-5]
+            file_path = os.path.join(self.path, filename)
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    locales_data[locale_code] = json.load(f)
+                logging.info(f"Berhasil memuat terjemahan untuk locale: {locale_code} dari {filename}")
+            except json.JSONDecodeError as e:
+                logging.error(f"Error saat mendekode JSON untuk locale {locale_code} dari {filename}: {e}")
+                # Saat reload, file yang rusak (mis. sedang disimpan editor) tidak menghapus terjemahan yang sudah ada
+                if locale_code in previous:
+                    locales_data[locale_code] = previous[locale_code]
+            except Exception as e:
+                logging.error(f"Error saat memuat file {filename}: {e}")
+                if locale_code in previous:
+                    locales_data[locale_code] = previous[locale_code]
+
+        catalogs = _CompiledCatalogs(locales_data, self.default_locale)
+        for problem in catalogs.problems:
+            logging.warning(f"Katalog terjemahan: {problem}")
+        self._catalogs = catalogs
+        self.catalog_version += 1
+        self._file_state = file_state
+        self._reported = set()
+        return True
+
+    def reload(self) -> bool:
+        """Memuat ulang katalog jika ada file locales/*.json yang berubah, bertambah, atau terhapus."""
+        try:
+            if self._scan_files() == self._file_state:
+                return False
+        except OSError as e:
+            logging.error(f"Gagal memeriksa direktori locales '{self.path}': {e}")
+            return False
+        reloaded = self._load_translations()
+        if reloaded:
+            logging.info(f"Katalog terjemahan dimuat ulang. Locales: {list(self.locales_data.keys())}")
+        return reloaded
+
+    async def _watch_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logging.error(f"Hot reload terjemahan gagal: {e}")
+
+    def start_watching(self, interval: float):
+        """Memantau locales/*.json (polling mtime) dan memuat ulang saat berubah. Interval <= 0 = nonaktif."""
+        if self._watch_task is None and interval > 0:
+            self._watch_task = asyncio.create_task(self._watch_loop(interval), name="i18n-hot-reload")
+
+    def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    def _report_once(self, kind: str, name: str, text: str):
+        if (kind, name) not in self._reported:
+            self._reported.add((kind, name))
+            logging.warning(text)
 
     @property
     def current_locale(self) -> str:
         return self.context_locale.get()
 
     def gettext(self, key: str, default: Optional[str] = None, locale_override: Optional[str] = None, **kwargs: Any) -> str:
-        loc_to_use = locale_override if locale_override else self.current_locale
-        lang_data = self.locales_data.get(loc_to_use)
-
-        if not lang_data and loc_to_use != self.default_locale:
-            logging.warning(f"Data locale '{loc_to_use}' tidak ditemukan, fallback ke default '{self.default_locale}' untuk kunci '{key}'.")
-            lang_data = self.locales_data.get(self.default_locale)
+        catalogs = self._catalogs
+        loc_to_use = locale_override if locale_override else self.context_locale.get()
+        messages = catalogs.messages.get(loc_to_use)
 
-        if not lang_data:
-            logging.error(f"Tidak ada data terjemahan (termasuk default) yang ditemukan untuk kunci '{key}'. Menggunakan fallback.")
-            return default if default is not None else key
-
-        translated_string = lang_data.get(key)
+        if messages is None:
+            self._report_once("locale", loc_to_use, f"Data locale '{loc_to_use}' tidak ditemukan, fallback ke default '{self.default_locale}'.")
+            loc_to_use = self.default_locale
+            messages = catalogs.messages.get(loc_to_use)
+            if messages is None:
+                return default if default is not None else key
 
+        translated_string = messages.get(key)
         if translated_string is None:
-            if loc_to_use != self.default_locale:
-                default_lang_data = self.locales_data.get(self.default_locale)
-                if default_lang_data:
-                    translated_string = default_lang_data.get(key)
-
-            if translated_string is None:
-                logging.warning(f"Kunci '{key}' tidak ditemukan di locale '{loc_to_use}' atau di default locale. Menggunakan fallback.")
-                return default if default is not None else key
+            self._report_once("key", key, f"Kunci '{key}' tidak ditemukan di locale mana pun. Menggunakan fallback.")
+            return default if default is not None else key
+        if not kwargs:
+            return translated_string
 
+        formatter = catalogs.formatters[loc_to_use].get(key)
+        if formatter is None:
+            # Tanpa kurung kurawal (atau template tidak valid): tidak ada yang perlu diformat
+            return translated_string
         try:
-            return translated_string.format(**kwargs) if kwargs else translated_string
+            return formatter(**kwargs)
         except KeyError as e:
-            logging.warning(f"Placeholder {e} hilang untuk kunci '{key}' di locale '{loc_to_use}' dengan kwargs {kwargs}. Mengembalikan string tanpa format.")
+            self._report_once(
+                "placeholder", f"{loc_to_use}:{key}",
+                f"Placeholder {e} hilang untuk kunci '{key}' di locale '{loc_to_use}'. Mengembalikan string tanpa format."
+            )
             return translated_string
         except Exception as e:
             logging.error(f"Error saat memformat string untuk kunci '{key}': {e}. Mengembalikan string tanpa format.")
@@ -76,7 +207,7 @@ class JsonI18n:
         Context manager untuk menggunakan locale tertentu secara sementara.
         """
         if locale not in self.locales_data and locale != self.default_locale:
-            logging.warning(f"Mencoba menggunakan locale sementara '{locale}' yang tidak ada datanya.")
+            self._report_once("locale", locale, f"Mencoba menggunakan locale sementara '{locale}' yang tidak ada datanya.")
 
         token = self.context_locale.set(locale)
         try:
@@ -84,7 +215,7 @@ class JsonI18n:
         finally:
             self.context_locale.reset(token)
 
-    @contextmanager 
+    @contextmanager
     def context(self) -> Iterator[None]:
         """
         Context manager yang dibutuhkan oleh I18nMiddleware.
@@ -93,4 +224,4 @@ class JsonI18n:
         try:
             yield
         finally:
-            pass 
+            pass
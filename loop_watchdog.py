@@ -0,0 +1,223 @@
+"""
+Watchdog lag event loop: mendeteksi stall dan mencatat lokasi kode yang memblokir loop.
+
+Task heartbeat di event loop tidur sebentar lalu mengukur keterlambatan bangunnya (lag). Thread sampler terpisah
+memeriksa kapan heartbeat terakhir berdetak; jika loop tertinggal melewati ambang, stack thread event loop diambil
+lewat sys._current_frames() dan waktu blokir diatribusikan ke call site, yaitu frame terdalam yang berada di kode
+repo ini (mis. storage_service.py:… atau markdown_utils.py:…), bersama frame daun (mis. ssl/socket) sebagai contoh.
+Saat loop sehat, sampler hanya membandingkan dua timestamp, jadi aman dibiarkan aktif di produksi.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from config import LOOP_WATCHDOG_THRESHOLD_MS, LOOP_WATCHDOG_SAMPLE_INTERVAL_MS, LOOP_WATCHDOG_REPORT_INTERVAL_SECONDS
+from metrics import Histogram, LATENCY_BUCKETS, register_text_endpoint, registry
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+_EXAMPLE_STACK_FRAMES = 12
+
+LOOP_LAG_SECONDS: Histogram = registry.histogram(
+    "event_loop_lag_seconds", "Keterlambatan heartbeat event loop.", buckets=(0.001, 0.0025) + LATENCY_BUCKETS
+)
+
+
+class _CallSiteStats:
+    __slots__ = ("blocked_seconds", "stalls", "samples", "max_stall_seconds", "leaf", "example_stack")
+
+    def __init__(self, leaf: str, example_stack: str):
+        self.blocked_seconds = 0.0
+        self.stalls = 0
+        self.samples = 0
+        self.max_stall_seconds = 0.0
+        self.leaf = leaf
+        self.example_stack = example_stack
+
+
+def _describe(frame: traceback.FrameSummary) -> str:
+    path = os.path.abspath(frame.filename)
+    if path.startswith(_REPO_DIR + os.sep):
+        path = os.path.relpath(path, _REPO_DIR)
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{frame.lineno} {frame.name}"
+
+
+def _is_repo_frame(frame: traceback.FrameSummary) -> bool:
+    path = os.path.abspath(frame.filename)
+    return path.startswith(_REPO_DIR + os.sep) and path != _THIS_FILE and os.sep + "site-packages" + os.sep not in path
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_seconds: float, sample_interval_seconds: float, report_interval_seconds: float):
+        self.threshold = threshold_seconds
+        self.sample_interval = sample_interval_seconds
+        self.report_interval = report_interval_seconds
+        self.heartbeat_interval = min(0.05, threshold_seconds / 2)
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._report_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._sites: Dict[str, _CallSiteStats] = {}
+        self.stalls = 0
+        self.max_lag_seconds = 0.0
+        self._stalls_at_last_report = 0
+
+    def start(self):
+        """Dipanggil dari dalam event loop yang akan dipantau."""
+        if self._heartbeat_task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="loop-watchdog-heartbeat")
+        if self.report_interval > 0:
+            self._report_task = asyncio.create_task(self._report_loop(), name="loop-watchdog-report")
+        self._thread = threading.Thread(target=self._sampler, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"Watchdog event loop aktif (ambang {self.threshold * 1000:.0f}ms, sampling {self.sample_interval * 1000:.0f}ms).")
+
+    def stop(self):
+        self._stop.set()
+        for task in (self._heartbeat_task, self._report_task):
+            if task is not None:
+                task.cancel()
+        self._heartbeat_task = self._report_task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self.stalls:
+            logging.warning(f"Laporan akhir watchdog event loop:\n{self.format_report()}")
+
+    async def _heartbeat(self):
+        interval = self.heartbeat_interval
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - self._last_beat - interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.max_lag_seconds:
+                self.max_lag_seconds = lag
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            if self.stalls != self._stalls_at_last_report:
+                self._stalls_at_last_report = self.stalls
+                logging.warning(f"Laporan watchdog event loop:\n{self.format_report()}")
+
+    def _sampler(self):
+        stall_started_at: Optional[float] = None
+        stall_sites: set = set()
+        last_sample_at = 0.0
+        while not self._stop.wait(self.sample_interval):
+            now = time.monotonic()
+            behind = now - self._last_beat - self.heartbeat_interval
+            if behind < self.threshold:
+                if stall_started_at is not None:
+                    self._finish_stall(now - stall_started_at, stall_sites)
+                    stall_started_at = None
+                    stall_sites = set()
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            if stall_started_at is None:
+                # Sampel pertama dari stall ini: waktu sebelum ambang terlewati ikut dihitung
+                stall_started_at = self._last_beat + self.heartbeat_interval
+                blocked = behind
+            else:
+                blocked = now - last_sample_at
+            last_sample_at = now
+            self._record_sample(stack, blocked, stall_sites)
+
+    def _record_sample(self, stack: List[traceback.FrameSummary], blocked: float, stall_sites: set):
+        site_frame = next((frame for frame in reversed(stack) if _is_repo_frame(frame)), stack[-1] if stack else None)
+        if site_frame is None:
+            return
+        site = _describe(site_frame)
+        with self._lock:
+            stats = self._sites.get(site)
+            if stats is None:
+                example = "".join(traceback.format_list(stack[-_EXAMPLE_STACK_FRAMES:]))
+                stats = self._sites[site] = _CallSiteStats(_describe(stack[-1]), example)
+            stats.blocked_seconds += blocked
+            stats.samples += 1
+            if site not in stall_sites:
+                stall_sites.add(site)
+                stats.stalls += 1
+
+    def _finish_stall(self, duration: float, stall_sites: set):
+        with self._lock:
+            self.stalls += 1
+            for site in stall_sites:
+                stats = self._sites[site]
+                stats.max_stall_seconds = max(stats.max_stall_seconds, duration)
+        logging.warning(f"Event loop terblokir {duration * 1000:.0f}ms di: {', '.join(sorted(stall_sites))}")
+
+    def top_sites(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            ranked = sorted(self._sites.items(), key=lambda item: item[1].blocked_seconds, reverse=True)[:limit]
+            return [
+                {
+                    "site": site,
+                    "blocked_seconds": round(stats.blocked_seconds, 3),
+                    "stalls": stats.stalls,
+                    "max_stall_ms": round(stats.max_stall_seconds * 1000),
+                    "leaf": stats.leaf,
+                    "example_stack": stats.example_stack,
+                }
+                for site, stats in ranked
+            ]
+
+    def format_report(self, limit: int = 10, with_stacks: bool = False) -> str:
+        lines = [f"stall: {self.stalls}, lag maksimum: {self.max_lag_seconds * 1000:.0f}ms, ambang: {self.threshold * 1000:.0f}ms"]
+        for rank, entry in enumerate(self.top_sites(limit), start=1):
+            lines.append(
+                f"{rank:>2}. {entry['blocked_seconds']:.3f}s terblokir, {entry['stalls']} stall, maks {entry['max_stall_ms']}ms"
+                f" - {entry['site']} (daun: {entry['leaf']})"
+            )
+            if with_stacks:
+                lines.append("    " + entry["example_stack"].rstrip().replace("\n", "\n    "))
+        return "\n".join(lines)
+
+    def blocked_samples(self):
+        """Sampel collector metrik: total waktu blokir per call site (20 teratas)."""
+        return [("event_loop_blocked_seconds_total", {"site": entry["site"]}, entry["blocked_seconds"]) for entry in self.top_sites(20)]
+
+
+loop_watchdog = LoopWatchdog(
+    LOOP_WATCHDOG_THRESHOLD_MS / 1000, LOOP_WATCHDOG_SAMPLE_INTERVAL_MS / 1000, LOOP_WATCHDOG_REPORT_INTERVAL_SECONDS
+)
+
+
+def _render_report(request) -> str:
+    try:
+        limit = int(request.query.get("limit", "20"))
+    except ValueError:
+        limit = 20
+    return loop_watchdog.format_report(limit=limit, with_stacks=request.query.get("stacks", "1") != "0") + "\n"
+
+
+def register_loop_watchdog_endpoints():
+    """Laporan di GET /debug/loop-stalls (?limit=N, ?stacks=0) dan metrik waktu blokir per call site."""
+    register_text_endpoint("/debug/loop-stalls", _render_report)
+    registry.collector(
+        "event_loop_blocked_seconds_total", "Waktu event loop terblokir per call site (20 teratas).", "counter", loop_watchdog.blocked_samples
+    )
+    registry.collector(
+        "event_loop_stalls_total", "Stall event loop di atas ambang watchdog.", "counter",
+        lambda: [("event_loop_stalls_total", {}, loop_watchdog.stalls)]
+    )
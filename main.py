@@ -8,9 +8,28 @@ from aiogram.types import TelegramObject
 from aiogram.utils.i18n import I18nMiddleware
 
 from bot_setup import bot, dp, i18n 
-from mistral_integration import get_mistral_client
-from config import SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE 
-from supabase_service import get_user_language_preference, is_supabase_enabled
+from mistral_integration import get_mistral_client, warm_up_mistral_pool, start_mistral_keep_warm, close_mistral_pool, get_mistral_pool_stats
+from config import (
+    SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE, BOT_MODE, WORKER_PROCESSES, FLOOD_CONTROL_ENABLED, RESPONSE_CACHE_CHAT_TYPES,
+    I18N_RELOAD_INTERVAL_SECONDS, OUTBOUND_SCHEDULER_ENABLED, METRICS_HOST, METRICS_PORT, LOOP_WATCHDOG_ENABLED,
+    STORAGE_BACKEND
+)
+from storage_service import (
+    is_storage_enabled, close_storage, start_history_writer, stop_history_writer, get_preference_cache_stats,
+    get_history_writer_stats, start_retention_job, stop_retention_job, get_retention_stats
+)
+from conversation_cache import conversation_cache
+from request_context import RequestContext, RequestContextMiddleware
+from flood_control import FloodControlMiddleware, flood_controller
+from response_cache import response_cache
+from telegram_outbound import outbound_scheduler
+from mistral_scheduler import mistral_scheduler
+from settings_menu import get_settings_render_stats
+from metrics import HandlerMetricsMiddleware, register_cache_stats, registry, start_metrics_server
+from loop_watchdog import loop_watchdog, register_loop_watchdog_endpoints
+from update_recorder import create_update_recorder, close_update_recorder
+from webhook_server import run_webhook
+from worker_pool import run_supervisor
 
 
 class CustomJsonI18nMiddleware(I18nMiddleware):
@@ -19,11 +38,11 @@ class CustomJsonI18nMiddleware(I18nMiddleware):
         preferred_lang = None
 
         if user:
-            user_id = user.id
-            if is_supabase_enabled():
-                db_lang = await get_user_language_preference(user_id)
-                if db_lang and db_lang in SUPPORTED_LANGUAGES:
-                    preferred_lang = db_lang
+            # Preferensi sudah dimuat oleh RequestContextMiddleware, tidak perlu query ulang
+            request_context: Optional[RequestContext] = data.get("request_context")
+            db_lang = request_context.language_code if request_context else None
+            if db_lang and db_lang in SUPPORTED_LANGUAGES:
+                preferred_lang = db_lang
 
             if not preferred_lang and user.language_code:
                 lang_code_short = user.language_code.split('-')[0] 
@@ -33,7 +52,7 @@ class CustomJsonI18nMiddleware(I18nMiddleware):
         return preferred_lang if preferred_lang else DEFAULT_LANGUAGE
 
 
-async def main_polling():
+def configure_logging():
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)-8s - %(name)-15s - %(module)-20s:%(lineno)d - %(message)s",
@@ -41,9 +60,9 @@ async def main_polling():
         force=True
     )
 
-    print("--- Bot script dimulai ---")
-    logging.info("Konfigurasi logging diterapkan. Bot memulai...")
 
+async def setup_dispatcher():
+    """Menyiapkan dispatcher untuk memproses update: username bot, handler, dan middleware. Dipakai juga oleh proses worker."""
     # Ambil informasi bot, termasuk username
     try:
         bot_info = await bot.get_me()
@@ -60,23 +79,119 @@ async def main_polling():
         logging.error(f"Tidak ada data terjemahan yang dimuat dari {i18n.path}. Periksa path dan file JSON.")
     else:
         logging.info(f"Data terjemahan berhasil dimuat untuk locales: {list(i18n.locales_data.keys())}")
+    i18n.start_watching(I18N_RELOAD_INTERVAL_SECONDS)
 
     if not get_mistral_client():
         logging.critical("Klien Mistral AI tidak berhasil diinisialisasi...")
-
-    if not is_supabase_enabled():
-        logging.warning("Supabase tidak dikonfigurasi atau gagal diinisialisasi. Fitur berbasis database tidak akan berfungsi.")
-
+    else:
+        await warm_up_mistral_pool()
+        start_mistral_keep_warm()
+
+    if not is_storage_enabled():
+        logging.warning(f"Storage ({STORAGE_BACKEND}) tidak dikonfigurasi atau gagal diinisialisasi. Fitur berbasis database tidak akan berfungsi.")
+
+    # Urutan registrasi = urutan eksekusi: perekam update melihat semua update (juga yang ditolak flood control),
+    # flood control menolak update berlebih sebelum ada query DB, lalu konteks pengguna harus dimuat sebelum I18n menentukan locale
+    update_recorder = create_update_recorder(dp.workflow_data["bot_username"])
+    if update_recorder is not None:
+        dp.update.outer_middleware.register(update_recorder)
+    if FLOOD_CONTROL_ENABLED:
+        dp.update.outer_middleware.register(FloodControlMiddleware())
+    dp.update.outer_middleware.register(RequestContextMiddleware())
     actual_i18n_middleware = CustomJsonI18nMiddleware(i18n=i18n)
     dp.update.outer_middleware.register(actual_i18n_middleware)
 
-    logging.info("Memulai polling bot Telegram...")
+    # Semua pesan keluar (reply, edit, send_message) melewati penjadwal laju Telegram
+    if OUTBOUND_SCHEDULER_ENABLED:
+        bot.session.middleware(outbound_scheduler)
+
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    register_metrics_collectors()
+
+
+def register_metrics_collectors():
+    """Statistik yang sudah dihitung komponen lain, dibaca saat endpoint metrik di-scrape."""
+    register_cache_stats({
+        "preference": get_preference_cache_stats,
+        "conversation": conversation_cache.stats,
+        "response": response_cache.lookup_stats,
+        "settings_render": get_settings_render_stats,
+    })
+    registry.collector(
+        "mistral_in_flight", "Panggilan Mistral yang sedang berjalan per model.", "gauge",
+        lambda: (("mistral_in_flight", {"model": model_id}, stats["active"]) for model_id, stats in mistral_scheduler.stats().items())
+    )
+    registry.collector(
+        "mistral_queue_length", "Permintaan yang menunggu slot Mistral per model.", "gauge",
+        lambda: (("mistral_queue_length", {"model": model_id}, stats["queued"]) for model_id, stats in mistral_scheduler.stats().items())
+    )
+    registry.collector(
+        "telegram_outbound_in_flight", "Request Telegram keluar yang antri atau sedang dikirim.", "gauge",
+        lambda: (("telegram_outbound_in_flight", {"state": state}, outbound_scheduler.stats()[state]) for state in ("pending", "in_flight"))
+    )
+    registry.collector(
+        "history_write_queue_depth", "Baris riwayat yang menunggu bulk insert.", "gauge",
+        lambda: [("history_write_queue_depth", {}, get_history_writer_stats()["queue_depth"])]
+    )
+    registry.collector(
+        "retention_pending_session_purges", "Sesi lama yang menunggu dihapus job retensi.", "gauge",
+        lambda: [("retention_pending_session_purges", {}, get_retention_stats()["pending_session_purges"])]
+    )
+
+
+async def main_polling():
+    configure_logging()
+
+    print("--- Bot script dimulai ---")
+    logging.info("Konfigurasi logging diterapkan. Bot memulai...")
+
+    if WORKER_PROCESSES > 1:
+        # Mode supervisor: proses ini hanya mengambil update dan membaginya ke proses worker
+        try:
+            await run_supervisor(bot, dp)
+        finally:
+            await bot.session.close()
+            logging.info("Supervisor dihentikan. Sesi bot telah ditutup.")
+        return
+
+    await setup_dispatcher()
+    start_history_writer()
+    start_retention_job()
+    if LOOP_WATCHDOG_ENABLED:
+        register_loop_watchdog_endpoints()
+        loop_watchdog.start()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
     try:
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            logging.info("Memulai bot Telegram dalam mode webhook...")
+            await run_webhook(dp, bot)
+        else:
+            logging.info("Memulai polling bot Telegram...")
+            await dp.start_polling(bot)
     finally:
-        logging.info("Polling bot dihentikan. Menutup sesi bot...")
+        logging.info("Bot dihentikan. Menutup sesi bot...")
+        if OUTBOUND_SCHEDULER_ENABLED:
+            await outbound_scheduler.close()
+            logging.info(f"Statistik penjadwal pesan keluar Telegram: {outbound_scheduler.stats()}")
         await bot.session.close()
         logging.info("Sesi bot telah ditutup.")
+        i18n.stop_watching()
+        await stop_history_writer()
+        await stop_retention_job()
+        await close_storage()
+        if FLOOD_CONTROL_ENABLED:
+            logging.info(f"Statistik flood control: {flood_controller.stats()}")
+        if RESPONSE_CACHE_CHAT_TYPES:
+            logging.info(f"Statistik cache balasan: {await response_cache.stats()}")
+        await response_cache.close()
+        logging.info(f"Statistik pool HTTP Mistral: {get_mistral_pool_stats()}")
+        await close_mistral_pool()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        loop_watchdog.stop()
+        close_update_recorder()
 
 
 if __name__ == '__main__':
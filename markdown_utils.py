@@ -1,51 +1,70 @@
-def ensure_valid_markdown(text: str) -> str:
-    stack = []  
-    result = []  
-    i = 0  
-
-    
-    single_char_symbols = {'*', '`', '~'}
-    
-    multi_char_symbols = {'```'} 
-
-    while i < len(text):
-
-        processed_multichar = False
-        if i + 3 <= len(text): 
-            current_segment = text[i:i+3]
-            if current_segment in multi_char_symbols:
-                tag_to_process = current_segment
-                if stack and stack[-1] == tag_to_process:  # Close an open code block
-                    stack.pop()
-                    result.append(tag_to_process)
-                else:  # Open a new code block
-                    stack.append(tag_to_process)
-                    result.append(tag_to_process)
-                i += 3
-                processed_multichar = True
-
-        if processed_multichar:
-            continue
-
-        
-        if text[i] in single_char_symbols:
-            tag_to_process = text[i]
-            if stack and stack[-1] == tag_to_process:  # Close the tag
-                stack.pop()
-                result.append(tag_to_process)
-            else:  # Open a new tag
-                stack.append(tag_to_process)
-                result.append(tag_to_process)
-            i += 1
+import re
+from typing import List
+
+# Token markdown yang dilacak. Alternasi ``` dicoba lebih dulu, sama seperti pemindaian kiri-ke-kanan versi lama.
+_TOKEN_RE = re.compile(r"```|[*`~]")
+
+
+class MarkdownSanitizer:
+    """
+    Sanitizer markdown inkremental (state machine yang bisa dilanjutkan antar potongan teks).
+
+    Teks masukan tidak pernah diubah; sanitizer hanya melacak tag yang masih terbuka agar bisa ditutup di akhir.
+    feed() mengembalikan bagian masukan yang sudah pasti (prefix aman), tail() memberi penutup untuk snapshot saat
+    ini tanpa mengubah state, dan finish() menutup semuanya. Backtick di ujung potongan yang masih bisa menjadi
+    bagian dari ``` ditahan sampai potongan berikutnya datang.
+    """
+
+    def __init__(self):
+        self._stack: List[str] = []
+        self._pending = ""
+
+    @staticmethod
+    def _toggle(stack: List[str], tag: str):
+        if stack and stack[-1] == tag:
+            stack.pop()
         else:
-            # Append normal characters
-            result.append(text[i])
-            i += 1
+            stack.append(tag)
 
-    
-    while stack:
-        unmatched = stack.pop()
-        
-        result.append(unmatched) 
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        text = self._pending + chunk if self._pending else chunk
+        # Run backtick di akhir ditokenisasi dari kiri sebagai ``` lalu sisa tunggal; sisa (len % 3) ditahan
+        held = (len(text) - len(text.rstrip("`"))) % 3
+        if held:
+            self._pending = text[-held:]
+            text = text[:-held]
+        else:
+            self._pending = ""
+        stack = self._stack
+        for match in _TOKEN_RE.finditer(text):
+            tag = match.group()
+            if stack and stack[-1] == tag:
+                stack.pop()
+            else:
+                stack.append(tag)
+        return text
+
+    def open_tags(self) -> List[str]:
+        """Tag yang masih terbuka untuk snapshot saat ini (urutan buka: terluar lebih dulu)."""
+        stack = list(self._stack)
+        for tag in self._pending:
+            self._toggle(stack, tag)
+        return stack
+
+    def tail(self) -> str:
+        """Teks yang perlu ditambahkan setelah semua keluaran feed() agar snapshot saat ini valid."""
+        return self._pending + "".join(reversed(self.open_tags()))
 
-    return ''.join(result)
+    def finish(self) -> str:
+        """Menutup semua tag yang masih terbuka dan mengembalikan sisa keluaran. State di-reset."""
+        remainder = self.tail()
+        self._stack = []
+        self._pending = ""
+        return remainder
+
+
+def ensure_valid_markdown(text: str) -> str:
+    sanitizer = MarkdownSanitizer()
+    return sanitizer.feed(text) + sanitizer.finish()
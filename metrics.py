@@ -0,0 +1,308 @@
+"""
+Metrik bergaya Prometheus tanpa dependensi tambahan, diekspos di endpoint HTTP lokal (GET /metrics).
+
+Pencatatan dirancang murah untuk jalur panas: child per kombinasi label di-cache (labels() cukup satu lookup dict),
+histogram memakai bucket tetap dengan bisect, dan teks eksposisi baru dirakit saat endpoint di-scrape.
+Statistik yang sudah dihitung komponen lain (hit/miss cache, antrian) dibaca lewat collector saat scrape,
+jadi tidak menambah biaya sama sekali di jalur permintaan. Tidak thread-safe; dipakai dari event loop saja.
+"""
+import bisect
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (nama_metrik, label, nilai) untuk collector
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Metrik {self.name} membutuhkan label {self.labelnames}, diberikan {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_dict(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(self._label_dict(values), child))
+        return lines
+
+    def _render_child(self, labels: Dict[str, str], child) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"]
+
+
+class _ValueChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _render_child(self, labels: Dict[str, str], child: _HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {child.count}")
+        return lines
+
+
+class _Collector:
+    def __init__(self, name: str, documentation: str, kind: str, collect: Callable[[], Iterable[Sample]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logging.warning(f"Collector metrik {self.name} gagal: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in samples)
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrik {metric.name} sudah terdaftar")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name: str, documentation: str, kind: str, collect: Callable[[], Iterable[Sample]]):
+        """Metrik yang nilainya dibaca saat scrape (mis. dari stats() komponen lain). Mengganti collector lama bernama sama."""
+        self._metrics[name] = _Collector(name, documentation, kind, collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+SUPABASE_QUERY_SECONDS = registry.histogram(
+    "supabase_query_duration_seconds", "Latensi query Supabase per operasi (termasuk antri di thread pool).", ("operation",)
+)
+SUPABASE_QUERY_ERRORS = registry.counter("supabase_query_exceptions_total", "Query Supabase yang melempar exception.", ("operation",))
+SQLITE_QUERY_SECONDS = registry.histogram(
+    "sqlite_query_duration_seconds", "Latensi operasi storage SQLite (termasuk antri di thread koneksi).", ("operation",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025) + LATENCY_BUCKETS
+)
+RETENTION_PURGED_ROWS = registry.counter(
+    "chat_messages_purged_rows_total", "Pesan riwayat yang dihapus job retensi per alasan (new_session, abandoned_session, max_age, max_sessions).", ("reason",)
+)
+CHAT_MESSAGES_TABLE_ROWS = registry.gauge("chat_messages_table_rows", "Jumlah baris chat_messages pada sweep retensi terakhir (Postgres: estimasi).")
+CHAT_MESSAGES_TABLE_BYTES = registry.gauge("chat_messages_table_bytes", "Ukuran chat_messages beserta indeksnya pada sweep retensi terakhir.")
+MISTRAL_FIRST_TOKEN_SECONDS = registry.histogram("mistral_first_token_seconds", "Waktu sampai teks pertama dari stream Mistral.", ("model",))
+MISTRAL_TOTAL_SECONDS = registry.histogram("mistral_request_duration_seconds", "Durasi total panggilan Mistral.", ("model", "mode"))
+MISTRAL_REQUESTS = registry.counter("mistral_requests_total", "Panggilan Mistral per hasil (ok, timeout, error).", ("model", "mode", "outcome"))
+MISTRAL_TOKENS = registry.counter("mistral_tokens_total", "Token dari field usage respons Mistral.", ("model", "kind"))
+HANDLER_SECONDS = registry.histogram("handler_duration_seconds", "Latensi handler aiogram.", ("handler",))
+HANDLER_ERRORS = registry.counter("handler_exceptions_total", "Handler aiogram yang melempar exception.", ("handler",))
+HANDLER_IN_FLIGHT = registry.gauge("handler_in_flight", "Handler aiogram yang sedang berjalan.", ("handler",))
+
+
+def record_mistral_usage(model: str, usage: Any):
+    """Menambahkan prompt/completion token dari objek usage Mistral (boleh None)."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens:
+        MISTRAL_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        MISTRAL_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+
+def register_cache_stats(cache_sources: Dict[str, Callable[[], Dict[str, Any]]]):
+    """Mengekspos hit/miss dan hit ratio dari stats() cache yang sudah ada (kunci "hits" dan "misses")."""
+    def samples(field: str) -> Callable[[], Iterable[Sample]]:
+        def collect():
+            for cache_name, stats_func in cache_sources.items():
+                stats = stats_func()
+                hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+                if field == "hit_ratio":
+                    value = hits / (hits + misses) if hits + misses else 0.0
+                else:
+                    value = stats.get(field, 0)
+                yield (f"cache_{field}" + ("" if field == "hit_ratio" else "_total"), {"cache": cache_name}, value)
+        return collect
+
+    registry.collector("cache_hits_total", "Cache hit per cache in-process.", "counter", samples("hits"))
+    registry.collector("cache_misses_total", "Cache miss per cache in-process.", "counter", samples("misses"))
+    registry.collector("cache_hit_ratio", "Rasio hit per cache sejak proses dimulai.", "gauge", samples("hit_ratio"))
+
+
+class HandlerMetricsMiddleware:
+    """Inner middleware aiogram: latensi, exception, dan jumlah in-flight per fungsi handler."""
+
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        in_flight = HANDLER_IN_FLIGHT.labels(name)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            in_flight.dec()
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+_text_endpoints: Dict[str, Callable[[web.Request], str]] = {}
+
+
+def register_text_endpoint(path: str, render: Callable[[web.Request], str]):
+    """Endpoint teks tambahan (mis. laporan debug) di server metrik; didaftarkan sebelum start_metrics_server()."""
+    _text_endpoints[path] = render
+
+
+def _text_response(text: str) -> web.Response:
+    return web.Response(text=text, content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return _text_response(registry.render())
+
+
+async def _serve_text(request: web.Request, render: Callable[[web.Request], str]) -> web.Response:
+    return _text_response(render(request))
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """Menjalankan endpoint GET /metrics. Port 0 = nonaktif. Mengembalikan runner untuk dihentikan saat shutdown."""
+    if port <= 0:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    for path, render in _text_endpoints.items():
+        app.router.add_get(path, lambda request, render=render: _serve_text(request, render))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logging.error(f"Gagal membuka endpoint metrik di {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logging.info(f"Endpoint metrik mendengarkan di http://{host}:{port}/metrics")
+    return runner
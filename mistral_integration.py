@@ -1,21 +1,285 @@
+import asyncio
+import importlib.util
 import logging
-from mistralai import Mistral 
-from config import MISTRAL_API_KEY 
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from mistralai import Mistral
+from config import (
+    MISTRAL_API_KEY,
+    MISTRAL_SERVER_URL,
+    MISTRAL_HTTP2_ENABLED,
+    MISTRAL_POOL_MAX_CONNECTIONS,
+    MISTRAL_POOL_MAX_KEEPALIVE,
+    MISTRAL_KEEPALIVE_EXPIRY_SECONDS,
+    MISTRAL_CONNECT_TIMEOUT_SECONDS,
+    MISTRAL_POOL_TIMEOUT_SECONDS,
+    MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS,
+    MISTRAL_TOTAL_TIMEOUT_SECONDS,
+    MISTRAL_POOL_WARM_CONNECTIONS,
+    MISTRAL_KEEP_WARM_INTERVAL_SECONDS
+)
+from metrics import MISTRAL_FIRST_TOKEN_SECONDS, MISTRAL_TOTAL_SECONDS, MISTRAL_REQUESTS, record_mistral_usage
 
 mistral_client = None
 
 
+class MistralTimeoutError(Exception):
+    """Panggilan Mistral melewati batas waktu fase tertentu ("first_token" atau "total")."""
+
+    def __init__(self, phase: str, seconds: float):
+        super().__init__(f"Timeout Mistral pada fase {phase} ({seconds:.1f}s)")
+        self.phase = phase
+        self.seconds = seconds
+
+
+class _PoolStats:
+    """Penghitung request di pool HTTP Mistral, diisi lewat event hook httpx."""
+
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.warmups = 0
+
+    async def on_request(self, request: httpx.Request):
+        self.requests += 1
+
+    async def on_response(self, response: httpx.Response):
+        self.responses += 1
+
+
+class _PoolDefaultTimeoutMixin:
+    # SDK Mistral meneruskan timeout=None ke build_request bila timeout_ms tidak diatur, yang di httpx berarti
+    # "tanpa timeout". Buang argumen itu agar timeout per fase milik client selalu berlaku.
+    def build_request(self, *args, **kwargs):
+        kwargs.pop("timeout", None)
+        return super().build_request(*args, **kwargs)
+
+
+class _PooledAsyncClient(_PoolDefaultTimeoutMixin, httpx.AsyncClient):
+    pass
+
+
+class _PooledClient(_PoolDefaultTimeoutMixin, httpx.Client):
+    pass
+
+
+_pool_stats = _PoolStats()
+_http_timeout = httpx.Timeout(
+    connect=MISTRAL_CONNECT_TIMEOUT_SECONDS,
+    # Untuk non-streaming, server baru mengirim data setelah selesai; jadi batas baca = batas total
+    read=MISTRAL_TOTAL_TIMEOUT_SECONDS,
+    write=MISTRAL_CONNECT_TIMEOUT_SECONDS,
+    pool=MISTRAL_POOL_TIMEOUT_SECONDS,
+)
+_http_limits = httpx.Limits(
+    max_connections=MISTRAL_POOL_MAX_CONNECTIONS,
+    max_keepalive_connections=MISTRAL_POOL_MAX_KEEPALIVE,
+    keepalive_expiry=MISTRAL_KEEPALIVE_EXPIRY_SECONDS,
+)
+mistral_async_http_client: Optional[httpx.AsyncClient] = None
+mistral_http_client: Optional[httpx.Client] = None
+_keep_warm_task: Optional[asyncio.Task] = None
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 butuh paket h2 (httpx[http2]); tanpa paket itu pool memakai HTTP/1.1 alih-alih gagal total."""
+    if not MISTRAL_HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logging.warning("MISTRAL_HTTP2_ENABLED aktif tetapi paket 'h2' tidak terpasang (pip install 'httpx[http2]'). Memakai HTTP/1.1.")
+        return False
+    return True
+
+
 if MISTRAL_API_KEY:
     try:
-        mistral_client = Mistral(api_key=MISTRAL_API_KEY)
-        
-        logging.info("Klien Mistral (kelas Mistral) berhasil diinisialisasi.")
+        http2 = _http2_enabled()
+        mistral_async_http_client = _PooledAsyncClient(
+            http2=http2, limits=_http_limits, timeout=_http_timeout,
+            event_hooks={"request": [_pool_stats.on_request], "response": [_pool_stats.on_response]},
+        )
+        mistral_http_client = _PooledClient(limits=_http_limits, timeout=_http_timeout)
+        mistral_client = Mistral(
+            api_key=MISTRAL_API_KEY, server_url=MISTRAL_SERVER_URL or None,
+            client=mistral_http_client, async_client=mistral_async_http_client
+        )
+
+        logging.info(f"Klien Mistral (kelas Mistral) berhasil diinisialisasi (HTTP/2: {http2}, pool: {MISTRAL_POOL_MAX_CONNECTIONS}).")
     except Exception as e:
         logging.error(f"Gagal menginisialisasi klien Mistral (kelas Mistral): {e}")
 else:
-    
+
     logging.error("MISTRAL_API_KEY tidak ditemukan. Tidak dapat menginisialisasi klien Mistral.")
 
 def get_mistral_client():
     """Mengembalikan instance klien Mistral yang sudah diinisialisasi."""
     return mistral_client
+
+
+def _server_url() -> str:
+    return (MISTRAL_SERVER_URL or "https://api.mistral.ai").rstrip("/")
+
+
+async def _warm_one_connection() -> bool:
+    try:
+        response = await mistral_async_http_client.get(
+            f"{_server_url()}/v1/models", headers={"Authorization": f"Bearer {MISTRAL_API_KEY}"}
+        )
+        _pool_stats.warmups += 1
+        return response.status_code < 500
+    except Exception as e:
+        logging.warning(f"Pemanasan koneksi Mistral gagal: {e}")
+        return False
+
+
+async def warm_up_mistral_pool():
+    """
+    Membuka koneksi (DNS + TCP + TLS) ke server Mistral sebelum request pertama pengguna.
+    Request dijalankan paralel agar pool HTTP/1.1 benar-benar berisi MISTRAL_POOL_WARM_CONNECTIONS koneksi.
+    """
+    if mistral_async_http_client is None or MISTRAL_POOL_WARM_CONNECTIONS <= 0:
+        return
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_warm_one_connection() for _ in range(MISTRAL_POOL_WARM_CONNECTIONS)))
+    logging.info(
+        f"Pemanasan pool Mistral: {sum(results)}/{len(results)} berhasil dalam {(time.perf_counter() - started) * 1000:.0f}ms. "
+        f"Statistik pool: {get_mistral_pool_stats()}"
+    )
+
+
+async def _keep_warm_loop():
+    while True:
+        await asyncio.sleep(MISTRAL_KEEP_WARM_INTERVAL_SECONDS)
+        await _warm_one_connection()
+
+
+def start_mistral_keep_warm():
+    """Ping berkala agar koneksi tidak idle melewati batas keep-alive server (nonaktif jika interval 0)."""
+    global _keep_warm_task
+    if _keep_warm_task is None and mistral_async_http_client is not None and MISTRAL_KEEP_WARM_INTERVAL_SECONDS > 0:
+        _keep_warm_task = asyncio.create_task(_keep_warm_loop(), name="mistral-keep-warm")
+
+
+async def close_mistral_pool():
+    global _keep_warm_task
+    if _keep_warm_task is not None:
+        _keep_warm_task.cancel()
+        _keep_warm_task = None
+    if mistral_async_http_client is not None:
+        await mistral_async_http_client.aclose()
+    if mistral_http_client is not None:
+        mistral_http_client.close()
+
+
+def get_mistral_pool_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {
+        "requests": _pool_stats.requests,
+        "responses": _pool_stats.responses,
+        "warmups": _pool_stats.warmups,
+    }
+    # Jumlah koneksi dibaca dari pool httpcore di balik transport httpx (bukan API publik httpx, jadi defensif)
+    pool = getattr(getattr(mistral_async_http_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is not None:
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+        stats["active_connections"] = stats["connections"] - stats["idle_connections"]
+        stats["http2_connections"] = sum(1 for connection in connections if "HTTP/2" in connection.info())
+    return stats
+
+
+def _delta_text(content: Any) -> str:
+    """Mengambil teks dari delta stream (string biasa atau daftar chunk konten)."""
+    if not content:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(getattr(chunk, "text", "") or "" for chunk in content)
+
+async def stream_chat_completion(client: Mistral, model: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """
+    Mengalirkan potongan teks balasan Mistral memakai API streaming async.
+    Melempar MistralTimeoutError jika teks pertama tidak datang dalam MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS
+    atau seluruh balasan melewati MISTRAL_TOTAL_TIMEOUT_SECONDS.
+    """
+    started = time.perf_counter()
+    # Stream yang ditutup pemanggil sebelum selesai (mis. hedging membuang yang kalah) tercatat "cancelled"
+    outcome = "cancelled"
+    try:
+        async with aclosing(_stream_chat_completion(client, model, messages, started)) as texts:
+            async for text in texts:
+                yield text
+        outcome = "ok"
+    except MistralTimeoutError:
+        outcome = "timeout"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        MISTRAL_REQUESTS.labels(model, "stream", outcome).inc()
+        MISTRAL_TOTAL_SECONDS.labels(model, "stream").observe(time.perf_counter() - started)
+
+
+async def _stream_chat_completion(client: Mistral, model: str, messages: List[Dict[str, str]], started: float) -> AsyncIterator[str]:
+    deadline = time.monotonic() + MISTRAL_TOTAL_TIMEOUT_SECONDS
+    first_token_deadline = time.monotonic() + MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS
+    received_text = False
+
+    def remaining() -> tuple:
+        if received_text or deadline <= first_token_deadline:
+            return "total", deadline - time.monotonic()
+        return "first_token", first_token_deadline - time.monotonic()
+
+    phase, seconds_left = remaining()
+    try:
+        event_stream = await asyncio.wait_for(client.chat.stream_async(model=model, messages=messages), max(seconds_left, 0))
+    except asyncio.TimeoutError:
+        raise MistralTimeoutError(phase, MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS) from None
+    async with event_stream:
+        events = event_stream.__aiter__()
+        while True:
+            phase, seconds_left = remaining()
+            try:
+                event = await asyncio.wait_for(events.__anext__(), max(seconds_left, 0))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                limit = MISTRAL_FIRST_TOKEN_TIMEOUT_SECONDS if phase == "first_token" else MISTRAL_TOTAL_TIMEOUT_SECONDS
+                raise MistralTimeoutError(phase, limit) from None
+            # Chunk terakhir membawa usage (token prompt/completion)
+            record_mistral_usage(model, getattr(event.data, "usage", None))
+            if not event.data.choices:
+                continue
+            text = _delta_text(event.data.choices[0].delta.content)
+            if text:
+                if not received_text:
+                    MISTRAL_FIRST_TOKEN_SECONDS.labels(model).observe(time.perf_counter() - started)
+                received_text = True
+                yield text
+
+
+async def complete_chat(client: Mistral, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Optional[str]:
+    """Panggilan non-streaming async dengan batas MISTRAL_TOTAL_TIMEOUT_SECONDS. Mengembalikan teks balasan."""
+    started = time.perf_counter()
+    outcome = "cancelled"
+    try:
+        response = await asyncio.wait_for(
+            client.chat.complete_async(model=model, messages=messages, **kwargs), MISTRAL_TOTAL_TIMEOUT_SECONDS
+        )
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise MistralTimeoutError("total", MISTRAL_TOTAL_TIMEOUT_SECONDS) from None
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        MISTRAL_REQUESTS.labels(model, "complete", outcome).inc()
+        MISTRAL_TOTAL_SECONDS.labels(model, "complete").observe(time.perf_counter() - started)
+    record_mistral_usage(model, getattr(response, "usage", None))
+    if not response or not response.choices:
+        return None
+    return _delta_text(response.choices[0].message.content) or None
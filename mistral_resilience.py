@@ -0,0 +1,319 @@
+"""
+Lapisan panggilan Mistral yang tahan gangguan.
+
+- Retry terbatas dengan backoff full-jitter; header Retry-After dari 429/503 dihormati.
+- Circuit breaker per model: setelah CIRCUIT_BREAKER_FAILURE_THRESHOLD kegagalan berturut-turut, model tidak
+  dikirimi trafik selama CIRCUIT_BREAKER_COOLDOWN_SECONDS, lalu satu request percobaan (half-open) menentukan
+  apakah sirkuit ditutup kembali.
+- Hedging: jika model utama belum menghasilkan token pertama dalam MISTRAL_HEDGE_DELAY_SECONDS (atau gagal),
+  request yang sama dikirim ke MISTRAL_FALLBACK_MODEL; yang lebih dulu menjawab dipakai, yang lain dibatalkan.
+  Retry dan hedging hanya berlaku sebelum token pertama, sehingga teks yang sudah tampil tidak pernah terduplikasi.
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from mistralai import Mistral
+from mistralai.models import MistralError
+
+from config import (
+    AVAILABLE_MISTRAL_MODELS,
+    MISTRAL_FALLBACK_MODEL,
+    MISTRAL_HEDGE_DELAY_SECONDS,
+    MISTRAL_MAX_RETRIES,
+    MISTRAL_RETRY_BASE_DELAY_SECONDS,
+    MISTRAL_RETRY_MAX_DELAY_SECONDS,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS
+)
+from mistral_integration import MistralTimeoutError, stream_chat_completion, complete_chat
+from mistral_scheduler import mistral_scheduler
+
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Sirkuit model sedang terbuka; request tidak dikirim."""
+
+    def __init__(self, model_id: str, retry_in: float):
+        super().__init__(f"Sirkuit model {model_id} terbuka, dicoba lagi dalam {retry_in:.0f}s")
+        self.model_id = model_id
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, model_id: str, failure_threshold: int, cooldown_seconds: float):
+        self.model_id = model_id
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.cooldown_seconds - time.monotonic())
+
+    def is_available(self) -> bool:
+        """Seperti allow(), tetapi tanpa memakai jatah request percobaan half-open."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return not self.retry_in()
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and not self.retry_in():
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """Request percobaan berakhir tanpa hasil yang bisa dinilai (dibatalkan atau error klien)."""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info(f"Circuit breaker model {self.model_id} ditutup kembali.")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logging.warning(f"Circuit breaker model {self.model_id} dibuka setelah {self.consecutive_failures} kegagalan berturut-turut.")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_counters = {"retries": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+
+def get_circuit_breaker(model_id: str) -> CircuitBreaker:
+    breaker = _breakers.get(model_id)
+    if breaker is None:
+        breaker = _breakers[model_id] = CircuitBreaker(model_id, CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN_SECONDS)
+    return breaker
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    return {**_counters, "breakers": {model_id: breaker.stats() for model_id, breaker in _breakers.items()}}
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if isinstance(error, (MistralTimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, MistralError) and error.status_code in _RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Nilai header Retry-After (detik atau tanggal HTTP) dari error Mistral, jika ada."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: BaseException) -> Optional[float]:
+    """Jeda sebelum percobaan berikutnya, atau None jika Retry-After melebihi MISTRAL_RETRY_MAX_DELAY_SECONDS."""
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        if retry_after > MISTRAL_RETRY_MAX_DELAY_SECONDS:
+            return None
+        return retry_after + random.uniform(0, MISTRAL_RETRY_BASE_DELAY_SECONDS)
+    return random.uniform(0, min(MISTRAL_RETRY_MAX_DELAY_SECONDS, MISTRAL_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+async def _call_with_retries(model_id: str, attempt_func: Callable[[str], Awaitable[Any]]) -> Any:
+    breaker = get_circuit_breaker(model_id)
+    for attempt in range(MISTRAL_MAX_RETRIES + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(model_id, breaker.retry_in())
+        try:
+            result = await attempt_func(model_id)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if not is_retryable_error(e):
+                breaker.release_probe() # Error klien (4xx) bukan tanda model bermasalah
+                raise
+            breaker.record_failure()
+            delay = backoff_delay(attempt, e) if attempt < MISTRAL_MAX_RETRIES else None
+            if delay is None:
+                raise
+            _counters["retries"] += 1
+            logging.warning(f"Panggilan Mistral model {model_id} gagal ({e}); percobaan ulang {attempt + 1}/{MISTRAL_MAX_RETRIES} dalam {delay:.2f}s.")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def _fallback_model_for(model_id: str) -> Optional[str]:
+    if MISTRAL_FALLBACK_MODEL and MISTRAL_FALLBACK_MODEL != model_id and MISTRAL_FALLBACK_MODEL in AVAILABLE_MISTRAL_MODELS:
+        return MISTRAL_FALLBACK_MODEL
+    return None
+
+
+async def _hedged(
+    model_id: str,
+    user_id: int,
+    attempt_func: Callable[[str], Awaitable[Any]],
+    discard: Callable[[Any], Awaitable[None]],
+    keep_fallback_slot: bool = False,
+) -> Tuple[str, Any, bool]:
+    """
+    Menjalankan attempt_func untuk model utama, dengan hedge/failover ke model cadangan.
+    Mengembalikan (model_yang_menjawab, hasil, slot_cadangan_diserahkan). Hasil yang kalah dibuang lewat discard().
+    Slot antrian model utama dipegang pemanggil; slot model cadangan diambil di sini hanya jika langsung tersedia.
+    Dengan keep_fallback_slot, slot cadangan milik pemenang tidak dilepas di sini (stream masih berjalan di model itu);
+    jika elemen ketiga True, pemanggil wajib memanggil mistral_scheduler.release(model_yang_menjawab, user_id).
+    """
+    fallback_model = _fallback_model_for(model_id)
+    primary = asyncio.create_task(_call_with_retries(model_id, attempt_func))
+    tasks: Dict[asyncio.Task, str] = {primary: model_id}
+    errors: List[BaseException] = []
+    fallback_slot_held = False
+
+    def try_start_fallback(reason: str) -> bool:
+        nonlocal fallback_slot_held
+        if fallback_model is None or fallback_model in tasks.values() or not get_circuit_breaker(fallback_model).is_available():
+            return False
+        if not mistral_scheduler.try_acquire(fallback_model, user_id):
+            return False
+        fallback_slot_held = True
+        _counters["hedges" if reason == "hedge" else "failovers"] += 1
+        logging.info(f"Mistral: {reason} ke model {fallback_model} untuk user {user_id} (model utama {model_id}).")
+        tasks[asyncio.create_task(_call_with_retries(fallback_model, attempt_func))] = fallback_model
+        return True
+
+    winner: Optional[Tuple[str, Any]] = None
+    try:
+        hedge_delay = MISTRAL_HEDGE_DELAY_SECONDS if MISTRAL_HEDGE_DELAY_SECONDS > 0 else None
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if not done:
+            try_start_fallback("hedge")
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    if task is primary and try_start_fallback("failover"):
+                        pending = {t for t in tasks if not t.done()}
+                elif winner is None:
+                    winner = (tasks[task], task.result())
+                else:
+                    await discard(task.result())
+        if winner is None:
+            raise errors[0]
+        handed_over = False
+        if winner[0] != model_id:
+            _counters["hedge_wins"] += 1
+            handed_over = keep_fallback_slot and fallback_slot_held
+        if handed_over:
+            fallback_slot_held = False
+        return winner[0], winner[1], handed_over
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        for task in tasks:
+            if task.done() or task.cancelled():
+                continue
+            try:
+                result = await task
+            except BaseException:
+                continue
+            await discard(result)
+        if fallback_slot_held:
+            mistral_scheduler.release(fallback_model, user_id)
+
+
+async def resilient_stream(client: Mistral, model_id: str, messages: List[Dict[str, str]], user_id: int) -> AsyncIterator[str]:
+    """Seperti stream_chat_completion, dengan retry, circuit breaker dan hedging sebelum token pertama."""
+
+    async def open_stream(attempt_model: str) -> Tuple[AsyncIterator[str], str]:
+        stream = stream_chat_completion(client, attempt_model, messages)
+        try:
+            first_text = await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, ""
+        except BaseException:
+            await stream.aclose()
+            raise
+        return stream, first_text
+
+    async def discard(result: Tuple[AsyncIterator[str], str]):
+        await result[0].aclose()
+
+    answered_by, (stream, first_text), holds_fallback_slot = await _hedged(
+        model_id, user_id, open_stream, discard, keep_fallback_slot=True
+    )
+    if answered_by != model_id:
+        logging.info(f"Balasan untuk user {user_id} dialirkan oleh model cadangan {answered_by}.")
+    try:
+        if first_text:
+            yield first_text
+        async for text in stream:
+            yield text
+    except Exception:
+        get_circuit_breaker(answered_by).record_failure() # Stream putus di tengah jalan
+        raise
+    finally:
+        try:
+            await stream.aclose()
+        finally:
+            if holds_fallback_slot:
+                # Slot model cadangan dipegang selama stream berjalan agar batas konkurensinya tetap berlaku
+                mistral_scheduler.release(answered_by, user_id)
+
+
+async def resilient_complete(client: Mistral, model_id: str, messages: List[Dict[str, str]], user_id: int) -> Optional[str]:
+    """Seperti complete_chat, dengan retry, circuit breaker dan hedging."""
+
+    async def discard(result: Optional[str]):
+        return None
+
+    answered_by, reply, _ = await _hedged(model_id, user_id, lambda attempt_model: complete_chat(client, attempt_model, messages), discard)
+    if answered_by != model_id:
+        logging.info(f"Balasan untuk user {user_id} diberikan oleh model cadangan {answered_by}.")
+    return reply
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from config import (
+    AVAILABLE_MISTRAL_MODELS,
+    MISTRAL_DEFAULT_CONCURRENCY,
+    MISTRAL_MODEL_CONCURRENCY,
+    MISTRAL_QUEUE_MAX_LENGTH,
+    QUEUE_POSITION_UPDATE_INTERVAL_SECONDS
+)
+
+# Kelas prioritas: angka lebih kecil dilayani lebih dulu
+PRIORITY_PRIVATE = 0
+PRIORITY_GROUP = 1
+PRIORITY_BACKGROUND = 2
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+# Referensi kuat ke task callback posisi agar tidak dibersihkan GC sebelum selesai
+_position_tasks: Set[asyncio.Task] = set()
+
+
+class QueueFullError(Exception):
+    """Antrian model sudah penuh; permintaan ditolak (load shedding)."""
+
+
+class _Ticket:
+    __slots__ = ("sort_key", "user_id", "future", "on_position", "last_position", "last_notified_at", "cancelled")
+
+    def __init__(self, sort_key: tuple, user_id: int, future: asyncio.Future, on_position: Optional[PositionCallback]):
+        self.sort_key = sort_key
+        self.user_id = user_id
+        self.future = future
+        self.on_position = on_position
+        self.last_position = 0
+        self.last_notified_at = 0.0
+        self.cancelled = False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return self.sort_key < other.sort_key
+
+
+class ModelAdmissionQueue:
+    """
+    Pembatas konkurensi untuk satu model dengan antrian prioritas.
+    Urutan antrian: (kelas prioritas, giliran pengguna, nomor urut). Giliran pengguna = jumlah permintaan pengguna itu
+    yang sedang antre/berjalan, sehingga pengguna yang mengirim banyak pesan tidak menyalip pengguna lain (fair).
+    """
+
+    def __init__(self, model_id: str, concurrency: int, max_queue: int):
+        self.model_id = model_id
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiting: List[_Ticket] = []
+        self._waiting_count = 0
+        self._user_load: Dict[int, int] = {}
+        self._sequence = itertools.count()
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def queue_length(self) -> int:
+        return self._waiting_count
+
+    async def acquire(self, user_id: int, priority: int, on_position: Optional[PositionCallback] = None):
+        if self.active < self.concurrency and not self._waiting_count:
+            self._admit(user_id)
+            return
+        if self._waiting_count >= self.max_queue:
+            self.shed += 1
+            raise QueueFullError(f"Antrian model {self.model_id} penuh ({self.max_queue}).")
+
+        user_round = self._user_load.get(user_id, 0)
+        ticket = _Ticket((priority, user_round, next(self._sequence)), user_id, asyncio.get_running_loop().create_future(), on_position)
+        heapq.heappush(self._waiting, ticket)
+        self._waiting_count += 1
+        self._user_load[user_id] = user_round + 1
+        enqueued_at = time.monotonic()
+        self._notify_new_ticket(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(user_id) # Slot sudah diberikan tepat sebelum dibatalkan
+            else:
+                ticket.cancelled = True
+                self._waiting_count -= 1
+                self._decrement_user_load(user_id)
+            raise
+        self.total_wait_seconds += time.monotonic() - enqueued_at
+
+    def try_acquire(self, user_id: int) -> bool:
+        """Mengambil slot hanya jika tersedia sekarang dan tidak ada yang antre (dipakai untuk request hedging)."""
+        if self.active < self.concurrency and not self._waiting_count:
+            self._admit(user_id)
+            return True
+        return False
+
+    def _admit(self, user_id: int):
+        self.active += 1
+        self.admitted += 1
+        self._user_load[user_id] = self._user_load.get(user_id, 0) + 1
+
+    def release(self, user_id: int):
+        self.active -= 1
+        self._decrement_user_load(user_id)
+        while self._waiting and self.active < self.concurrency:
+            ticket = heapq.heappop(self._waiting)
+            if ticket.cancelled:
+                continue
+            self._waiting_count -= 1
+            self.active += 1
+            self.admitted += 1
+            ticket.future.set_result(None)
+        self._notify_positions()
+
+    def _decrement_user_load(self, user_id: int):
+        remaining = self._user_load.get(user_id, 1) - 1
+        if remaining > 0:
+            self._user_load[user_id] = remaining
+        else:
+            self._user_load.pop(user_id, None)
+
+    def _notify_new_ticket(self, ticket: _Ticket):
+        """
+        Memberi tahu posisi awal tiket yang baru masuk antrian. Tiket lain yang tergeser tidak diberi tahu di sini;
+        posisinya diperbarui oleh _notify_positions (dengan batas interval) saat antrian bergerak, sehingga lonjakan
+        pesan masuk tidak memicu O(N²) edit pesan.
+        """
+        if not ticket.on_position:
+            return
+        position = 1 + sum(1 for other in self._waiting if not other.cancelled and other.sort_key < ticket.sort_key)
+        self._send_position(ticket, position, time.monotonic())
+
+    def _notify_positions(self):
+        """Memberi tahu posisi antrian yang berubah (dibatasi QUEUE_POSITION_UPDATE_INTERVAL_SECONDS per tiket)."""
+        now = time.monotonic()
+        position = 0
+        for ticket in sorted(self._waiting):
+            if ticket.cancelled:
+                continue
+            position += 1
+            if not ticket.on_position or ticket.last_position == position:
+                continue
+            if now - ticket.last_notified_at < QUEUE_POSITION_UPDATE_INTERVAL_SECONDS:
+                continue
+            self._send_position(ticket, position, now)
+
+    @staticmethod
+    def _send_position(ticket: _Ticket, position: int, now: float):
+        ticket.last_position = position
+        ticket.last_notified_at = now
+        task = asyncio.create_task(_safe_position_callback(ticket.on_position, position))
+        _position_tasks.add(task)
+        task.add_done_callback(_position_tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queued": self._waiting_count,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_wait_ms": round(self.total_wait_seconds / self.admitted * 1000, 2) if self.admitted else 0.0,
+        }
+
+
+async def _safe_position_callback(callback: PositionCallback, position: int):
+    try:
+        await callback(position)
+    except Exception as e:
+        logging.debug(f"Gagal memperbarui posisi antrian: {e}")
+
+
+class MistralScheduler:
+    """Penjadwal admisi untuk panggilan Mistral: satu ModelAdmissionQueue per model."""
+
+    def __init__(self):
+        self._queues: Dict[str, ModelAdmissionQueue] = {}
+
+    def _queue_for(self, model_id: str) -> ModelAdmissionQueue:
+        model_queue = self._queues.get(model_id)
+        if model_queue is None:
+            concurrency = MISTRAL_MODEL_CONCURRENCY.get(model_id, MISTRAL_DEFAULT_CONCURRENCY)
+            model_queue = self._queues[model_id] = ModelAdmissionQueue(model_id, concurrency, MISTRAL_QUEUE_MAX_LENGTH)
+        return model_queue
+
+    @asynccontextmanager
+    async def slot(self, model_id: str, user_id: int, priority: int, on_position: Optional[PositionCallback] = None) -> AsyncIterator[None]:
+        """Menunggu giliran untuk model_id. Melempar QueueFullError jika antrian penuh."""
+        model_queue = self._queue_for(model_id)
+        await model_queue.acquire(user_id, priority, on_position)
+        try:
+            yield
+        finally:
+            model_queue.release(user_id)
+
+    def try_acquire(self, model_id: str, user_id: int) -> bool:
+        return self._queue_for(model_id).try_acquire(user_id)
+
+    def release(self, model_id: str, user_id: int):
+        self._queue_for(model_id).release(user_id)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model_id: model_queue.stats() for model_id, model_queue in self._queues.items()}
+
+
+mistral_scheduler = MistralScheduler()
+for _model_id in AVAILABLE_MISTRAL_MODELS:
+    mistral_scheduler._queue_for(_model_id)
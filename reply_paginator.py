@@ -0,0 +1,155 @@
+"""
+Memecah balasan panjang menjadi beberapa pesan Telegram (batas 4096 karakter per pesan).
+
+Titik potong dipilih berurutan: batas paragraf, baris, spasi, lalu potongan paksa (tidak pernah di tengah ```).
+Setiap halaman adalah keluaran ensure_valid_markdown untuk potongannya, jadi tag yang masih terbuka ditutup di
+akhir halaman; blok kode yang terpotong dibuka lagi di awal halaman berikutnya lengkap dengan bahasanya.
+Balasan yang muat satu pesan identik dengan ensure_valid_markdown(teks).
+"""
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+
+from markdown_utils import MarkdownSanitizer
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Cadangan untuk penutup tag dan newline sebelum penutup blok kode
+_CLOSER_RESERVE = 16
+_FENCE_LANG_RE = re.compile(r"```([^\s`]*)")
+
+PageSender = Callable[[str, Optional[str]], Awaitable[object]]
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram menghitung panjang pesan dalam unit UTF-16 (emoji di luar BMP = 2)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _find_cut(text: str, start: int, budget: int) -> Tuple[int, int]:
+    """Mengembalikan (panjang_potongan, jumlah_pemisah_dilewati) untuk text[start:]."""
+    if len(text) - start <= budget:
+        return len(text) - start, 0
+    window = text[start:start + budget]
+    floor = budget // 2
+    for separator in ("\n\n", "\n", " "):
+        index = window.rfind(separator, floor)
+        if index > 0:
+            return index, len(separator)
+    cut = budget
+    if text[start + cut] == "`" and text[start + cut - 1] == "`":
+        # Jangan membelah run backtick: potong tepat sebelum run dimulai
+        run_start = start + cut
+        while run_start > start and text[run_start - 1] == "`":
+            run_start -= 1
+        if run_start > start:
+            cut = run_start - start
+        else:
+            # Run lebih panjang dari satu halaman: minimal jangan membelah token ``` (ditokenisasi per tiga dari awal run)
+            cut = max(3, cut // 3 * 3)
+    return cut, 0
+
+
+def _reopen_sequence(open_tags: List[str], page_source: str) -> str:
+    """
+    Pembuka ulang untuk halaman berikutnya. Hanya blok kode yang dibuka lagi: stack sanitizer juga menghitung
+    * ` ~ di dalam kode, sehingga membuka ulang tag inline justru menaruh karakter liar di awal halaman.
+    """
+    if "```" not in open_tags:
+        return ""
+    # ``` terakhir di sumber halaman adalah pembuka blok kode yang masih terbuka
+    match = _FENCE_LANG_RE.match(page_source, page_source.rfind("```"))
+    return f"```{match.group(1) if match else ''}\n"
+
+
+def paginate_markdown(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Memecah teks mentah menjadi halaman markdown valid yang masing-masing muat dalam `limit`."""
+    pages: List[str] = []
+    reopen = ""
+    position = 0
+    while position < len(text):
+        budget = limit - len(reopen)
+        if len(text) - position > budget:
+            budget = max(1, budget - _CLOSER_RESERVE) # Halaman terpotong: sisakan ruang untuk penutup tag
+        while True:
+            cut, skipped = _find_cut(text, position, budget)
+            source = reopen + text[position:position + cut]
+            sanitizer = MarkdownSanitizer()
+            body = sanitizer.feed(source)
+            open_tags = sanitizer.open_tags()
+            is_last_page = position + cut + skipped >= len(text)
+            if not is_last_page and "```" in open_tags and not source.endswith("\n"):
+                body += sanitizer.feed("\n") # Penutup blok kode di baris sendiri
+            page = body + sanitizer.finish()
+            overflow = _utf16_len(page) - limit
+            if overflow <= 0 or budget <= 1:
+                break
+            # Panjang dihitung dalam unit UTF-16, budget dalam karakter: perkecil secara proporsional
+            budget = max(1, budget * limit // (limit + overflow) - _CLOSER_RESERVE)
+        pages.append(page)
+        position += cut + skipped
+        if position < len(text):
+            reopen = _reopen_sequence(open_tags, source)
+    return pages
+
+
+async def _send_page(send: PageSender, page: str):
+    try:
+        return await send(page, ParseMode.MARKDOWN)
+    except TelegramBadRequest as e:
+        error_text = str(e).lower()
+        if "message is not modified" in error_text:
+            return None
+        if "can't parse entities" in error_text:
+            # Markdown yang secara struktur seimbang masih bisa ditolak Telegram; kirim sebagai teks biasa
+            logging.warning(f"Telegram menolak markdown halaman balasan ({e}). Mengirim sebagai teks biasa.")
+            return await send(page, None)
+        raise
+
+
+async def deliver_reply_pages(processing_message: types.Message, reply_text: str) -> int:
+    """
+    Mengirim balasan: halaman pertama mengedit placeholder, halaman berikutnya dikirim sebagai pesan baru.
+    Hanya edit halaman pertama yang berjalan bersamaan dengan pengiriman halaman lain (placeholder sudah berada
+    di atasnya); halaman 2..N dikirim satu per satu karena Telegram mengurutkan pesan baru sesuai waktu terima.
+    Pratinjau tautan dimatikan di semua halaman, sama seperti edit balasan final sebelum ada paginasi.
+    Mengembalikan jumlah halaman.
+    """
+    pages = paginate_markdown(reply_text)
+    if not pages:
+        return 0
+
+    async def edit_placeholder(text: str, parse_mode: Optional[str]):
+        return await processing_message.edit_text(text, parse_mode=parse_mode, disable_web_page_preview=True)
+
+    async def send_new(text: str, parse_mode: Optional[str]):
+        return await processing_message.answer(text, parse_mode=parse_mode, disable_web_page_preview=True)
+
+    first_page_task = asyncio.create_task(_send_page(edit_placeholder, pages[0]))
+    try:
+        for page in pages[1:]:
+            await _send_page(send_new, page)
+    finally:
+        await first_page_task
+    if len(pages) > 1:
+        logging.info(f"Balasan {len(reply_text)} karakter dikirim dalam {len(pages)} pesan (chat {processing_message.chat.id}).")
+    return len(pages)
+
+
+async def reply_with_pages(message: types.Message, reply_text: str) -> int:
+    """Seperti deliver_reply_pages tanpa placeholder: halaman pertama membalas `message`."""
+    pages = paginate_markdown(reply_text)
+
+    async def reply_first(text: str, parse_mode: Optional[str]):
+        return await message.reply(text, parse_mode=parse_mode, disable_web_page_preview=True)
+
+    async def send_new(text: str, parse_mode: Optional[str]):
+        return await message.answer(text, parse_mode=parse_mode, disable_web_page_preview=True)
+
+    for index, page in enumerate(pages):
+        await _send_page(reply_first if index == 0 else send_new, page)
+    return len(pages)
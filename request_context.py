@@ -0,0 +1,107 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.enums import ChatType
+from aiogram.types import TelegramObject, Update
+
+from config import MAX_HISTORY_MESSAGES
+from conversation_cache import conversation_cache
+from storage_service import (
+    is_storage_enabled,
+    fetch_user_context,
+    get_user_preferences,
+    get_current_session_id,
+    get_conversation_history
+)
+
+
+@dataclass
+class RequestContext:
+    """Data pengguna yang dimuat sekali per update dan diteruskan ke handler lewat data["request_context"]."""
+    user_id: int
+    language_code: Optional[str] = None
+    model_id: Optional[str] = None
+    session_id: Optional[str] = None
+    history: Optional[List[Dict[str, str]]] = None # None berarti riwayat belum dimuat
+
+
+async def load_request_context(user_id: int, include_history: bool = False) -> RequestContext:
+    """
+    Memuat preferensi pengguna, dan bila diminta juga sesi aktif beserta riwayat terbaru.
+    Riwayat dibatasi MAX_HISTORY_MESSAGES - 1 karena prompt baru ditambahkan oleh pemanggil.
+    Jika preferensi dan riwayat sesi sudah ada di cache, tidak ada round trip sama sekali.
+    """
+    if not is_storage_enabled():
+        return RequestContext(user_id=user_id)
+
+    history_limit = max(MAX_HISTORY_MESSAGES - 1, 0)
+    if include_history:
+        cached_session_id = conversation_cache.get_current_session(user_id)
+        cached_history = conversation_cache.get_history(cached_session_id, history_limit) if cached_session_id else None
+        if cached_history is not None:
+            preferences = await get_user_preferences(user_id)
+            return RequestContext(
+                user_id=user_id,
+                language_code=preferences["preferred_language_code"],
+                model_id=preferences["preferred_model_id"],
+                session_id=cached_session_id,
+                history=cached_history,
+            )
+
+        # Muat satu ring buffer penuh agar sesi langsung ter-cache, lalu potong untuk prompt ini
+        row = await fetch_user_context(user_id, MAX_HISTORY_MESSAGES)
+        if row is not None:
+            history = [
+                {key: item[key] for key in ("role", "content", "created_at") if item.get(key) is not None} for item in row.get("history") or []
+            ]
+            return RequestContext(
+                user_id=user_id,
+                language_code=row.get("preferred_language_code"),
+                model_id=row.get("preferred_model_id"),
+                session_id=row.get("current_session_id"),
+                history=history[-history_limit:] if history_limit else [],
+            )
+
+    preferences = await get_user_preferences(user_id)
+    context = RequestContext(
+        user_id=user_id,
+        language_code=preferences["preferred_language_code"],
+        model_id=preferences["preferred_model_id"],
+    )
+    if include_history: # Fallback tanpa RPC: query sesi dan riwayat secara terpisah
+        context.session_id = await get_current_session_id(user_id, auto_create=True)
+        context.history = await get_conversation_history(user_id, context.session_id, limit=history_limit) if context.session_id else []
+    return context
+
+
+def _is_private_prompt(update: Update) -> bool:
+    message = update.message
+    return bool(
+        message and message.chat.type == ChatType.PRIVATE
+        and message.text and not message.text.startswith("/")
+    )
+
+
+class RequestContextMiddleware(BaseMiddleware):
+    """
+    Outer middleware yang memuat RequestContext sebelum I18n dan handler berjalan.
+    Untuk pesan teks privat (yang pasti diteruskan ke Mistral) riwayat ikut dimuat dalam satu round trip.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user:
+            include_history = isinstance(event, Update) and _is_private_prompt(event)
+            try:
+                data["request_context"] = await load_request_context(user.id, include_history=include_history)
+            except Exception as e:
+                logging.error(f"Gagal memuat konteks permintaan untuk user {user.id}: {e}", exc_info=True)
+                data["request_context"] = RequestContext(user_id=user.id)
+        return await handler(event, data)
@@ -0,0 +1,177 @@
+"""
+Cache balasan exact-match untuk prompt yang berulang.
+
+Kunci cache adalah hash dari id model dan api_messages yang sudah dinormalisasi (system prompt, ringkasan dan
+riwayat ikut di dalamnya), jadi hit hanya terjadi untuk percakapan yang benar-benar identik. Tier memori berupa
+LRU+TTL; tier SQLite opsional (RESPONSE_CACHE_SQLITE_PATH) bertahan setelah restart dan dipakai bersama oleh
+proses worker. Cache hanya aktif untuk jenis chat di RESPONSE_CACHE_CHAT_TYPES.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cache_utils import LruTtlCache
+from config import (
+    RESPONSE_CACHE_CHAT_TYPES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_SQLITE_PATH,
+    RESPONSE_CACHE_SQLITE_MAX_ROWS
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize_content(content: str) -> str:
+    return _WHITESPACE_RE.sub(" ", content).strip()
+
+
+def response_cache_key(model_id: str, api_messages: List[Dict[str, str]]) -> str:
+    normalized = [[message["role"], _normalize_content(message["content"])] for message in api_messages]
+    payload = json.dumps([model_id, normalized], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _SqliteTier:
+    """Tier disk. Semua akses lewat satu thread agar koneksi sqlite3 tidak dipakai bersamaan."""
+
+    def __init__(self, path: str, ttl_seconds: float, max_rows: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache-sqlite")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "cache_key TEXT PRIMARY KEY, model_id TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS response_cache_created_at ON response_cache (created_at)")
+        self._prune()
+        self.writes = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT response FROM response_cache WHERE cache_key = ? AND created_at >= ?",
+            (key, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, model_id: str, response: str):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO response_cache (cache_key, model_id, response, created_at) VALUES (?, ?, ?, ?)",
+            (key, model_id, response, time.time())
+        )
+        self.writes += 1
+        if self.writes % 500 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Membuang baris kedaluwarsa dan baris tertua di atas max_rows."""
+        self._connection.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._connection.execute(
+            "DELETE FROM response_cache WHERE cache_key IN ("
+            "SELECT cache_key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,)
+        )
+
+    def _stats(self) -> Dict[str, Any]:
+        rows, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(response AS BLOB))), 0) FROM response_cache").fetchone()
+        return {"rows": rows, "bytes": size}
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, model_id: str, response: str):
+        await self._run(self._set, key, model_id, response)
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._run(self._stats)
+
+    async def close(self):
+        # Koneksi ditutup di thread executor setelah penulisan yang masih antre selesai, tanpa memblokir event loop
+        await self._run(self._connection.close)
+        self._executor.shutdown(wait=False)
+
+
+class ResponseCache:
+    def __init__(self):
+        self.memory: LruTtlCache[str, str] = LruTtlCache(max_size=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS)
+        self.disk: Optional[_SqliteTier] = None
+        self.disk_hits = 0
+        if RESPONSE_CACHE_CHAT_TYPES and RESPONSE_CACHE_SQLITE_PATH:
+            try:
+                self.disk = _SqliteTier(RESPONSE_CACHE_SQLITE_PATH, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_SQLITE_MAX_ROWS)
+                logging.info(f"Tier SQLite cache balasan aktif: {RESPONSE_CACHE_SQLITE_PATH}")
+            except Exception as e:
+                logging.error(f"Gagal membuka SQLite cache balasan '{RESPONSE_CACHE_SQLITE_PATH}': {e}. Hanya tier memori yang dipakai.")
+
+    @staticmethod
+    def is_enabled_for(chat_type: str) -> bool:
+        return chat_type in RESPONSE_CACHE_CHAT_TYPES
+
+    async def get(self, model_id: str, api_messages: List[Dict[str, str]]) -> Optional[str]:
+        key = response_cache_key(model_id, api_messages)
+        response = self.memory.get(key)
+        if response is not None or self.disk is None:
+            return response
+        try:
+            response = await self.disk.get(key)
+        except Exception as e:
+            logging.error(f"Gagal membaca SQLite cache balasan: {e}")
+            return None
+        if response is not None:
+            self.disk_hits += 1
+            self.memory.set(key, response)
+        return response
+
+    async def set(self, model_id: str, api_messages: List[Dict[str, str]], response: str):
+        key = response_cache_key(model_id, api_messages)
+        self.memory.set(key, response)
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, model_id, response)
+            except Exception as e:
+                logging.error(f"Gagal menulis SQLite cache balasan: {e}")
+
+    def lookup_stats(self) -> Dict[str, int]:
+        """Hit/miss gabungan kedua tier (hit SQLite dihitung sebagai miss oleh tier memori)."""
+        return {"hits": self.memory.hits + self.disk_hits, "misses": self.memory.misses - self.disk_hits}
+
+    async def stats(self) -> Dict[str, Any]:
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + memory_stats["misses"]
+        result = {
+            **memory_stats,
+            "bytes": sum(len(value.encode("utf-8")) for value in self.memory.values()),
+            "disk_hits": self.disk_hits,
+            "total_hit_ratio": (memory_stats["hits"] + self.disk_hits) / lookups if lookups else 0.0,
+        }
+        if self.disk is not None:
+            try:
+                disk_stats = await self.disk.stats()
+                result["disk_rows"] = disk_stats["rows"]
+                result["disk_bytes"] = disk_stats["bytes"]
+            except Exception as e:
+                logging.error(f"Gagal membaca statistik SQLite cache balasan: {e}")
+        return result
+
+    async def close(self):
+        if self.disk is not None:
+            disk, self.disk = self.disk, None
+            await disk.close()
+
+
+response_cache = ResponseCache()
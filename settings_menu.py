@@ -0,0 +1,117 @@
+"""
+Render menu pengaturan (teks + keyboard inline) yang dimemo per (locale, model aktif).
+
+Hasil render dipakai bersama oleh semua handler, jadi markup dibuat frozen dan tidak boleh diubah pemanggil.
+Cache dikosongkan otomatis saat katalog terjemahan dimuat ulang (hot reload) atau AVAILABLE_MISTRAL_MODELS berubah.
+"""
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ConfigDict
+
+from bot_setup import i18n
+from config import AVAILABLE_MISTRAL_MODELS, SUPPORTED_LANGUAGES
+
+LANGUAGE_NAMES = { "en": "English 🇬🇧", "id": "Indonesia 🇮🇩", "ru": "Русский 🇷🇺", "fr": "Français 🇫🇷" }
+
+# Kombinasi (locale, model) terbatas; batas ini hanya pengaman terhadap model_id tersimpan yang tidak dikenal
+_MAX_ENTRIES = 1024
+
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+
+class _RenderCache:
+    def __init__(self):
+        self._entries: Dict[Hashable, Any] = {}
+        self._version: Optional[Tuple] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], Any]) -> Any:
+        version = (i18n.catalog_version, tuple(AVAILABLE_MISTRAL_MODELS.items()))
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                logging.info(f"Cache render menu pengaturan dikosongkan ({len(self._entries)} entri): katalog terjemahan atau daftar model berubah.")
+            self._entries.clear()
+            self._version = version
+        value = self._entries.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        if len(self._entries) >= _MAX_ENTRIES:
+            self._entries.clear()
+        value = self._entries[key] = render()
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+_render_cache = _RenderCache()
+
+
+def _markup(rows) -> FrozenInlineKeyboardMarkup:
+    return FrozenInlineKeyboardMarkup(inline_keyboard=[[button] for button in rows])
+
+
+def _back_button(locale: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        text=i18n.gettext("back_to_settings_button", default="⬅️ Back to Settings", locale_override=locale), callback_data="settings_main"
+    )
+
+
+def language_name(lang_code: str) -> str:
+    return LANGUAGE_NAMES.get(lang_code, lang_code)
+
+
+def model_name(model_id: str) -> str:
+    return AVAILABLE_MISTRAL_MODELS.get(model_id, model_id)
+
+
+def language_keyboard(locale: str, with_back_button: bool = False) -> InlineKeyboardMarkup:
+    """Keyboard pilihan bahasa; tombol kembali (terjemahan `locale`) untuk versi di dalam menu pengaturan."""
+    def render():
+        rows = [
+            InlineKeyboardButton(text=lang_name, callback_data=f"setlang_{lang_code}")
+            for lang_code, lang_name in LANGUAGE_NAMES.items() if lang_code in SUPPORTED_LANGUAGES
+        ]
+        if with_back_button:
+            rows.append(_back_button(locale))
+        return _markup(rows)
+    return _render_cache.get_or_render(("language_keyboard", locale if with_back_button else None), render)
+
+
+def model_keyboard(locale: str, current_model_id: str) -> InlineKeyboardMarkup:
+    """Keyboard pilihan model dengan tanda ✅ pada model aktif."""
+    def render():
+        rows = [
+            InlineKeyboardButton(text=f"✅ {display_name}" if model_id == current_model_id else display_name, callback_data=f"setmodel_{model_id}")
+            for model_id, display_name in AVAILABLE_MISTRAL_MODELS.items()
+        ]
+        rows.append(_back_button(locale))
+        return _markup(rows)
+    return _render_cache.get_or_render(("model_keyboard", locale, current_model_id), render)
+
+
+def render_settings_menu(locale: str, model_id: str) -> Tuple[str, InlineKeyboardMarkup]:
+    """Teks dan keyboard menu utama pengaturan untuk bahasa `locale` dan model aktif `model_id`."""
+    def render():
+        text = i18n.gettext("settings_menu_title", locale_override=locale) + "\n\n"
+        text += i18n.gettext("current_language_label", locale_override=locale, current_lang_name=language_name(locale)) + "\n"
+        text += i18n.gettext("current_model_label", locale_override=locale, current_model_name=model_name(model_id))
+        keyboard = _markup([
+            InlineKeyboardButton(text=i18n.gettext("change_language_button", default="🌐 Change Language", locale_override=locale), callback_data="settings_change_language"),
+            InlineKeyboardButton(text=i18n.gettext("change_model_button", default="🤖 Change AI Model", locale_override=locale), callback_data="settings_change_model"),
+        ])
+        return text, keyboard
+    return _render_cache.get_or_render(("settings_menu", locale, model_id), render)
+
+
+def get_settings_render_stats() -> Dict[str, int]:
+    return _render_cache.stats()
@@ -0,0 +1,88 @@
+-- Fungsi untuk job retensi riwayat (history_retention.py, dipanggil lewat SupabaseBackend):
+-- penghapusan pesan dalam batch terbatas agar tidak ada DELETE besar yang mengunci tabel atau membebani WAL,
+-- pencarian sesi yang melebihi batas per pengguna, dan ukuran tabel untuk memantau tren pertumbuhan.
+-- Tanpa fungsi ini, pesan sesi lama tetap dihapus setelah /newchat (DELETE biasa), tetapi retensi umur/jumlah sesi nonaktif.
+
+-- Dipakai oleh pembersihan umur pesan (RETENTION_MAX_AGE_DAYS)
+create index if not exists chat_messages_created_at on chat_messages (created_at);
+
+create or replace function public.purge_session_messages(
+    p_user_id bigint,
+    p_session_id text,
+    p_batch_size integer default 500
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_deleted integer;
+begin
+    delete from chat_messages
+    where ctid in (
+        select ctid from chat_messages
+        where user_id = p_user_id and session_id::text = p_session_id
+        limit greatest(p_batch_size, 1)
+    );
+    get diagnostics v_deleted = row_count;
+    return v_deleted;
+end;
+$$;
+
+create or replace function public.purge_expired_messages(
+    p_older_than timestamptz,
+    p_batch_size integer default 500
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_deleted integer;
+begin
+    delete from chat_messages
+    where ctid in (
+        select ctid from chat_messages
+        where created_at < p_older_than
+        limit greatest(p_batch_size, 1)
+    );
+    get diagnostics v_deleted = row_count;
+    return v_deleted;
+end;
+$$;
+
+-- Sesi di luar p_max_sessions sesi terbaru per pengguna (urut pesan terakhir; sesi aktif selalu dipertahankan)
+create or replace function public.find_excess_sessions(
+    p_max_sessions integer,
+    p_limit integer default 100
+)
+returns table (user_id bigint, session_id text)
+language sql
+stable
+as $$
+    select ranked.user_id, ranked.session_id
+    from (
+        select m.user_id, m.session_id::text as session_id,
+               row_number() over (
+                   partition by m.user_id
+                   order by (m.session_id::text = s.current_session_id::text) desc, max(m.created_at) desc
+               ) as session_rank
+        from chat_messages m
+        left join user_sessions s on s.user_id = m.user_id
+        group by m.user_id, m.session_id, s.current_session_id
+    ) ranked
+    where ranked.session_rank > greatest(p_max_sessions, 1)
+    limit greatest(p_limit, 1);
+$$;
+
+-- rows adalah estimasi statistik planner (tanpa count(*) penuh), cukup untuk tren
+create or replace function public.chat_messages_table_stats()
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'rows', greatest(c.reltuples, 0)::bigint,
+        'bytes', pg_total_relation_size(c.oid)
+    )
+    from pg_class c
+    where c.oid = 'public.chat_messages'::regclass;
+$$;
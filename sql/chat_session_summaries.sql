@@ -0,0 +1,10 @@
+-- Ringkasan bergulir per sesi untuk pesan yang sudah keluar dari anggaran token prompt.
+-- summarized_through berisi created_at (ISO 8601) pesan terakhir yang sudah dilipat ke ringkasan;
+-- nilai lama berupa sidik jari hash dianggap mencakup semua pesan sebelum jendela riwayat saat ini.
+create table if not exists public.chat_session_summaries (
+    session_id text primary key,
+    user_id bigint not null,
+    summary text not null,
+    summarized_through text,
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,47 @@
+-- Memuat konteks permintaan pengguna dalam satu round trip:
+-- preferensi (bahasa + model), sesi aktif (dibuat bila belum ada), riwayat pesan terbaru
+-- dan ringkasan bergulir sesi (lihat chat_session_summaries.sql).
+-- Dipanggil dari supabase_backend.SupabaseBackend.fetch_user_context via client.rpc("get_user_context", ...).
+create or replace function public.get_user_context(
+    p_user_id bigint,
+    p_history_limit integer default 10,
+    p_create_session boolean default true
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_session_id user_sessions.current_session_id%type;
+begin
+    select current_session_id into v_session_id
+    from user_sessions
+    where user_id = p_user_id;
+
+    if v_session_id is null and p_create_session then
+        v_session_id := gen_random_uuid();
+        insert into user_sessions (user_id, current_session_id, updated_at)
+        values (p_user_id, v_session_id, now())
+        on conflict (user_id) do update
+            set current_session_id = excluded.current_session_id,
+                updated_at = excluded.updated_at;
+    end if;
+
+    return jsonb_build_object(
+        'preferred_language_code', (select preferred_language_code from user_preferences where user_id = p_user_id),
+        'preferred_model_id', (select preferred_model_id from user_preferences where user_id = p_user_id),
+        'current_session_id', v_session_id,
+        'summary', (select summary from chat_session_summaries where session_id = v_session_id::text),
+        'summarized_through', (select summarized_through from chat_session_summaries where session_id = v_session_id::text),
+        'history', coalesce((
+            select jsonb_agg(jsonb_build_object('role', h.role, 'content', h.content, 'created_at', h.created_at) order by h.created_at)
+            from (
+                select role, content, created_at
+                from chat_messages
+                where user_id = p_user_id and session_id = v_session_id
+                order by created_at desc
+                limit greatest(p_history_limit, 0)
+            ) h
+        ), '[]'::jsonb)
+    );
+end;
+$$;
@@ -0,0 +1,257 @@
+"""
+Backend storage SQLite lokal (mode WAL) untuk deployment satu node dan pengujian offline.
+
+Semua akses lewat satu thread per proses (satu koneksi sqlite3), sama seperti tier SQLite response_cache, jadi
+event loop tidak pernah menunggu disk. WAL membuat pembaca tidak terblokir penulis, sehingga beberapa proses worker
+bisa memakai file yang sama; busy_timeout menangani penulis yang bersamaan. Riwayat diindeks pada
+(user_id, session_id, created_at) sesuai pola query "N pesan terbaru satu sesi", dan pada created_at untuk retensi.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import SQLITE_QUERY_SECONDS
+from storage_backend import PREFERENCE_COLUMNS, StorageBackend
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS user_sessions ("
+    "user_id INTEGER PRIMARY KEY, current_session_id TEXT NOT NULL, updated_at TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chat_messages ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, session_id TEXT NOT NULL, "
+    "role TEXT NOT NULL, content TEXT NOT NULL, created_at TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chat_messages_user_session_created ON chat_messages (user_id, session_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS chat_messages_created ON chat_messages (created_at)",
+    "CREATE TABLE IF NOT EXISTS user_preferences ("
+    "user_id INTEGER PRIMARY KEY, preferred_language_code TEXT, preferred_model_id TEXT, updated_at TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chat_session_summaries ("
+    "session_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, summary TEXT, summarized_through TEXT, updated_at TEXT NOT NULL)",
+)
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-sqlite")
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        logging.info(f"Storage SQLite dibuka: {path} (WAL).")
+
+    async def _run(self, operation: str, func: Callable, *args) -> Any:
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            SQLITE_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    def _transaction(self, func: Callable, *args) -> Any:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return result
+
+    # --- Implementasi sinkron (thread koneksi) ---
+
+    def _get_current_session_id(self, user_id: int) -> Optional[str]:
+        row = self._connection.execute("SELECT current_session_id FROM user_sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def _set_current_session_id(self, user_id: int, session_id: str):
+        self._connection.execute(
+            "INSERT INTO user_sessions (user_id, current_session_id, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET current_session_id = excluded.current_session_id, updated_at = excluded.updated_at",
+            (user_id, session_id, _now())
+        )
+
+    def _insert_messages(self, rows: List[Dict[str, Any]]):
+        self._connection.executemany(
+            "INSERT INTO chat_messages (user_id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(row["user_id"], row["session_id"], row["role"], row["content"], row["created_at"]) for row in rows]
+        )
+
+    def _fetch_recent_messages(self, user_id: int, session_id: str, limit: int) -> List[Dict[str, str]]:
+        rows = self._connection.execute(
+            "SELECT role, content, created_at FROM chat_messages WHERE user_id = ? AND session_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (user_id, session_id, max(limit, 0))
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def _fetch_messages_between(self, user_id: int, session_id: str, after: Optional[str], before: str, limit: int) -> List[Dict[str, str]]:
+        # created_at selalu ISO 8601 UTC dari storage_service, jadi perbandingan string mengikuti urutan waktu
+        rows = self._connection.execute(
+            "SELECT role, content, created_at FROM chat_messages WHERE user_id = ? AND session_id = ? AND created_at > ? AND created_at < ? "
+            "ORDER BY created_at, id LIMIT ?",
+            (user_id, session_id, after or "", before, max(limit, 0))
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _get_preferences(self, user_id: int) -> Optional[Dict[str, Optional[str]]]:
+        row = self._connection.execute(f"SELECT {', '.join(PREFERENCE_COLUMNS)} FROM user_preferences WHERE user_id = ?", (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _upsert_preference(self, user_id: int, column: str, value: str) -> Dict[str, Any]:
+        row = self._connection.execute(
+            f"INSERT INTO user_preferences (user_id, {column}, updated_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT (user_id) DO UPDATE SET {column} = excluded.{column}, updated_at = excluded.updated_at "
+            f"RETURNING {', '.join(PREFERENCE_COLUMNS)}",
+            (user_id, value, _now())
+        ).fetchone()
+        return dict(row)
+
+    def _get_session_summary(self, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        row = self._connection.execute(
+            "SELECT summary, summarized_through FROM chat_session_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _save_session_summary(self, user_id: int, session_id: str, summary: str, summarized_through: str):
+        self._connection.execute(
+            "INSERT INTO chat_session_summaries (session_id, user_id, summary, summarized_through, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET summary = excluded.summary, summarized_through = excluded.summarized_through, "
+            "updated_at = excluded.updated_at",
+            (session_id, user_id, summary, summarized_through, _now())
+        )
+
+    def _fetch_user_context(self, user_id: int, history_limit: int) -> Dict[str, Any]:
+        # Padanan sql/get_user_context.sql. Tanpa transaksi tulis agar pembacaan dari beberapa worker tidak saling
+        # mengunci; pembuatan sesi idempoten sehingga dua worker yang berlomba tetap mendapat sesi yang sama.
+        session_id = self._get_current_session_id(user_id)
+        if session_id is None:
+            self._connection.execute(
+                "INSERT INTO user_sessions (user_id, current_session_id, updated_at) VALUES (?, ?, ?) ON CONFLICT (user_id) DO NOTHING",
+                (user_id, str(uuid.uuid4()), _now())
+            )
+            session_id = self._get_current_session_id(user_id)
+        preferences = self._get_preferences(user_id) or dict.fromkeys(PREFERENCE_COLUMNS)
+        summary = self._get_session_summary(session_id) or {"summary": None, "summarized_through": None}
+        return {
+            **preferences,
+            "current_session_id": session_id,
+            **summary,
+            "history": self._fetch_recent_messages(user_id, session_id, history_limit),
+        }
+
+    def _purge_session_messages(self, user_id: int, session_id: str, batch_size: int) -> int:
+        return self._connection.execute(
+            "DELETE FROM chat_messages WHERE id IN (SELECT id FROM chat_messages WHERE user_id = ? AND session_id = ? LIMIT ?)",
+            (user_id, session_id, max(batch_size, 1))
+        ).rowcount
+
+    def _purge_expired_messages(self, older_than: str, batch_size: int) -> int:
+        return self._connection.execute(
+            "DELETE FROM chat_messages WHERE id IN (SELECT id FROM chat_messages WHERE created_at < ? LIMIT ?)",
+            (older_than, max(batch_size, 1))
+        ).rowcount
+
+    def _find_excess_sessions(self, max_sessions: int, limit: int) -> List[Tuple[int, str]]:
+        # Padanan find_excess_sessions di sql/chat_messages_retention.sql
+        rows = self._connection.execute(
+            "SELECT user_id, session_id FROM ("
+            " SELECT m.user_id, m.session_id, ROW_NUMBER() OVER ("
+            "  PARTITION BY m.user_id ORDER BY (m.session_id = s.current_session_id) DESC, MAX(m.created_at) DESC"
+            " ) AS session_rank"
+            " FROM chat_messages m LEFT JOIN user_sessions s ON s.user_id = m.user_id"
+            " GROUP BY m.user_id, m.session_id"
+            ") WHERE session_rank > ? LIMIT ?",
+            (max(max_sessions, 1), max(limit, 1))
+        ).fetchall()
+        return [(row["user_id"], row["session_id"]) for row in rows]
+
+    def _table_stats(self) -> Dict[str, int]:
+        rows = self._connection.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0]
+        try:
+            # dbstat menghitung halaman tabel beserta indeksnya
+            size = self._connection.execute(
+                "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE tbl_name = 'chat_messages')"
+            ).fetchone()[0]
+        except sqlite3.OperationalError:
+            # SQLite tanpa SQLITE_ENABLE_DBSTAT_VTAB: ukuran seluruh file sebagai pendekatan
+            size = self._connection.execute("PRAGMA page_count").fetchone()[0] * self._connection.execute("PRAGMA page_size").fetchone()[0]
+        return {"rows": rows, "bytes": size}
+
+    # --- Antarmuka StorageBackend ---
+
+    async def get_current_session_id(self, user_id: int) -> Optional[str]:
+        return await self._run("mendapatkan sesi saat ini", self._get_current_session_id, user_id)
+
+    async def set_current_session_id(self, user_id: int, session_id: str):
+        await self._run("upsert sesi baru", self._set_current_session_id, user_id, session_id)
+
+    async def delete_session_messages(self, user_id: int, session_id: str):
+        await self._run(
+            "menghapus pesan lama", self._connection.execute, "DELETE FROM chat_messages WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+        )
+
+    async def insert_messages(self, rows: List[Dict[str, Any]]):
+        await self._run("bulk insert pesan riwayat", self._transaction, self._insert_messages, rows)
+
+    async def fetch_recent_messages(self, user_id: int, session_id: str, limit: int) -> List[Dict[str, str]]:
+        return await self._run("mengambil riwayat", self._fetch_recent_messages, user_id, session_id, limit)
+
+    async def fetch_messages_between(self, user_id: int, session_id: str, after: Optional[str], before: str, limit: int) -> List[Dict[str, str]]:
+        return await self._run("mengambil rentang riwayat", self._fetch_messages_between, user_id, session_id, after, before, limit)
+
+    async def get_preferences(self, user_id: int) -> Optional[Dict[str, Optional[str]]]:
+        return await self._run("mengambil preferensi", self._get_preferences, user_id)
+
+    async def upsert_preference(self, user_id: int, column: str, value: str) -> Optional[Dict[str, Any]]:
+        if column not in PREFERENCE_COLUMNS:
+            raise ValueError(f"Kolom preferensi tidak dikenal: {column}")
+        return await self._run("menyimpan preferensi", self._upsert_preference, user_id, column, value)
+
+    async def get_session_summary(self, user_id: int, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        return await self._run("mengambil ringkasan sesi", self._get_session_summary, session_id)
+
+    async def save_session_summary(self, user_id: int, session_id: str, summary: str, summarized_through: str):
+        await self._run("menyimpan ringkasan sesi", self._save_session_summary, user_id, session_id, summary, summarized_through)
+
+    async def fetch_user_context(self, user_id: int, history_limit: int) -> Optional[Dict[str, Any]]:
+        return await self._run("memuat konteks pengguna", self._fetch_user_context, user_id, history_limit)
+
+    async def purge_session_messages(self, user_id: int, session_id: str, batch_size: int) -> int:
+        return await self._run("retensi: menghapus pesan sesi", self._purge_session_messages, user_id, session_id, batch_size)
+
+    async def delete_session_summary(self, session_id: str):
+        await self._run(
+            "retensi: menghapus ringkasan sesi", self._connection.execute, "DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,)
+        )
+
+    async def purge_expired_messages(self, older_than: str, batch_size: int) -> Optional[int]:
+        return await self._run("retensi: menghapus pesan kedaluwarsa", self._purge_expired_messages, older_than, batch_size)
+
+    async def find_excess_sessions(self, max_sessions: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+        return await self._run("retensi: mencari sesi berlebih", self._find_excess_sessions, max_sessions, limit)
+
+    async def table_stats(self) -> Optional[Dict[str, int]]:
+        return await self._run("retensi: ukuran tabel", self._table_stats)
+
+    async def close(self):
+        # Koneksi ditutup di thread executor setelah query yang masih antre selesai, jadi shutdown tidak perlu menunggu
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+        self._executor.shutdown(wait=False)
+        logging.info("Storage SQLite ditutup.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path}
@@ -0,0 +1,118 @@
+"""
+Antarmuka backend penyimpanan sesi, riwayat pesan, preferensi, dan ringkasan sesi.
+
+Backend hanya berisi akses data mentah. Cache (preferensi, ring buffer riwayat, ringkasan) dan antrian write-behind
+ada di storage_service, jadi berlaku sama untuk semua backend. Backend dipilih lewat STORAGE_BACKEND:
+- "supabase": PostgREST lewat supabase-py (supabase_backend.py);
+- "sqlite": file SQLite lokal mode WAL (sqlite_backend.py), latensi sub-milidetik dan bisa berjalan offline.
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import STORAGE_BACKEND, SQLITE_STORAGE_PATH
+
+PREFERENCE_COLUMNS = ("preferred_language_code", "preferred_model_id")
+
+
+class StorageError(Exception):
+    """Operasi storage gagal dengan respons error. Detailnya sudah dicatat di log oleh backend."""
+
+
+class StorageBackend(ABC):
+    name = ""
+
+    @abstractmethod
+    async def get_current_session_id(self, user_id: int) -> Optional[str]:
+        """Sesi aktif pengguna, atau None jika belum ada."""
+
+    @abstractmethod
+    async def set_current_session_id(self, user_id: int, session_id: str):
+        ...
+
+    @abstractmethod
+    async def delete_session_messages(self, user_id: int, session_id: str):
+        ...
+
+    @abstractmethod
+    async def insert_messages(self, rows: List[Dict[str, Any]]):
+        """Bulk insert baris chat_messages (user_id, session_id, role, content, created_at)."""
+
+    @abstractmethod
+    async def fetch_recent_messages(self, user_id: int, session_id: str, limit: int) -> List[Dict[str, str]]:
+        """`limit` pesan terbaru sesi (role, content, created_at), berurutan dari yang paling lama."""
+
+    @abstractmethod
+    async def fetch_messages_between(self, user_id: int, session_id: str, after: Optional[str], before: str, limit: int) -> List[Dict[str, str]]:
+        """Paling banyak `limit` pesan tertua dengan after < created_at < before (after None = sejak awal sesi)."""
+
+    @abstractmethod
+    async def get_preferences(self, user_id: int) -> Optional[Dict[str, Optional[str]]]:
+        """Baris preferensi (PREFERENCE_COLUMNS), atau None jika belum ada."""
+
+    @abstractmethod
+    async def upsert_preference(self, user_id: int, column: str, value: str) -> Optional[Dict[str, Any]]:
+        """Menyimpan satu kolom preferensi. Mengembalikan baris lengkap jika backend menyediakannya."""
+
+    @abstractmethod
+    async def get_session_summary(self, user_id: int, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        ...
+
+    @abstractmethod
+    async def save_session_summary(self, user_id: int, session_id: str, summary: str, summarized_through: str):
+        ...
+
+    async def fetch_user_context(self, user_id: int, history_limit: int) -> Optional[Dict[str, Any]]:
+        """
+        Preferensi, sesi aktif (dibuat bila belum ada), ringkasan, dan riwayat terbaru dalam satu operasi.
+        None berarti backend tidak mendukungnya; pemanggil lalu memakai operasi terpisah.
+        """
+        return None
+
+    # --- Retensi (dipanggil job latar belakang history_retention.py, bukan dari jalur permintaan) ---
+
+    async def purge_session_messages(self, user_id: int, session_id: str, batch_size: int) -> int:
+        """
+        Menghapus paling banyak `batch_size` pesan satu sesi dan mengembalikan jumlah yang terhapus;
+        hasil di bawah `batch_size` berarti sesi sudah kosong. Default: satu DELETE tanpa batas.
+        """
+        await self.delete_session_messages(user_id, session_id)
+        return 0
+
+    @abstractmethod
+    async def delete_session_summary(self, session_id: str):
+        ...
+
+    async def purge_expired_messages(self, older_than: str, batch_size: int) -> Optional[int]:
+        """Menghapus paling banyak `batch_size` pesan dengan created_at < `older_than` (ISO 8601). None = tidak didukung."""
+        return None
+
+    async def find_excess_sessions(self, max_sessions: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+        """(user_id, session_id) di luar `max_sessions` sesi terbaru per pengguna; sesi aktif tidak pernah termasuk. None = tidak didukung."""
+        return None
+
+    async def table_stats(self) -> Optional[Dict[str, int]]:
+        """Ukuran tabel chat_messages: {"rows": ..., "bytes": ...}. None = tidak didukung."""
+        return None
+
+    async def close(self):
+        """Menunggu operasi yang sedang berjalan lalu melepas koneksi/thread tanpa memblokir event loop."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+def create_storage_backend() -> Optional[StorageBackend]:
+    """Backend sesuai STORAGE_BACKEND, atau None jika tidak dikonfigurasi/gagal diinisialisasi (fitur riwayat nonaktif)."""
+    if STORAGE_BACKEND == "sqlite":
+        from sqlite_backend import SqliteBackend
+        try:
+            return SqliteBackend(SQLITE_STORAGE_PATH)
+        except Exception as e:
+            logging.error(f"Gagal membuka storage SQLite {SQLITE_STORAGE_PATH}: {e}")
+            return None
+    if STORAGE_BACKEND == "supabase":
+        from supabase_backend import create_supabase_backend
+        return create_supabase_backend()
+    logging.error(f"STORAGE_BACKEND '{STORAGE_BACKEND}' tidak dikenal (pilihan: supabase, sqlite). Fitur riwayat nonaktif.")
+    return None
@@ -0,0 +1,363 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Any
+
+from config import (
+    MAX_HISTORY_MESSAGES, PREFERENCE_CACHE_MAX_SIZE, PREFERENCE_CACHE_TTL_SECONDS,
+    HISTORY_WRITE_BEHIND_ENABLED, HISTORY_WRITE_BATCH_SIZE, HISTORY_WRITE_FLUSH_INTERVAL_SECONDS,
+    HISTORY_WRITE_MAX_RETRIES, HISTORY_WRITE_QUEUE_MAX, HISTORY_CACHE_MAX_SESSIONS,
+    RETENTION_MAX_AGE_DAYS, RETENTION_MAX_SESSIONS_PER_USER, RETENTION_SWEEP_INTERVAL_SECONDS, RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE_SECONDS, RETENTION_SESSION_PURGE_DELAY_SECONDS
+)
+from cache_utils import LruTtlCache
+from conversation_cache import conversation_cache
+from history_writer import WriteBehindQueue
+from history_retention import RetentionJob
+from storage_backend import PREFERENCE_COLUMNS, StorageBackend, StorageError, create_storage_backend
+
+# Backend dipilih lewat STORAGE_BACKEND (lihat storage_backend.py). Cache dan write-behind di modul ini berlaku untuk semua backend.
+# StorageError berarti backend sudah mencatat respons error di log; exception lain dicatat di sini.
+storage_backend: Optional[StorageBackend] = create_storage_backend()
+
+def is_storage_enabled() -> bool:
+    return storage_backend is not None
+
+async def close_storage():
+    """Menunggu operasi storage yang sedang berjalan lalu menutup backend. Dipanggil setelah stop_history_writer()."""
+    if storage_backend is not None:
+        await storage_backend.close()
+        logging.info(f"Backend storage {storage_backend.name} telah ditutup.")
+
+def get_storage_stats() -> Dict[str, Any]:
+    return storage_backend.stats() if storage_backend is not None else {"backend": None}
+
+# --- Fungsi untuk User Sessions dan Chat Messages ---
+async def start_new_chat_session(user_id: int, delete_previous_messages: bool = False) -> Optional[str]:
+    """Memulai sesi baru. Pesan sesi lama (bila diminta) dihapus oleh job retensi di latar belakang."""
+    if not is_storage_enabled():
+        logging.warning(f"Storage tidak aktif, tidak bisa memulai sesi baru untuk user {user_id}")
+        return None
+    old_session_id: Optional[str] = None
+    if delete_previous_messages:
+        old_session_id = conversation_cache.get_current_session(user_id)
+        if old_session_id is None:
+            try:
+                old_session_id = await storage_backend.get_current_session_id(user_id)
+            except StorageError: pass
+            except Exception as e:
+                logging.error(f"Exception saat mengambil session_id lama untuk user {user_id} sebelum penghapusan: {e}", exc_info=True)
+        if old_session_id:
+            logging.info(f"Sesi lama {old_session_id} ditemukan untuk user {user_id}, akan dihapus pesannya.")
+    new_session_id = str(uuid.uuid4())
+    try:
+        await storage_backend.set_current_session_id(user_id, new_session_id)
+    except StorageError: return None
+    except Exception as e:
+        logging.error(f"Exception umum saat memulai sesi chat baru untuk user {user_id}: {e}", exc_info=True)
+        return None
+    conversation_cache.start_session(user_id, new_session_id)
+    _cache_session_summary(new_session_id, None, None)
+    logging.info(f"Berhasil memulai sesi chat baru {new_session_id} untuk user {user_id}")
+    if old_session_id and delete_previous_messages:
+        if _retention_job.schedule_session_purge(user_id, old_session_id):
+            logging.info(f"Penghapusan pesan sesi lama {old_session_id} untuk user {user_id} dijadwalkan di latar belakang.")
+            return new_session_id
+        # Job retensi tidak berjalan (mis. skrip tanpa event loop bot): hapus langsung seperti sebelumnya
+        try:
+            await storage_backend.delete_session_messages(user_id, old_session_id)
+            await storage_backend.delete_session_summary(old_session_id)
+            logging.info(f"Berhasil memicu penghapusan pesan dari sesi lama {old_session_id} untuk user {user_id}.")
+        except StorageError: logging.warning(f"Gagal menghapus semua pesan lama untuk sesi {old_session_id}, user {user_id}.")
+        except Exception as e_del: logging.error(f"Exception saat menghapus pesan lama untuk user {user_id}, sesi {old_session_id}: {e_del}", exc_info=True)
+    return new_session_id
+
+async def get_current_session_id(user_id: int, auto_create: bool = True) -> Optional[str]:
+    if not is_storage_enabled():
+        logging.warning(f"Storage tidak aktif, tidak bisa mendapatkan sesi untuk user {user_id}")
+        return None
+    cached_session_id = conversation_cache.get_current_session(user_id)
+    if cached_session_id:
+        return cached_session_id
+    session_id: Optional[str] = None
+    try:
+        session_id = await storage_backend.get_current_session_id(user_id)
+    except StorageError: pass # Error sudah dicatat; sesi baru dibuat di bawah bila auto_create
+    except Exception as e:
+        logging.error(f"Exception tak terduga saat mendapatkan session ID untuk user {user_id}: {e}", exc_info=True)
+    if session_id:
+        logging.debug(f"Sesi ID ditemukan untuk user {user_id}: {session_id}")
+        conversation_cache.set_current_session(user_id, session_id)
+        return session_id
+    if auto_create:
+        logging.info(f"Tidak ada sesi aktif untuk user {user_id}, membuat sesi baru.")
+        return await start_new_chat_session(user_id, delete_previous_messages=False)
+    logging.debug(f"Tidak ada sesi aktif untuk user {user_id} dan auto_create adalah False.")
+    return None
+
+async def _insert_history_batch(rows: List[Dict[str, Any]]) -> bool:
+    """Bulk insert baris riwayat (dipakai oleh antrian write-behind). Mengembalikan True jika berhasil."""
+    try:
+        await storage_backend.insert_messages(rows)
+        return True
+    except StorageError:
+        return False
+
+_history_writer = WriteBehindQueue(
+    _insert_history_batch,
+    batch_size=HISTORY_WRITE_BATCH_SIZE,
+    flush_interval=HISTORY_WRITE_FLUSH_INTERVAL_SECONDS,
+    max_retries=HISTORY_WRITE_MAX_RETRIES,
+    max_queue=HISTORY_WRITE_QUEUE_MAX,
+)
+
+def start_history_writer():
+    """Menjalankan antrian write-behind riwayat (harus dipanggil dari dalam event loop)."""
+    if is_storage_enabled() and HISTORY_WRITE_BEHIND_ENABLED:
+        _history_writer.start()
+
+async def stop_history_writer():
+    """Mem-flush semua baris riwayat yang tertunda lalu menghentikan antrian write-behind."""
+    await _history_writer.stop()
+
+def get_history_writer_stats() -> Dict[str, Any]:
+    """Statistik antrian write-behind (kedalaman antrian, latensi flush, baris tertulis/terbuang)."""
+    return _history_writer.stats()
+
+# --- Retensi riwayat (lihat history_retention.py dan sql/chat_messages_retention.sql) ---
+_retention_job = RetentionJob(
+    max_age_days=RETENTION_MAX_AGE_DAYS,
+    max_sessions_per_user=RETENTION_MAX_SESSIONS_PER_USER,
+    sweep_interval=RETENTION_SWEEP_INTERVAL_SECONDS,
+    batch_size=RETENTION_BATCH_SIZE,
+    batch_pause=RETENTION_BATCH_PAUSE_SECONDS,
+    # Jeda minimal dua interval flush agar baris sesi lama yang masih di antrian write-behind sudah tertulis
+    session_purge_delay=max(RETENTION_SESSION_PURGE_DELAY_SECONDS, 2 * HISTORY_WRITE_FLUSH_INTERVAL_SECONDS),
+)
+
+def start_retention_job(run_sweeps: bool = True):
+    """Menjalankan job retensi (dari dalam event loop). Di mode multi-proses hanya satu worker yang menjalankan sweep."""
+    if is_storage_enabled():
+        _retention_job.start(storage_backend, run_sweeps)
+
+async def stop_retention_job():
+    """Menyelesaikan penghapusan sesi yang tertunda. Dipanggil setelah stop_history_writer()."""
+    await _retention_job.stop()
+
+def get_retention_stats() -> Dict[str, Any]:
+    """Statistik job retensi (baris terhapus per alasan, antrian penghapusan sesi, tren ukuran tabel)."""
+    return _retention_job.stats()
+
+async def add_message_to_history(user_id: int, session_id: str, role: str, content: str):
+    if not is_storage_enabled() or not session_id: return
+    # created_at diisi di sisi klien agar urutan pesan tetap benar walau ditulis dalam satu batch
+    message_data = { "user_id": user_id, "session_id": session_id, "role": role, "content": content, "created_at": datetime.now(timezone.utc).isoformat() }
+    conversation_cache.append(session_id, role, content, message_data["created_at"])
+    if _history_writer.enqueue(message_data): return
+    try:
+        await storage_backend.insert_messages([message_data])
+        logging.debug(f"Pesan ditambahkan ke riwayat untuk user {user_id}, session {session_id}")
+    except StorageError: pass
+    except Exception as e: logging.error(f"Exception saat menambahkan pesan ke riwayat untuk user {user_id}, session {session_id}: {e}", exc_info=True)
+
+def _parse_created_at(value: Optional[str]) -> datetime:
+    # Dibandingkan sebagai datetime: format created_at dari Postgres berbeda dari isoformat() Python
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else datetime.min.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+def _merge_queued_rows(session_id: str, history: List[Dict[str, str]], queued_before: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Menambahkan baris write-behind yang belum tertulis ke riwayat hasil query storage (urutan lama -> baru).
+    queued_before diambil sebelum query agar baris yang selesai di-flush selama query tidak hilang;
+    baris yang sudah ada di hasil query tidak diduplikasi.
+    """
+    queued = queued_before + _history_writer.queued_rows(session_id)
+    if not queued:
+        return history
+    seen = {(message["role"], message["content"], _parse_created_at(message.get("created_at"))) for message in history}
+    merged = list(history)
+    for row in queued:
+        key = (row["role"], row["content"], _parse_created_at(row["created_at"]))
+        if key not in seen:
+            seen.add(key)
+            merged.append({"role": row["role"], "content": row["content"], "created_at": row["created_at"]})
+    if len(merged) > len(history):
+        merged.sort(key=lambda message: _parse_created_at(message.get("created_at")))
+    return merged
+
+async def get_conversation_history(user_id: int, session_id: str, limit: int = MAX_HISTORY_MESSAGES) -> List[Dict[str, str]]:
+    history: List[Dict[str, str]] = []
+    if not is_storage_enabled() or not session_id: return history
+    cached_history = conversation_cache.get_history(session_id, limit)
+    if cached_history is not None: return cached_history
+    try:
+        # Cold miss: ambil sebanyak kapasitas ring buffer agar sesi bisa langsung di-cache
+        fetch_limit = max(limit, conversation_cache.max_messages)
+        queued_before = _history_writer.queued_rows(session_id)
+        history = await storage_backend.fetch_recent_messages(user_id, session_id, fetch_limit)
+        logging.debug(f"Mengambil {len(history)} pesan dari riwayat untuk user {user_id}, session {session_id}")
+        history = _merge_queued_rows(session_id, history, queued_before)[-fetch_limit:]
+        conversation_cache.hydrate(user_id, session_id, history)
+        return history[-limit:] if limit > 0 else []
+    except StorageError:
+        return []
+    except Exception as e:
+        logging.error(f"Exception saat mengambil riwayat percakapan untuk user {user_id}, session {session_id}: {e}", exc_info=True)
+        return []
+
+async def get_messages_between(user_id: int, session_id: str, after: Optional[str], before: str, limit: int) -> List[Dict[str, str]]:
+    """Pesan sesi dengan after < created_at < before (urutan lama -> baru), untuk ringkasan bergulir. Tidak lewat cache."""
+    if not is_storage_enabled() or not session_id: return []
+    try:
+        return await storage_backend.fetch_messages_between(user_id, session_id, after, before, limit)
+    except StorageError:
+        return []
+    except Exception as e:
+        logging.error(f"Exception saat mengambil rentang riwayat untuk user {user_id}, session {session_id}: {e}", exc_info=True)
+        return []
+
+# --- Fungsi untuk User Preferences (dengan cache write-through) ---
+_preference_cache: LruTtlCache[int, Dict[str, Optional[str]]] = LruTtlCache(
+    max_size=PREFERENCE_CACHE_MAX_SIZE, ttl_seconds=PREFERENCE_CACHE_TTL_SECONDS
+)
+
+def _cache_preference_row(user_id: int, row: Dict[str, Any]):
+    _preference_cache.set(user_id, {column: row.get(column) for column in PREFERENCE_COLUMNS})
+
+def _update_cached_preference(user_id: int, column: str, value: str, row: Optional[Dict[str, Any]]):
+    """Memperbarui cache setelah upsert berhasil. Baris lengkap dari backend dipakai jika tersedia."""
+    if row:
+        _cache_preference_row(user_id, row)
+        return
+    cached = _preference_cache.peek(user_id)
+    if cached is not None:
+        _preference_cache.set(user_id, {**cached, column: value})
+
+def get_preference_cache_stats() -> Dict[str, Any]:
+    """Statistik cache preferensi pengguna (hit, miss, ukuran)."""
+    return _preference_cache.stats()
+
+async def get_user_preferences(user_id: int) -> Dict[str, Optional[str]]:
+    """Mengambil preferensi bahasa dan model pengguna dalam satu pembacaan baris, melalui cache LRU+TTL."""
+    cached = _preference_cache.get(user_id)
+    if cached is not None:
+        return cached
+    preferences: Dict[str, Optional[str]] = dict.fromkeys(PREFERENCE_COLUMNS)
+    if not is_storage_enabled():
+        return preferences
+    try:
+        row = await storage_backend.get_preferences(user_id)
+    except StorageError:
+        return preferences # Jangan cache hasil error
+    except Exception as e:
+        logging.error(f"Exception saat mengambil preferensi user {user_id}: {e}", exc_info=True)
+        return preferences
+    if row:
+        preferences.update({column: row.get(column) for column in PREFERENCE_COLUMNS})
+    # Baris yang belum ada tetap di-cache agar tidak di-query ulang setiap pesan
+    _preference_cache.set(user_id, preferences)
+    return preferences
+
+async def get_user_language_preference(user_id: int) -> Optional[str]:
+    """Mengambil preferensi bahasa pengguna (dari cache atau storage)."""
+    if not is_storage_enabled():
+        return None
+    return (await get_user_preferences(user_id))["preferred_language_code"] or None
+
+async def _set_preference(user_id: int, column: str, value: str, label: str):
+    if not is_storage_enabled():
+        return
+    try:
+        row = await storage_backend.upsert_preference(user_id, column, value)
+    except StorageError:
+        return
+    except Exception as e:
+        logging.error(f"Exception saat menyimpan preferensi {label} user {user_id}: {e}", exc_info=True)
+        return
+    _update_cached_preference(user_id, column, value, row)
+    logging.info(f"Preferensi {label} user {user_id} diatur ke {value} di DB.")
+
+async def set_user_language_preference(user_id: int, lang_code: str):
+    """Menyimpan atau memperbarui preferensi bahasa pengguna."""
+    await _set_preference(user_id, "preferred_language_code", lang_code, "bahasa")
+
+async def get_user_model_preference(user_id: int) -> Optional[str]:
+    """Mengambil preferensi model AI pengguna (dari cache atau storage)."""
+    if not is_storage_enabled():
+        return None
+    return (await get_user_preferences(user_id))["preferred_model_id"] or None
+
+async def set_user_model_preference(user_id: int, model_id: str):
+    """Menyimpan atau memperbarui preferensi model AI pengguna."""
+    await _set_preference(user_id, "preferred_model_id", model_id, "model")
+
+# --- Ringkasan bergulir per sesi (tabel chat_session_summaries, lihat sql/chat_session_summaries.sql) ---
+_summary_cache: LruTtlCache[str, Dict[str, Optional[str]]] = LruTtlCache(max_size=HISTORY_CACHE_MAX_SESSIONS)
+
+def _cache_session_summary(session_id: str, summary: Optional[str], summarized_through: Optional[str]):
+    _summary_cache.set(session_id, {"summary": summary, "summarized_through": summarized_through})
+
+async def get_session_summary(user_id: int, session_id: str) -> Dict[str, Optional[str]]:
+    """Mengambil ringkasan bergulir sesi (dari cache atau storage). Sesi tanpa ringkasan juga di-cache."""
+    cached = _summary_cache.get(session_id)
+    if cached is not None:
+        return cached
+    empty_summary: Dict[str, Optional[str]] = {"summary": None, "summarized_through": None}
+    if not is_storage_enabled() or not session_id:
+        return empty_summary
+    try:
+        row = await storage_backend.get_session_summary(user_id, session_id)
+    except StorageError:
+        return empty_summary
+    except Exception as e:
+        logging.error(f"Exception saat mengambil ringkasan sesi {session_id} untuk user {user_id}: {e}", exc_info=True)
+        return empty_summary
+    if row:
+        _cache_session_summary(session_id, row.get("summary"), row.get("summarized_through"))
+    else:
+        _cache_session_summary(session_id, None, None)
+    return _summary_cache.peek(session_id)
+
+async def save_session_summary(user_id: int, session_id: str, summary: str, summarized_through: str):
+    """Menyimpan ringkasan bergulir sesi ke storage dan cache."""
+    if not is_storage_enabled() or not session_id:
+        return
+    _cache_session_summary(session_id, summary, summarized_through)
+    try:
+        await storage_backend.save_session_summary(user_id, session_id, summary, summarized_through)
+        logging.debug(f"Ringkasan sesi {session_id} untuk user {user_id} diperbarui.")
+    except StorageError: pass
+    except Exception as e:
+        logging.error(f"Exception saat menyimpan ringkasan sesi {session_id} untuk user {user_id}: {e}", exc_info=True)
+
+# --- Konteks permintaan dalam satu operasi (RPC get_user_context di Supabase, query lokal di SQLite) ---
+async def fetch_user_context(user_id: int, history_limit: int) -> Optional[Dict[str, Any]]:
+    """
+    Memuat preferensi, sesi aktif (dibuat bila belum ada) dan riwayat terbaru dalam satu operasi backend.
+    Mengembalikan None jika gagal atau tidak didukung backend; pemanggil lalu memakai operasi terpisah.
+    """
+    if not is_storage_enabled():
+        return None
+    cached_session_id = conversation_cache.get_current_session(user_id)
+    queued_before = _history_writer.queued_rows(cached_session_id) if cached_session_id else []
+    try:
+        context = await storage_backend.fetch_user_context(user_id, history_limit)
+    except StorageError:
+        return None
+    except Exception as e:
+        logging.error(f"Exception saat memuat konteks pengguna {user_id}: {e}", exc_info=True)
+        return None
+    if context is None:
+        return None
+    _cache_preference_row(user_id, context)
+    if context.get("current_session_id"):
+        _cache_session_summary(context["current_session_id"], context.get("summary"), context.get("summarized_through"))
+        if context["current_session_id"] != cached_session_id:
+            queued_before = []
+        history = _merge_queued_rows(context["current_session_id"], context.get("history") or [], queued_before)
+        context["history"] = history[-history_limit:] if history_limit > 0 else []
+        if history_limit >= conversation_cache.max_messages:
+            conversation_cache.hydrate(user_id, context["current_session_id"], context.get("history") or [])
+    return context
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Dict, List, Optional, Set
+
+from aiogram import types
+from aiogram.enums import ParseMode
+from mistralai import Mistral
+
+from config import STREAM_EDIT_INTERVAL_SECONDS, STREAM_EDIT_MIN_DELTA_CHARS, OUTBOUND_SCHEDULER_ENABLED
+from markdown_utils import MarkdownSanitizer
+from mistral_resilience import resilient_stream
+from reply_paginator import TELEGRAM_MESSAGE_LIMIT
+from telegram_outbound import progress_priority
+
+
+async def _progress_edit(processing_message: types.Message, text: str):
+    try:
+        with progress_priority():
+            await processing_message.edit_text(text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+    except Exception as e:
+        # Edit progres boleh gagal (mis. markdown parsial tidak valid); edit final tetap dilakukan
+        logging.debug(f"Edit progres streaming gagal untuk pesan {processing_message.message_id}: {e}")
+
+
+async def stream_reply_with_progressive_edits(
+    client: Mistral,
+    model_id: str,
+    api_messages: List[Dict[str, str]],
+    processing_message: types.Message,
+    user_id: int,
+) -> Optional[str]:
+    """
+    Mengalirkan balasan Mistral sambil mengedit processing_message secara bertahap.
+    Edit digabung sesuai STREAM_EDIT_INTERVAL_SECONDS dan STREAM_EDIT_MIN_DELTA_CHARS.
+    Markdown disanitasi inkremental per potongan, jadi edit progres tidak memindai ulang seluruh teks.
+    Edit progres berjalan di background agar pembacaan stream tidak tertahan antrian laju Telegram; edit yang
+    menumpuk untuk pesan yang sama digabung oleh penjadwal pesan keluar.
+    Edit progres berhenti setelah balasan melewati batas satu pesan Telegram; sisanya dikirim per halaman
+    oleh pemanggil. Mengembalikan teks mentah lengkap (None jika kosong); edit final dilakukan oleh pemanggil.
+    """
+    parts: List[str] = []
+    sanitizer = MarkdownSanitizer()
+    safe_parts: List[str] = []
+    reply_length = 0
+    last_edit_at = time.monotonic()
+    last_edit_length = 0
+    progress_tasks: Set[asyncio.Task] = set()
+
+    # aclosing: stream (dan slot model cadangan bila hedge menang) dilepas segera walau loop berhenti karena error
+    async with aclosing(resilient_stream(client, model_id, api_messages, user_id)) as stream:
+        async for text in stream:
+            parts.append(text)
+            safe_parts.append(sanitizer.feed(text))
+            reply_length += len(text)
+
+            if reply_length > TELEGRAM_MESSAGE_LIMIT:
+                continue
+            now = time.monotonic()
+            if now - last_edit_at < STREAM_EDIT_INTERVAL_SECONDS or reply_length - last_edit_length < STREAM_EDIT_MIN_DELTA_CHARS:
+                continue
+            if progress_tasks and not OUTBOUND_SCHEDULER_ENABLED:
+                # Tanpa penjadwal, edit paralel ke pesan yang sama bisa tiba tidak berurutan
+                continue
+
+            safe_prefix = "".join(safe_parts)
+            safe_parts = [safe_prefix]
+            last_edit_at = now
+            last_edit_length = reply_length
+            task = asyncio.create_task(_progress_edit(processing_message, safe_prefix + sanitizer.tail()))
+            progress_tasks.add(task)
+            task.add_done_callback(progress_tasks.discard)
+
+    if progress_tasks:
+        await asyncio.gather(*progress_tasks)
+    full_reply = "".join(parts)
+    return full_reply or None
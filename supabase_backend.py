@@ -0,0 +1,287 @@
+"""
+Backend storage Supabase (PostgREST lewat supabase-py).
+
+Klien supabase-py sinkron; setiap query dijalankan di thread pool terbatas (SUPABASE_MAX_WORKERS) agar event loop
+tidak terblokir, dengan satu klien httpx bersama sehingga koneksi tetap di-pool. Respons error dicatat di log oleh
+_is_supabase_response_error lalu dilaporkan ke storage_service sebagai StorageError.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from supabase import create_client, Client
+from postgrest import APIResponse, ReturnMethod
+
+from config import SUPABASE_URL, SUPABASE_SERVICE_KEY, SUPABASE_MAX_WORKERS
+from metrics import SUPABASE_QUERY_SECONDS, SUPABASE_QUERY_ERRORS
+from storage_backend import PREFERENCE_COLUMNS, StorageBackend, StorageError
+
+_supabase_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_supabase_executor() -> ThreadPoolExecutor:
+    global _supabase_executor
+    if _supabase_executor is None:
+        _supabase_executor = ThreadPoolExecutor(max_workers=SUPABASE_MAX_WORKERS, thread_name_prefix="supabase")
+    return _supabase_executor
+
+async def _execute(query: Any, operation: str = "lainnya") -> Optional[APIResponse]:
+    """Menjalankan query Supabase (sinkron) di thread pool terbatas agar event loop tidak terblokir.
+
+    Semua thread berbagi satu klien httpx milik Supabase, sehingga koneksi HTTP tetap di-pool dan di-reuse.
+    Jumlah query yang berjalan bersamaan dibatasi oleh SUPABASE_MAX_WORKERS.
+    `operation` adalah label metrik latensi (nama operasi statis, sama dengan yang dipakai di log error).
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_get_supabase_executor(), query.execute)
+    except Exception:
+        SUPABASE_QUERY_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        SUPABASE_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+async def shutdown_supabase_executor():
+    """Menunggu query yang sedang berjalan selesai (di thread terpisah, bukan di event loop) lalu menutup thread pool Supabase."""
+    global _supabase_executor
+    executor, _supabase_executor = _supabase_executor, None
+    if executor is not None:
+        await asyncio.to_thread(executor.shutdown, wait=True)
+        logging.info("Thread pool Supabase telah ditutup.")
+
+def _is_supabase_response_error(operation_name: str, user_id: Optional[int], api_response: Optional[APIResponse], session_id: Optional[str] = None) -> bool:
+    if not api_response:
+        logging.error(f"Respons Supabase adalah None (kemungkinan error koneksi) saat {operation_name} untuk user {user_id}" + (f", session {session_id}" if session_id else ""))
+        return True
+
+    actual_error_obj = None
+    if hasattr(api_response, 'error'):
+        actual_error_obj = api_response.error
+
+    status_code_val = 0 
+    has_status_code_attr = hasattr(api_response, 'status_code')
+    if has_status_code_attr:
+        status_code_val = api_response.status_code
+    else:
+        if actual_error_obj is None: # Jika tidak ada error obj DAN tidak ada status code
+            logging.debug(f"Supabase: Atribut status_code tidak ditemukan pada APIResponse (dan tidak ada error obj) untuk {operation_name} user {user_id}.")
+            return False # Anggap sukses jika tidak ada error object yang jelas
+        # Jika ada error obj tapi tidak ada status_code, tetap log error
+        logging.warning(f"Supabase: Atribut status_code tidak ditemukan pada APIResponse untuk {operation_name} user {user_id} (ada error obj).")
+
+
+    is_error = False
+    if actual_error_obj is not None:
+        is_error = True
+    elif has_status_code_attr and not (200 <= status_code_val < 300):
+        is_error = True
+
+    if is_error:
+        error_message = "Unknown Supabase error"
+        status_code_to_log = status_code_val if has_status_code_attr else "N/A"
+
+        if actual_error_obj:
+            if hasattr(actual_error_obj, 'message') and actual_error_obj.message:
+                error_message = actual_error_obj.message
+            else:
+                error_message = str(actual_error_obj)
+        elif hasattr(api_response, 'data'):
+            if isinstance(api_response.data, dict) and 'message' in api_response.data:
+                error_message = api_response.data['message']
+            elif api_response.data is not None:
+                error_message = f"Operasi gagal dengan status {status_code_to_log}. Data: {str(api_response.data)[:150]}"
+        else:
+             error_message = f"Operasi gagal dengan status {status_code_to_log}."
+
+        log_session_id_str = f", session {session_id}" if session_id else ""
+        logging.error(
+            f"Supabase error (status: {status_code_to_log}) saat {operation_name} untuk user {user_id}{log_session_id_str}: {error_message}"
+        )
+        return True 
+
+    return False
+
+
+class SupabaseBackend(StorageBackend):
+    name = "supabase"
+
+    def __init__(self, client: Client):
+        self.client = client
+        self._user_context_rpc_available = True
+        self._retention_rpc_available = True
+
+    async def _checked(self, query: Any, operation: str, user_id: Optional[int], session_id: Optional[str] = None) -> APIResponse:
+        response = await _execute(query, operation)
+        if _is_supabase_response_error(operation, user_id, response, session_id=session_id):
+            raise StorageError(operation)
+        return response
+
+    async def _maybe_single(self, query: Any, operation: str, user_id: Optional[int], session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        # maybe_single() mengembalikan None (bukan APIResponse) jika baris tidak ada
+        response = await _execute(query, operation)
+        if response is None:
+            return None
+        if _is_supabase_response_error(operation, user_id, response, session_id=session_id):
+            raise StorageError(operation)
+        return response.data if isinstance(response.data, dict) else None
+
+    async def get_current_session_id(self, user_id: int) -> Optional[str]:
+        row = await self._maybe_single(
+            self.client.table("user_sessions").select("current_session_id").eq("user_id", user_id).maybe_single(), "mendapatkan sesi saat ini", user_id
+        )
+        return row.get("current_session_id") if row else None
+
+    async def set_current_session_id(self, user_id: int, session_id: str):
+        await self._checked(self.client.table("user_sessions").upsert({
+            "user_id": user_id, "current_session_id": session_id, "updated_at": "now()"
+        }), "upsert sesi baru", user_id)
+
+    async def delete_session_messages(self, user_id: int, session_id: str):
+        await self._checked(
+            self.client.table("chat_messages").delete(returning=ReturnMethod.minimal).eq("user_id", user_id).eq("session_id", session_id),
+            "menghapus pesan lama", user_id, session_id
+        )
+
+    async def insert_messages(self, rows: List[Dict[str, Any]]):
+        operation = "bulk insert pesan riwayat" if len(rows) > 1 else "menambahkan pesan ke riwayat"
+        await self._checked(self.client.table("chat_messages").insert(rows if len(rows) > 1 else rows[0]), operation, rows[0].get("user_id") if len(rows) == 1 else None)
+
+    async def fetch_recent_messages(self, user_id: int, session_id: str, limit: int) -> List[Dict[str, str]]:
+        response = await self._checked(self.client.table("chat_messages").select("role, content, created_at")
+            .eq("user_id", user_id).eq("session_id", session_id)
+            .order("created_at", desc=True).limit(limit), "mengambil riwayat", user_id, session_id)
+        return [{"role": item["role"], "content": item["content"], "created_at": item.get("created_at")} for item in reversed(response.data or [])]
+
+    async def fetch_messages_between(self, user_id: int, session_id: str, after: Optional[str], before: str, limit: int) -> List[Dict[str, str]]:
+        query = self.client.table("chat_messages").select("role, content, created_at").eq("user_id", user_id).eq("session_id", session_id)
+        if after:
+            query = query.gt("created_at", after)
+        response = await self._checked(query.lt("created_at", before).order("created_at").limit(limit), "mengambil rentang riwayat", user_id, session_id)
+        return [{"role": item["role"], "content": item["content"], "created_at": item.get("created_at")} for item in response.data or []]
+
+    async def get_preferences(self, user_id: int) -> Optional[Dict[str, Optional[str]]]:
+        return await self._maybe_single(
+            self.client.table("user_preferences").select(", ".join(PREFERENCE_COLUMNS)).eq("user_id", user_id).maybe_single(), "mengambil preferensi", user_id
+        )
+
+    async def upsert_preference(self, user_id: int, column: str, value: str) -> Optional[Dict[str, Any]]:
+        operation = "menyimpan preferensi bahasa" if column == "preferred_language_code" else "menyimpan preferensi model"
+        response = await self._checked(self.client.table("user_preferences").upsert({
+            "user_id": user_id, column: value, "updated_at": "now()"
+        }), operation, user_id)
+        if isinstance(response.data, list) and response.data and isinstance(response.data[0], dict):
+            return response.data[0]
+        return None
+
+    async def get_session_summary(self, user_id: int, session_id: str) -> Optional[Dict[str, Optional[str]]]:
+        return await self._maybe_single(
+            self.client.table("chat_session_summaries").select("summary, summarized_through").eq("session_id", session_id).maybe_single(),
+            "mengambil ringkasan sesi", user_id, session_id
+        )
+
+    async def save_session_summary(self, user_id: int, session_id: str, summary: str, summarized_through: str):
+        await self._checked(self.client.table("chat_session_summaries").upsert({
+            "session_id": session_id,
+            "user_id": user_id,
+            "summary": summary,
+            "summarized_through": summarized_through,
+            "updated_at": "now()"
+        }), "menyimpan ringkasan sesi", user_id, session_id)
+
+    async def fetch_user_context(self, user_id: int, history_limit: int) -> Optional[Dict[str, Any]]:
+        """Satu round trip lewat RPC get_user_context (lihat sql/get_user_context.sql)."""
+        if not self._user_context_rpc_available:
+            return None
+        try:
+            response = await self._checked(
+                self.client.rpc("get_user_context", {"p_user_id": user_id, "p_history_limit": history_limit}), "memuat konteks pengguna (RPC)", user_id
+            )
+        except StorageError:
+            raise
+        except Exception as e:
+            if getattr(e, "code", None) == "PGRST202": # Fungsi tidak ditemukan di schema cache PostgREST
+                self._user_context_rpc_available = False
+                logging.warning("Fungsi RPC get_user_context belum dipasang (lihat sql/get_user_context.sql). Memakai query terpisah.")
+                return None
+            raise
+        if not isinstance(response.data, dict):
+            logging.error(f"RPC get_user_context mengembalikan data tak terduga untuk user {user_id}: {str(response.data)[:150]}")
+            raise StorageError("memuat konteks pengguna (RPC)")
+        return response.data
+
+    async def _retention_rpc(self, function: str, params: Dict[str, Any], operation: str, user_id: Optional[int] = None) -> Optional[APIResponse]:
+        """RPC dari sql/chat_messages_retention.sql. None jika fungsinya belum dipasang."""
+        if not self._retention_rpc_available:
+            return None
+        try:
+            return await self._checked(self.client.rpc(function, params), operation, user_id)
+        except StorageError:
+            raise
+        except Exception as e:
+            if getattr(e, "code", None) == "PGRST202":
+                self._retention_rpc_available = False
+                logging.warning(
+                    f"Fungsi RPC {function} belum dipasang (lihat sql/chat_messages_retention.sql). "
+                    "Retensi umur/jumlah sesi nonaktif; pesan sesi lama dihapus dengan DELETE biasa."
+                )
+                return None
+            raise
+
+    async def purge_session_messages(self, user_id: int, session_id: str, batch_size: int) -> int:
+        response = await self._retention_rpc(
+            "purge_session_messages", {"p_user_id": user_id, "p_session_id": session_id, "p_batch_size": batch_size},
+            "retensi: menghapus pesan sesi", user_id
+        )
+        if response is None:
+            await self.delete_session_messages(user_id, session_id)
+            return 0
+        return int(response.data or 0)
+
+    async def delete_session_summary(self, session_id: str):
+        await self._checked(
+            self.client.table("chat_session_summaries").delete(returning=ReturnMethod.minimal).eq("session_id", session_id),
+            "retensi: menghapus ringkasan sesi", None, session_id
+        )
+
+    async def purge_expired_messages(self, older_than: str, batch_size: int) -> Optional[int]:
+        response = await self._retention_rpc(
+            "purge_expired_messages", {"p_older_than": older_than, "p_batch_size": batch_size}, "retensi: menghapus pesan kedaluwarsa"
+        )
+        return None if response is None else int(response.data or 0)
+
+    async def find_excess_sessions(self, max_sessions: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+        response = await self._retention_rpc(
+            "find_excess_sessions", {"p_max_sessions": max_sessions, "p_limit": limit}, "retensi: mencari sesi berlebih"
+        )
+        if response is None:
+            return None
+        return [(row["user_id"], row["session_id"]) for row in response.data or []]
+
+    async def table_stats(self) -> Optional[Dict[str, int]]:
+        response = await self._retention_rpc("chat_messages_table_stats", {}, "retensi: ukuran tabel")
+        if response is None or not isinstance(response.data, dict):
+            return None
+        return {"rows": int(response.data.get("rows") or 0), "bytes": int(response.data.get("bytes") or 0)}
+
+    async def close(self):
+        await shutdown_supabase_executor()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name, "max_workers": SUPABASE_MAX_WORKERS,
+            "user_context_rpc": self._user_context_rpc_available, "retention_rpc": self._retention_rpc_available,
+        }
+
+
+def create_supabase_backend() -> Optional[SupabaseBackend]:
+    if not (SUPABASE_URL and SUPABASE_SERVICE_KEY):
+        logging.warning("SUPABASE_URL atau SUPABASE_SERVICE_KEY tidak ada. Klien Supabase tidak diinisialisasi.")
+        return None
+    try:
+        client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        logging.info("Klien Supabase berhasil diinisialisasi.")
+        return SupabaseBackend(client)
+    except Exception as e:
+        logging.error(f"Gagal menginisialisasi klien Supabase: {e}")
+        return None
@@ -0,0 +1,289 @@
+"""
+Penjadwal pesan keluar ke Telegram (request middleware pada sesi bot).
+
+Semua pemanggilan Send*/Edit*/Copy*/Forward* yang punya chat_id melewati penjadwal ini, jadi handler tetap memakai
+message.reply / edit_text / bot.send_message seperti biasa:
+- anggaran laju global (~30 pesan/detik, dibagi rata antar proses worker) dan per chat (private vs grup);
+- TelegramRetryAfter ditangani otomatis: chat dijeda selama retry_after lalu request dicoba lagi;
+- edit yang masih antri untuk pesan yang sama digabung, hanya teks terbaru yang dikirim;
+- jawaban final didahulukan dari edit progres (lihat progress_priority()).
+Metode lain (getUpdates, answerCallbackQuery, sendChatAction, ...) diteruskan langsung.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from config import (
+    WORKER_PROCESSES,
+    TELEGRAM_GLOBAL_RATE_PER_SECOND,
+    TELEGRAM_PRIVATE_CHAT_RATE_PER_SECOND,
+    TELEGRAM_PRIVATE_CHAT_BURST,
+    TELEGRAM_GROUP_CHAT_RATE_PER_MINUTE,
+    TELEGRAM_GROUP_CHAT_BURST,
+    TELEGRAM_RETRY_AFTER_MAX_RETRIES,
+    FLOOD_BUCKET_MAX_ENTRIES,
+    FLOOD_BUCKET_IDLE_SECONDS
+)
+from flood_control import BucketRate, TokenBucketStore
+
+PRIORITY_FINAL = 0
+PRIORITY_PROGRESS = 1
+
+_SCHEDULED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+_UNSCHEDULED_METHODS = {"SendChatAction"}
+_GLOBAL_KEY = ("global", 0)
+
+_outbound_priority: ContextVar[int] = ContextVar("telegram_outbound_priority", default=PRIORITY_FINAL)
+
+
+@contextmanager
+def progress_priority() -> Iterator[None]:
+    """Request Telegram di dalam blok ini dijadwalkan sebagai edit progres (kalah prioritas dari jawaban final)."""
+    token = _outbound_priority.set(PRIORITY_PROGRESS)
+    try:
+        yield
+    finally:
+        _outbound_priority.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "chat_id", "coalesce_key", "make_request", "bot", "method", "futures", "attempts", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, chat_id: int, coalesce_key: Optional[Hashable],
+                 make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.coalesce_key = coalesce_key
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.futures: List[asyncio.Future] = [asyncio.get_running_loop().create_future()]
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+    @property
+    def sort_key(self) -> Tuple[int, int]:
+        return (self.priority, self.seq)
+
+
+class _Lane:
+    """Antrian satu chat. Isinya kecil (beberapa request), jadi pemilihan kepala cukup dengan min() linear."""
+    __slots__ = ("pending", "paused_until")
+
+    def __init__(self):
+        self.pending: List[_Ticket] = []
+        self.paused_until = 0.0
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(self):
+        # Setiap proses worker punya sesi bot sendiri, sedangkan batas global Telegram berlaku per bot
+        global_rate = TELEGRAM_GLOBAL_RATE_PER_SECOND / max(1, WORKER_PROCESSES)
+        self.global_rate: BucketRate = (max(1.0, global_rate), global_rate)
+        self.private_rate: BucketRate = (max(1.0, TELEGRAM_PRIVATE_CHAT_BURST), TELEGRAM_PRIVATE_CHAT_RATE_PER_SECOND)
+        self.group_rate: BucketRate = (max(1.0, TELEGRAM_GROUP_CHAT_BURST), TELEGRAM_GROUP_CHAT_RATE_PER_MINUTE / 60.0)
+        self.store = TokenBucketStore(FLOOD_BUCKET_MAX_ENTRIES, FLOOD_BUCKET_IDLE_SECONDS)
+        self._lanes: Dict[int, _Lane] = {}
+        self._queued_edits: Dict[Hashable, _Ticket] = {}
+        # Edit ke pesan yang sama tidak pernah berjalan paralel: edit progres yang lambat bisa menimpa teks final
+        self._editing: Set[Hashable] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._executing: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retry_after_events = 0
+        self.failed = 0
+        self.max_wait_seconds = 0.0
+
+    def _rate_for(self, chat_id: int) -> BucketRate:
+        # chat_id positif = chat private dengan pengguna; negatif = grup, supergrup, atau channel
+        return self.private_rate if chat_id > 0 else self.group_rate
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        method_name = type(method).__name__
+        chat_id = getattr(method, "chat_id", None)
+        if (
+            not isinstance(chat_id, int) or method_name in _UNSCHEDULED_METHODS
+            or not method_name.startswith(_SCHEDULED_PREFIXES)
+        ):
+            # Username channel (@nama) atau metode tanpa chat: tidak dijadwalkan
+            return await make_request(bot, method)
+
+        coalesce_key = None
+        message_id = getattr(method, "message_id", None)
+        if method_name.startswith("Edit") and message_id is not None:
+            coalesce_key = (method_name, chat_id, message_id)
+        ticket = _Ticket(_outbound_priority.get(), next(self._seq), chat_id, coalesce_key, make_request, bot, method)
+        future = ticket.futures[0]
+        self._enqueue(ticket)
+        self._ensure_runner()
+        return await future
+
+    def _enqueue(self, ticket: _Ticket):
+        existing = self._queued_edits.get(ticket.coalesce_key) if ticket.coalesce_key else None
+        if existing is not None:
+            # Edit lama yang belum terkirim digantikan; semua pemanggil menerima hasil edit terbaru
+            if ticket.seq > existing.seq:
+                existing.method = ticket.method
+                existing.make_request = ticket.make_request
+            existing.priority = min(existing.priority, ticket.priority)
+            existing.futures.extend(ticket.futures)
+            self.coalesced += 1
+            return
+        lane = self._lanes.get(ticket.chat_id)
+        if lane is None:
+            lane = self._lanes[ticket.chat_id] = _Lane()
+        lane.pending.append(ticket)
+        if ticket.coalesce_key:
+            self._queued_edits[ticket.coalesce_key] = ticket
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_runner(self):
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run(), name="telegram-outbound")
+
+    def _next_ready(self, now: float) -> Tuple[Optional[_Ticket], Optional[float]]:
+        """Tiket siap kirim dengan prioritas terbaik, atau (None, detik_tunggu_berikutnya)."""
+        global_bucket = self.store.get(_GLOBAL_KEY, self.global_rate, now)
+        if global_bucket.tokens < 1:
+            return None, (1 - global_bucket.tokens) / self.global_rate[1]
+
+        best: Optional[_Ticket] = None
+        best_lane: Optional[_Lane] = None
+        min_wait: Optional[float] = None
+        for chat_id, lane in list(self._lanes.items()):
+            if not lane.pending:
+                if lane.paused_until <= now:
+                    del self._lanes[chat_id]
+                continue
+            rate = self._rate_for(chat_id)
+            bucket = self.store.get(("chat", chat_id), rate, now)
+            wait = max(lane.paused_until - now, (1 - bucket.tokens) / rate[1] if bucket.tokens < 1 else 0.0)
+            if wait > 0:
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+                continue
+            ready = [ticket for ticket in lane.pending if ticket.coalesce_key not in self._editing]
+            if not ready:
+                continue
+            head = min(ready, key=lambda ticket: ticket.sort_key)
+            if best is None or head.sort_key < best.sort_key:
+                best, best_lane = head, lane
+        if best is None:
+            return None, min_wait
+
+        best_lane.pending.remove(best)
+        if best.coalesce_key:
+            if self._queued_edits.get(best.coalesce_key) is best:
+                del self._queued_edits[best.coalesce_key]
+            self._editing.add(best.coalesce_key)
+        global_bucket.tokens -= 1
+        self.store.get(("chat", best.chat_id), self._rate_for(best.chat_id), now).tokens -= 1
+        return best, None
+
+    async def _run(self):
+        while True:
+            ticket, wait = self._next_ready(time.monotonic())
+            if ticket is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._in_flight += 1
+            task = asyncio.create_task(self._execute(ticket))
+            self._executing.add(task)
+            task.add_done_callback(self._executing.discard)
+
+    async def _execute(self, ticket: _Ticket):
+        self.max_wait_seconds = max(self.max_wait_seconds, time.monotonic() - ticket.enqueued_at)
+        try:
+            result = await ticket.make_request(ticket.bot, ticket.method)
+        except TelegramRetryAfter as e:
+            self.retry_after_events += 1
+            lane = self._lanes.get(ticket.chat_id)
+            if lane is None:
+                lane = self._lanes[ticket.chat_id] = _Lane()
+            lane.paused_until = max(lane.paused_until, time.monotonic() + e.retry_after)
+            if ticket.attempts < TELEGRAM_RETRY_AFTER_MAX_RETRIES:
+                ticket.attempts += 1
+                logging.warning(f"Telegram RetryAfter {e.retry_after}s untuk chat {ticket.chat_id}; dicoba lagi (percobaan {ticket.attempts}).")
+                self._enqueue(ticket)
+            else:
+                self._resolve(ticket, exception=e)
+        except asyncio.CancelledError:
+            self._resolve(ticket, exception=RuntimeError("Penjadwal pesan keluar Telegram sudah dihentikan"))
+            raise
+        except Exception as e:
+            self._resolve(ticket, exception=e)
+        else:
+            self.sent += 1
+            self._resolve(ticket, result=result)
+        finally:
+            self._in_flight -= 1
+            if ticket.coalesce_key:
+                self._editing.discard(ticket.coalesce_key)
+                self._wakeup.set()
+
+    def _resolve(self, ticket: _Ticket, result: Any = None, exception: Optional[BaseException] = None):
+        if exception is not None:
+            self.failed += 1
+        for future in ticket.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def pending_count(self) -> int:
+        return sum(len(lane.pending) for lane in self._lanes.values())
+
+    async def close(self, timeout: float = 10.0):
+        """Menunggu antrian kosong (paling lama `timeout` detik), lalu menghentikan penjadwal dan request yang masih berjalan."""
+        deadline = time.monotonic() + timeout
+        while (self.pending_count() or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        if self._executing:
+            executing = list(self._executing)
+            _, unfinished = await asyncio.wait(executing, timeout=max(0.0, deadline - time.monotonic()))
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*executing, return_exceptions=True)
+        for lane in self._lanes.values():
+            for ticket in lane.pending:
+                self._resolve(ticket, exception=RuntimeError("Penjadwal pesan keluar Telegram sudah dihentikan"))
+        self._lanes.clear()
+        self._queued_edits.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending_count(),
+            "in_flight": self._in_flight,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retry_after": self.retry_after_events,
+            "failed": self.failed,
+            "max_wait_ms": round(self.max_wait_seconds * 1000),
+        }
+
+
+outbound_scheduler = OutboundScheduler()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modul repo berada di root (tanpa paket); config.py mewajibkan token, jadi isi nilai dummy untuk pengujian
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("MISTRAL_API_KEY", "test")
@@ -0,0 +1,33 @@
+from flood_control import _EVICTION_CHECK_EVERY, TokenBucketStore
+
+_RATE = (5.0, 1.0)
+
+
+def test_idle_buckets_are_evicted_without_new_keys():
+    store = TokenBucketStore(max_entries=1000, idle_seconds=60)
+    for user_id in range(100):
+        store.get(("user", user_id), _RATE, now=0.0)
+    assert len(store) == 100
+    # Hanya satu pengguna yang tetap aktif; tidak ada bucket baru yang memicu eviksi
+    for step in range(_EVICTION_CHECK_EVERY):
+        store.get(("user", 0), _RATE, now=120.0 + step)
+    assert len(store) == 1
+    assert store.evictions == 99
+
+
+def test_max_entries_keeps_most_recent_buckets():
+    store = TokenBucketStore(max_entries=3, idle_seconds=3600)
+    for user_id in range(5):
+        store.get(("user", user_id), _RATE, now=float(user_id))
+    assert len(store) == 3
+    bucket = store.get(("user", 0), _RATE, now=10.0)
+    # Bucket yang sudah dibuang dibuat ulang dalam keadaan penuh
+    assert bucket.tokens == _RATE[0]
+
+
+def test_tokens_refill_up_to_capacity():
+    store = TokenBucketStore(max_entries=10, idle_seconds=3600)
+    bucket = store.get(("user", 1), _RATE, now=0.0)
+    bucket.tokens = 0.0
+    assert store.get(("user", 1), _RATE, now=2.0).tokens == 2.0
+    assert store.get(("user", 1), _RATE, now=100.0).tokens == _RATE[0]
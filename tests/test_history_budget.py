@@ -0,0 +1,115 @@
+import asyncio
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import history_budget
+
+_START = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def _message(index: int, content: str = None) -> dict:
+    return {
+        "role": "user" if index % 2 == 0 else "assistant",
+        "content": content or f"pesan {index}",
+        "created_at": (_START + timedelta(seconds=index)).isoformat(),
+    }
+
+
+class _FakeSession:
+    """Storage dan model peringkas palsu untuk satu sesi."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.summary = {"summary": None, "summarized_through": None}
+        self.summarized = []
+
+    async def get_session_summary(self, user_id, session_id):
+        return dict(self.summary)
+
+    async def save_session_summary(self, user_id, session_id, summary, summarized_through):
+        self.summary = {"summary": summary, "summarized_through": summarized_through}
+
+    async def get_messages_between(self, user_id, session_id, after, before, limit):
+        after_time = datetime.fromisoformat(after) if after else None
+        before_time = datetime.fromisoformat(before)
+        selected = [
+            message for message in self.messages
+            if (after_time is None or datetime.fromisoformat(message["created_at"]) > after_time)
+            and datetime.fromisoformat(message["created_at"]) < before_time
+        ]
+        return selected[:limit]
+
+    async def complete_chat(self, client, model, messages, max_tokens=None):
+        transcript = messages[-1]["content"].split("New messages:\n", 1)[1]
+        self.summarized.extend(transcript.split("\n\n"))
+        return f"ringkasan {len(self.summarized)}"
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = _FakeSession([])
+    monkeypatch.setattr(history_budget, "HISTORY_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(history_budget, "MISTRAL_SYSTEM_PROMPT", "")
+    monkeypatch.setattr(history_budget, "MAX_HISTORY_MESSAGES", 10)
+    monkeypatch.setattr(history_budget, "MODEL_HISTORY_TOKEN_BUDGETS", {})
+    monkeypatch.setattr(history_budget, "is_storage_enabled", lambda: True)
+    monkeypatch.setattr(history_budget, "get_session_summary", fake.get_session_summary)
+    monkeypatch.setattr(history_budget, "save_session_summary", fake.save_session_summary)
+    monkeypatch.setattr(history_budget, "get_messages_between", fake.get_messages_between)
+    monkeypatch.setattr(history_budget, "complete_chat", fake.complete_chat)
+    monkeypatch.setattr(history_budget.mistral_scheduler, "slot", lambda *args: contextlib.nullcontext())
+    return fake
+
+
+async def _build(fake: _FakeSession, window: int = 9, budget: int = 100000):
+    # Jendela = window pesan tersimpan terakhir + prompt baru (belum punya created_at)
+    conversation = fake.messages[-window:] + [{"role": "user", "content": "prompt"}]
+    history_budget.MODEL_HISTORY_TOKEN_BUDGETS["uji"] = budget
+    messages = await history_budget.build_prompt_messages(None, "uji", 1, "sesi", conversation)
+    await asyncio.gather(*history_budget._background_tasks)
+    return messages
+
+
+def test_messages_sliding_out_of_window_are_summarized_once(session):
+    async def scenario():
+        session.messages = [_message(i) for i in range(20)]
+        await _build(session)
+        # Semua pesan sebelum jendela 9 pesan terakhir (plus balasan assistant di awal jendela yang tidak dikirim)
+        # masuk ringkasan, urut dan tanpa duplikat
+        assert session.summarized == [f"{m['role']}: {m['content']}" for m in session.messages[:12]]
+        session.messages += [_message(20), _message(21)]
+        await _build(session)
+        assert session.summarized[12:] == [f"{m['role']}: {m['content']}" for m in session.messages[12:14]]
+        # Tidak ada pesan baru yang bergeser keluar: tidak ada panggilan ringkasan lagi
+        before = len(session.summarized)
+        await _build(session)
+        assert len(session.summarized) == before
+
+    asyncio.run(scenario())
+
+
+def test_identical_short_turns_do_not_collide(session):
+    async def scenario():
+        session.messages = [_message(i, "ok") for i in range(14)]
+        await _build(session)
+        assert len(session.summarized) == 6
+        session.messages += [_message(14, "ok"), _message(15, "ok")]
+        await _build(session)
+        assert len(session.summarized) == 8
+
+    asyncio.run(scenario())
+
+
+def test_messages_dropped_by_budget_are_summarized_without_refolding(session):
+    async def scenario():
+        session.messages = [_message(i, "x" * 300) for i in range(6)]
+        messages = await _build(session, window=6, budget=250)
+        assert all("created_at" not in message for message in messages)
+        first_round = list(session.summarized)
+        assert first_round
+        await _build(session, window=6, budget=250)
+        assert session.summarized == first_round
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from history_retention import RetentionJob
+from sqlite_backend import SqliteBackend
+
+
+def _job(**overrides) -> RetentionJob:
+    options = dict(
+        max_age_days=0, max_sessions_per_user=0, sweep_interval=3600,
+        batch_size=2, batch_pause=0, session_purge_delay=30,
+    )
+    options.update(overrides)
+    return RetentionJob(**options)
+
+
+async def _add_messages(backend: SqliteBackend, user_id: int, session_id: str, count: int):
+    await backend.insert_messages([
+        {"user_id": user_id, "session_id": session_id, "role": "user", "content": f"pesan {index}",
+         "created_at": f"2026-01-01T00:00:{index:02d}+00:00"}
+        for index in range(count)
+    ])
+
+
+async def _session_ids(backend: SqliteBackend, user_id: int) -> set:
+    rows = backend._connection.execute("SELECT DISTINCT session_id FROM chat_messages WHERE user_id = ?", (user_id,)).fetchall()
+    return {row[0] for row in rows}
+
+
+def test_sweep_purges_sessions_left_behind_by_lost_newchat_purge(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "retensi.db"))
+
+    async def scenario():
+        # /newchat sebelum crash: sesi lama sudah bukan sesi aktif, tapi antrian penghapusannya hilang bersama proses
+        await _add_messages(backend, 1, "sesi-lama", 5)
+        await _add_messages(backend, 1, "sesi-baru", 3)
+        await backend.set_current_session_id(1, "sesi-baru")
+        await _add_messages(backend, 2, "sesi-aktif", 2)
+        await backend.set_current_session_id(2, "sesi-aktif")
+
+        job = _job() # kedua batas 0 (default)
+        job._backend = backend
+        result = await job.sweep()
+
+        assert await _session_ids(backend, 1) == {"sesi-baru"}
+        assert await _session_ids(backend, 2) == {"sesi-aktif"}
+        assert result["purged"]["abandoned_session"] == 5
+        assert job.rows_purged["abandoned_session"] == 5
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_sweep_leaves_sessions_still_waiting_for_delayed_purge(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "retensi.db"))
+
+    async def scenario():
+        await _add_messages(backend, 1, "sesi-lama", 4)
+        await _add_messages(backend, 1, "sesi-baru", 1)
+        await backend.set_current_session_id(1, "sesi-baru")
+
+        job = _job()
+        job._backend = backend
+        job._pending.append((time.monotonic() + 30, 1, "sesi-lama")) # dijadwalkan /newchat, jeda belum habis
+        result = await job.sweep()
+
+        # Jeda penghapusan dihormati: baris write-behind sesi lama mungkin belum selesai ditulis
+        assert await _session_ids(backend, 1) == {"sesi-lama", "sesi-baru"}
+        assert result["purged"]["abandoned_session"] == 0
+        await backend.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from json_i18n_service import JsonI18n
+
+
+def _write_locales(path, catalogs):
+    for locale, data in catalogs.items():
+        with open(os.path.join(path, f"{locale}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+@pytest.fixture
+def i18n(tmp_path):
+    _write_locales(tmp_path, {
+        "en": {
+            "greeting": "Hello {name}",
+            "escaped": "Use {{braces}} literally",
+            "mixed": "{{{name}}}",
+            "plain": "No placeholders",
+            "broken": "Broken {template",
+            "only_en": "Fallback {name}",
+        },
+        "id": {
+            "greeting": "Halo {name}",
+            "escaped": "Pakai {{kurung}} apa adanya",
+        },
+    })
+    return JsonI18n(str(tmp_path), default_locale="en")
+
+
+def test_placeholders_are_formatted(i18n):
+    assert i18n.gettext("greeting", name="Ani") == "Hello Ani"
+    assert i18n.gettext("greeting", locale_override="id", name="Ani") == "Halo Ani"
+
+
+def test_escaped_braces_render_like_str_format(i18n):
+    assert i18n.gettext("escaped", name="Ani") == "Use {braces} literally"
+    assert i18n.gettext("escaped", locale_override="id", name="Ani") == "Pakai {kurung} apa adanya"
+    assert i18n.gettext("mixed", name="Ani") == "{Ani}"
+
+
+def test_without_kwargs_template_is_returned_unformatted(i18n):
+    assert i18n.gettext("escaped") == "Use {{braces}} literally"
+    assert i18n.gettext("plain", name="Ani") == "No placeholders"
+
+
+def test_invalid_template_and_missing_placeholder_return_raw_text(i18n):
+    assert i18n.gettext("broken", name="Ani") == "Broken {template"
+    assert i18n.gettext("greeting", other="x") == "Hello {name}"
+
+
+def test_missing_key_falls_back_to_default_locale_and_default(i18n):
+    assert i18n.gettext("only_en", locale_override="id", name="Ani") == "Fallback Ani"
+    assert i18n.gettext("unknown", default="cadangan") == "cadangan"
+    assert i18n.gettext("greeting", locale_override="xx", name="Ani") == "Hello Ani"
+
+
+def test_reload_swaps_catalog(i18n, tmp_path):
+    version = i18n.catalog_version
+    _write_locales(tmp_path, {"id": {"greeting": "Hai {name}!!", "escaped": "{{x}}"}})
+    assert i18n.reload()
+    assert i18n.catalog_version == version + 1
+    assert i18n.gettext("greeting", locale_override="id", name="Ani") == "Hai Ani!!"
+    assert i18n.gettext("escaped", locale_override="id", name="Ani") == "{x}"
+    assert not i18n.reload()
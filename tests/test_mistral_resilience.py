@@ -0,0 +1,285 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from aiohttp import web
+from mistralai import Mistral
+from mistralai.models import MistralError
+
+import mistral_resilience
+from mistral_scheduler import PRIORITY_PRIVATE, MistralScheduler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from load_harness import StubOptions, _free_port, make_stub_app # noqa: E402
+
+PRIMARY = "mistral-small-latest"
+FALLBACK = "open-mistral-nemo"
+
+
+def _http_error(status_code: int, retry_after: str = None) -> MistralError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(status_code, headers=headers, text="error", request=httpx.Request("POST", "http://stub"))
+    return MistralError(f"HTTP {status_code}", response)
+
+
+class _FakeModels:
+    """Pengganti stream_chat_completion/complete_chat dengan perilaku per model: daftar langkah per percobaan."""
+
+    def __init__(self):
+        self.behaviour = {}
+        self.calls = []
+        self.cancelled = []
+        self.closed = []
+
+    async def stream(self, client, model, messages):
+        self.calls.append(model)
+        step = self.behaviour[model].pop(0) if len(self.behaviour[model]) > 1 else self.behaviour[model][0]
+        try:
+            if isinstance(step, BaseException):
+                raise step
+            delay, chunks = step
+            await asyncio.sleep(delay)
+            for chunk in chunks:
+                yield chunk
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        finally:
+            self.closed.append(model)
+
+    async def complete(self, client, model, messages, max_tokens=None):
+        chunks = [chunk async for chunk in self.stream(client, model, messages)]
+        return "".join(chunks)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    fake = _FakeModels()
+    scheduler = MistralScheduler()
+    monkeypatch.setattr(mistral_resilience, "stream_chat_completion", fake.stream)
+    monkeypatch.setattr(mistral_resilience, "complete_chat", fake.complete)
+    monkeypatch.setattr(mistral_resilience, "mistral_scheduler", scheduler)
+    monkeypatch.setattr(mistral_resilience, "_breakers", {})
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_FALLBACK_MODEL", FALLBACK)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_HEDGE_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_MAX_RETRIES", 2)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_RETRY_BASE_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_RETRY_MAX_DELAY_SECONDS", 0.5)
+    fake.scheduler = scheduler
+    return fake
+
+
+async def _stream_with_primary_slot(models, user_id: int = 1):
+    """Seperti handler: slot model utama dipegang selama stream; mencatat slot aktif model cadangan per potongan."""
+    chunks, fallback_active = [], []
+    async with models.scheduler.slot(PRIMARY, user_id, PRIORITY_PRIVATE):
+        stream = mistral_resilience.resilient_stream(None, PRIMARY, [], user_id)
+        async for chunk in stream:
+            chunks.append(chunk)
+            fallback_active.append(models.scheduler.stats().get(FALLBACK, {}).get("active", 0))
+    return chunks, fallback_active
+
+
+def test_hedge_winner_keeps_fallback_slot_until_stream_ends(models):
+    async def scenario():
+        models.behaviour = {PRIMARY: [(5.0, ["lambat"])], FALLBACK: [(0.0, ["a", "b", "c"])]}
+        chunks, fallback_active = await _stream_with_primary_slot(models)
+        assert chunks == ["a", "b", "c"]
+        # Batas konkurensi model cadangan berlaku selama stream: slotnya dipegang di setiap potongan
+        assert fallback_active == [1, 1, 1]
+        stats = models.scheduler.stats()
+        assert stats[FALLBACK]["active"] == 0 and stats[PRIMARY]["active"] == 0
+        # Model utama yang kalah dibatalkan
+        assert models.cancelled == [PRIMARY]
+
+    asyncio.run(scenario())
+
+
+def test_failover_after_primary_error(models, monkeypatch):
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_HEDGE_DELAY_SECONDS", 5.0)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_MAX_RETRIES", 0)
+    monkeypatch.setattr(mistral_resilience, "_counters", dict.fromkeys(mistral_resilience._counters, 0))
+
+    async def scenario():
+        models.behaviour = {PRIMARY: [_http_error(503)], FALLBACK: [(0.0, ["cadangan"])]}
+        chunks, _ = await _stream_with_primary_slot(models)
+        assert chunks == ["cadangan"]
+        assert models.calls == [PRIMARY, FALLBACK]
+        assert mistral_resilience._counters["failovers"] == 1
+        assert mistral_resilience._counters["hedges"] == 0
+        assert models.scheduler.stats()[FALLBACK]["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_hedge_win_cancels_slow_primary_for_complete(models, monkeypatch):
+    monkeypatch.setattr(mistral_resilience, "_counters", dict.fromkeys(mistral_resilience._counters, 0))
+
+    async def scenario():
+        models.behaviour = {PRIMARY: [(5.0, ["lambat"])], FALLBACK: [(0.0, ["cepat"])]}
+        async with models.scheduler.slot(PRIMARY, 1, PRIORITY_PRIVATE):
+            reply = await mistral_resilience.resilient_complete(None, PRIMARY, [], 1)
+        assert reply == "cepat"
+        assert models.cancelled == [PRIMARY]
+        assert mistral_resilience._counters["hedges"] == 1
+        assert mistral_resilience._counters["hedge_wins"] == 1
+        # Pembatalan model yang kalah tidak dihitung sebagai kegagalan model itu
+        assert mistral_resilience.get_circuit_breaker(PRIMARY).consecutive_failures == 0
+        assert models.scheduler.stats()[FALLBACK]["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_header_is_honoured(monkeypatch):
+    monkeypatch.setattr(mistral_resilience.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_RETRY_BASE_DELAY_SECONDS", 0.5)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_RETRY_MAX_DELAY_SECONDS", 8.0)
+    assert mistral_resilience.backoff_delay(0, _http_error(429, "3")) == 3.5
+    assert mistral_resilience.retry_after_seconds(_http_error(503, "Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
+    # Retry-After lebih lama dari batas: tidak dicoba ulang
+    assert mistral_resilience.backoff_delay(0, _http_error(503, "60")) is None
+    # Tanpa header: full jitter eksponensial dengan batas atas
+    assert [mistral_resilience.backoff_delay(attempt, _http_error(503)) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+
+
+def test_call_with_retries_backs_off_then_succeeds(models, monkeypatch):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def recording_sleep(delay, *args, **kwargs):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(mistral_resilience.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(mistral_resilience.asyncio, "sleep", recording_sleep)
+
+    async def scenario():
+        outcomes = [_http_error(503, "0.2"), httpx.ConnectError("putus"), "ok"]
+
+        async def attempt(model_id):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+
+        assert await mistral_resilience._call_with_retries(PRIMARY, attempt) == "ok"
+        # Percobaan 1: Retry-After 0.2 + jitter; percobaan 2: backoff eksponensial base * 2
+        assert sleeps == [pytest.approx(0.21), pytest.approx(0.02)]
+        breaker = mistral_resilience.get_circuit_breaker(PRIMARY)
+        assert breaker.state == breaker.CLOSED and breaker.consecutive_failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_and_exhausted_retries_are_raised(models):
+    async def scenario():
+        calls = []
+
+        async def bad_request(model_id):
+            calls.append(model_id)
+            raise _http_error(400)
+
+        with pytest.raises(MistralError):
+            await mistral_resilience._call_with_retries(PRIMARY, bad_request)
+        assert len(calls) == 1
+        assert mistral_resilience.get_circuit_breaker(PRIMARY).consecutive_failures == 0
+
+        async def unavailable(model_id):
+            calls.append(model_id)
+            raise _http_error(503)
+
+        calls.clear()
+        with pytest.raises(MistralError):
+            await mistral_resilience._call_with_retries(PRIMARY, unavailable)
+        assert len(calls) == 3 # MISTRAL_MAX_RETRIES = 2
+
+    asyncio.run(scenario())
+
+
+def test_circuit_breaker_open_half_open_closed(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(mistral_resilience.time, "monotonic", lambda: clock[0])
+    breaker = mistral_resilience.CircuitBreaker(PRIMARY, failure_threshold=2, cooldown_seconds=30)
+
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow() and not breaker.is_available()
+    assert breaker.retry_in() == 30
+
+    clock[0] += 30
+    assert breaker.is_available()
+    # Half-open: hanya satu request percobaan
+    assert breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.allow()
+    # Percobaan gagal: langsung terbuka lagi
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED and breaker.consecutive_failures == 0
+    assert breaker.allow() and breaker.allow()
+    assert breaker.times_opened == 2
+
+
+def test_open_circuit_rejects_without_calling_model(models, monkeypatch):
+    monkeypatch.setattr(mistral_resilience, "CIRCUIT_BREAKER_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_MAX_RETRIES", 0)
+
+    async def scenario():
+        calls = []
+
+        async def unavailable(model_id):
+            calls.append(model_id)
+            raise _http_error(503)
+
+        with pytest.raises(MistralError):
+            await mistral_resilience._call_with_retries(PRIMARY, unavailable)
+        with pytest.raises(mistral_resilience.CircuitOpenError):
+            await mistral_resilience._call_with_retries(PRIMARY, unavailable)
+        assert calls == [PRIMARY]
+
+    asyncio.run(scenario())
+
+
+def test_failover_and_retry_against_fault_injecting_stub(monkeypatch):
+    """Jalur sebenarnya (klien Mistral + stream_chat_completion) melawan stand-in Mistral dari load_harness."""
+    monkeypatch.setattr(mistral_resilience, "mistral_scheduler", MistralScheduler())
+    monkeypatch.setattr(mistral_resilience, "_breakers", {})
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_FALLBACK_MODEL", FALLBACK)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_HEDGE_DELAY_SECONDS", 5.0)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_MAX_RETRIES", 1)
+    monkeypatch.setattr(mistral_resilience, "MISTRAL_RETRY_BASE_DELAY_SECONDS", 0.01)
+
+    async def scenario():
+        options = StubOptions(
+            mistral_ttft_ms=5, mistral_tokens=4, mistral_token_interval_ms=1,
+            mistral_fault_models=PRIMARY, mistral_error_rate=1.0, mistral_error_status=503, mistral_retry_after_seconds=0.1,
+        )
+        app = make_stub_app(options)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = _free_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        async with httpx.AsyncClient() as http_client:
+            client = Mistral(api_key="test", server_url=f"http://127.0.0.1:{port}", async_client=http_client)
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            chunks = [chunk async for chunk in mistral_resilience.resilient_stream(client, PRIMARY, [{"role": "user", "content": "halo"}], 1)]
+            elapsed = loop.time() - started
+        await runner.cleanup()
+        assert "".join(chunks) == "token0 token1 token2 token3 "
+        requests = app["state"].requests
+        # Model utama: percobaan awal + 1 retry setelah Retry-After, lalu failover ke model cadangan
+        assert requests["mistral.fault.error"] == 2
+        assert requests["mistral.chat.stream"] == 3
+        assert elapsed >= 0.1
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+import asyncio
+
+import mistral_scheduler
+from mistral_scheduler import PRIORITY_PRIVATE, ModelAdmissionQueue
+
+
+def test_enqueue_notifies_only_new_ticket(monkeypatch):
+    monkeypatch.setattr(mistral_scheduler, "QUEUE_POSITION_UPDATE_INTERVAL_SECONDS", 3600)
+
+    async def scenario():
+        model_queue = ModelAdmissionQueue("uji", concurrency=1, max_queue=100)
+        await model_queue.acquire(0, PRIORITY_PRIVATE)
+        notified = {}
+
+        def recorder(user_id):
+            async def on_position(position):
+                notified.setdefault(user_id, []).append(position)
+            return on_position
+
+        waiters = []
+        for user_id in range(1, 21):
+            waiters.append(asyncio.create_task(model_queue.acquire(user_id, PRIORITY_PRIVATE, recorder(user_id))))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        # Satu pemberitahuan per tiket, bukan N per pesan masuk
+        assert notified == {user_id: [user_id] for user_id in range(1, 21)}
+
+        model_queue.release(0)
+        await asyncio.sleep(0)
+        # Tiket yang tergeser tetap dibatasi interval
+        assert all(len(positions) == 1 for positions in notified.values())
+        assert not mistral_scheduler._position_tasks
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+import pytest
+
+from markdown_utils import ensure_valid_markdown
+from reply_paginator import TELEGRAM_MESSAGE_LIMIT, _find_cut, _utf16_len, paginate_markdown
+
+
+def _long_prose(paragraphs: int) -> str:
+    return "\n\n".join(f"Paragraf {i}: " + "kata *tebal* dan `kode` biasa " * 20 for i in range(paragraphs))
+
+
+@pytest.mark.parametrize("text", [
+    _long_prose(40),
+    "😀" * 5000,
+    "𝔘𝔫𝔦𝔠𝔬𝔡𝔢 " * 1500,
+    ("teks 🚀 " * 300 + "\n") * 12,
+    "```python\n" + "print('😀')\n" * 900 + "```",
+    "x" * 20000,
+    "`" * 9000,
+])
+def test_every_page_fits_in_utf16_limit(text):
+    pages = paginate_markdown(text)
+    assert len(pages) > 1
+    for page in pages:
+        assert 0 < _utf16_len(page) <= TELEGRAM_MESSAGE_LIMIT
+
+
+def test_astral_characters_are_preserved():
+    text = "🚀𝔘 " * 3000
+    pages = paginate_markdown(text)
+    assert "".join(pages).replace(" ", "") == text.replace(" ", "")
+
+
+@pytest.mark.parametrize("text", [
+    "Halo *dunia*",
+    "Kode `belum ditutup",
+    "```js\nconsole.log(1)\n",
+    "_miring_ dan ~coret",
+    "😀" * 2000,
+    "a" * TELEGRAM_MESSAGE_LIMIT,
+])
+def test_single_page_reply_matches_ensure_valid_markdown(text):
+    assert paginate_markdown(text) == [ensure_valid_markdown(text)]
+
+
+def test_code_fence_across_cut_is_closed_and_reopened_with_language():
+    text = "Contoh:\n```python\n" + "print('baris')\n" * 800 + "```\nselesai"
+    pages = paginate_markdown(text)
+    assert len(pages) > 1
+    for page in pages:
+        # Setiap halaman seimbang: jumlah ``` genap
+        assert page.count("```") % 2 == 0
+    for page in pages[:-1]:
+        assert page.endswith("\n```")
+    for page in pages[1:]:
+        assert page.startswith("```python\n")
+    assert pages[-1].endswith("```\nselesai")
+
+
+@pytest.mark.parametrize("run_length", [2, 3, 4, 7, 12])
+@pytest.mark.parametrize("offset", range(-12, 1))
+def test_forced_cut_never_splits_backtick_run(run_length, offset):
+    budget = 100
+    run_start = budget + offset
+    text = "x" * run_start + "`" * run_length + "y" * 200
+    cut, skipped = _find_cut(text, 0, budget)
+    assert skipped == 0
+    assert 0 < cut <= budget
+    assert not (text[cut - 1] == "`" and text[cut] == "`")
+
+
+def test_page_cut_moves_before_backtick_run():
+    text = "x" * 4070 + "`" * 12 + "y" * 5000
+    pages = paginate_markdown(text)
+    assert pages[0] == "x" * 4070
+    assert pages[1].startswith("`" * 12 + "y")
@@ -0,0 +1,122 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMessage
+
+from telegram_outbound import OutboundScheduler, progress_priority
+
+
+class _FakeTelegram:
+    """make_request palsu: mencatat urutan request dan bisa membalas RetryAfter sekali per teks."""
+
+    def __init__(self, retry_after_texts=(), delay: float = 0.0):
+        self.calls = []
+        self.retry_after_texts = set(retry_after_texts)
+        self.delay = delay
+
+    async def __call__(self, bot, method):
+        self.calls.append((method.chat_id, method.text))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if method.text in self.retry_after_texts:
+            self.retry_after_texts.discard(method.text)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        return f"ok {method.text}"
+
+
+def _scheduler(chat_burst: float = 1.0, chat_rate: float = 50.0) -> OutboundScheduler:
+    scheduler = OutboundScheduler()
+    scheduler.global_rate = (1000.0, 1000.0)
+    scheduler.private_rate = scheduler.group_rate = (chat_burst, chat_rate)
+    return scheduler
+
+
+def test_requests_keep_order_within_each_chat():
+    async def scenario():
+        scheduler = _scheduler()
+        telegram = _FakeTelegram(delay=0.001)
+        calls = [
+            scheduler(telegram, None, SendMessage(chat_id=chat_id, text=f"{chat_id}-{i}"))
+            for i in range(5) for chat_id in (1, -2)
+        ]
+        await asyncio.gather(*calls)
+        await scheduler.close()
+        for chat_id in (1, -2):
+            assert [text for chat, text in telegram.calls if chat == chat_id] == [f"{chat_id}-{i}" for i in range(5)]
+        assert scheduler.sent == 10
+
+    asyncio.run(scenario())
+
+
+def test_final_reply_goes_before_queued_progress_edits():
+    async def scenario():
+        scheduler = _scheduler()
+        telegram = _FakeTelegram()
+
+        async def progress(text):
+            with progress_priority():
+                return await scheduler(telegram, None, SendMessage(chat_id=1, text=text))
+
+        calls = [progress("progres 1"), progress("progres 2"), scheduler(telegram, None, SendMessage(chat_id=1, text="final"))]
+        await asyncio.gather(*calls)
+        await scheduler.close()
+        assert [text for _, text in telegram.calls] == ["final", "progres 1", "progres 2"]
+
+    asyncio.run(scenario())
+
+
+def test_queued_edits_to_same_message_are_coalesced():
+    async def scenario():
+        scheduler = _scheduler()
+        telegram = _FakeTelegram()
+        calls = [scheduler(telegram, None, SendMessage(chat_id=1, text="awal"))]
+        calls += [
+            scheduler(telegram, None, EditMessageText(chat_id=1, message_id=7, text=f"edit {i}"))
+            for i in range(4)
+        ]
+        results = await asyncio.gather(*calls)
+        await scheduler.close()
+        assert telegram.calls == [(1, "awal"), (1, "edit 3")]
+        # Semua pemanggil edit menerima hasil edit terbaru
+        assert results[1:] == ["ok edit 3"] * 4
+        assert scheduler.coalesced == 3
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_pauses_chat_and_requeues_ahead_of_later_requests():
+    async def scenario():
+        scheduler = _scheduler()
+        telegram = _FakeTelegram(retry_after_texts={"a"})
+        calls = [
+            scheduler(telegram, None, SendMessage(chat_id=1, text="a")),
+            scheduler(telegram, None, SendMessage(chat_id=1, text="b")),
+            scheduler(telegram, None, SendMessage(chat_id=2, text="lain")),
+        ]
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.gather(*calls)
+        elapsed = loop.time() - started
+        await scheduler.close()
+        assert results == ["ok a", "ok b", "ok lain"]
+        assert [text for chat, text in telegram.calls if chat == 1] == ["a", "a", "b"]
+        # Chat lain tidak ikut dijeda
+        assert telegram.calls.index((2, "lain")) < telegram.calls.index((1, "b"))
+        assert elapsed >= 1.0
+        assert scheduler.retry_after_events == 1
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_requests_in_flight():
+    async def scenario():
+        scheduler = _scheduler(chat_burst=5.0)
+        telegram = _FakeTelegram(delay=0.2)
+        calls = [asyncio.ensure_future(scheduler(telegram, None, SendMessage(chat_id=1, text=str(i)))) for i in range(3)]
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["in_flight"] == 3
+        await scheduler.close()
+        assert all(call.done() for call in calls)
+        assert [call.result() for call in calls] == ["ok 0", "ok 1", "ok 2"]
+
+    asyncio.run(scenario())
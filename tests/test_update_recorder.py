@@ -0,0 +1,27 @@
+import update_recorder
+from update_recorder import UpdateAnonymizer
+
+
+def test_supervisor_shares_one_salt_with_workers(monkeypatch):
+    monkeypatch.setattr(update_recorder, "UPDATE_RECORDER_PATH", "rekaman/updates.jsonl")
+    monkeypatch.delenv("UPDATE_RECORDER_SALT", raising=False)
+    update_recorder.share_salt_with_workers()
+    salt = update_recorder.os.environ["UPDATE_RECORDER_SALT"]
+    assert len(salt) == 64
+    # Dipanggil lagi (atau dengan salt dari operator): salt yang ada tidak diganti
+    update_recorder.share_salt_with_workers()
+    assert update_recorder.os.environ["UPDATE_RECORDER_SALT"] == salt
+
+
+def test_recorder_disabled_leaves_environment_alone(monkeypatch):
+    monkeypatch.setattr(update_recorder, "UPDATE_RECORDER_PATH", "")
+    monkeypatch.delenv("UPDATE_RECORDER_SALT", raising=False)
+    update_recorder.share_salt_with_workers()
+    assert "UPDATE_RECORDER_SALT" not in update_recorder.os.environ
+
+
+def test_same_salt_gives_same_pseudonyms_across_processes():
+    first, second = UpdateAnonymizer(b"salt-bersama"), UpdateAnonymizer(b"salt-bersama")
+    assert first.pseudonym_id(12345) == second.pseudonym_id(12345)
+    assert first.pseudonym_id(-100987) == second.pseudonym_id(-100987) < 0
+    assert UpdateAnonymizer(b"salt-lain").pseudonym_id(12345) != first.pseudonym_id(12345)
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import worker_pool
+from worker_pool import WorkerSupervisor
+
+
+class _SleepingSupervisor(WorkerSupervisor):
+    """Worker pengganti yang mengabaikan pesan berhenti (time.sleep), untuk menguji jalur kill dan join."""
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(target=time.sleep, args=(30,), daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        self._last_heartbeat[index] = time.monotonic()
+
+
+async def _count_ticks(stop: asyncio.Event, ticks: list):
+    while not stop.is_set():
+        ticks.append(time.monotonic())
+        await asyncio.sleep(0.01)
+
+
+async def _while_ticking(coro):
+    """Menjalankan coro sambil mengukur jeda terpanjang event loop."""
+    stop, ticks = asyncio.Event(), []
+    ticker = asyncio.create_task(_count_ticks(stop, ticks))
+    await asyncio.sleep(0.02)
+    await coro
+    stop.set()
+    await ticker
+    return max(later - earlier for earlier, later in zip(ticks, ticks[1:]))
+
+
+def test_stop_does_not_block_event_loop():
+    async def scenario():
+        supervisor = _SleepingSupervisor(2)
+        supervisor.start()
+        longest_gap = await _while_ticking(supervisor.stop(timeout=0.5))
+        assert longest_gap < 0.3
+        assert not any(process.is_alive() for process in supervisor._processes)
+
+    asyncio.run(scenario())
+
+
+def test_stalled_worker_is_restarted_without_blocking_event_loop(monkeypatch):
+    monkeypatch.setattr(worker_pool, "WORKER_HEARTBEAT_TIMEOUT_SECONDS", 1.0)
+
+    async def scenario():
+        supervisor = _SleepingSupervisor(1)
+        supervisor.start()
+        stalled = supervisor._processes[0]
+        supervisor._last_heartbeat[0] = time.monotonic() - 10
+        await _while_ticking(supervisor.check_health())
+        assert not stalled.is_alive()
+        assert supervisor.restarts == [1]
+        assert supervisor._processes[0] is not stalled and supervisor._processes[0].is_alive()
+        await supervisor.stop(timeout=0.1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,223 @@
+"""
+Perekam update Telegram (opt-in) untuk replay uji performa: benchmarks/replay_updates.py.
+
+Setiap update ditulis sebagai satu baris JSONL {"t": waktu_kedatangan, "u": update_teranonimkan}. File dirotasi
+berdasarkan ukuran (RotatingFileHandler), dan setiap file diawali baris header berisi username bot agar mention tetap
+cocok saat replay. Penulisan ke disk dilakukan thread QueueListener, jadi event loop hanya membayar serialisasi.
+
+Anonimisasi menjaga bentuk trafik, bukan isinya:
+- id pengguna/chat diganti pseudonim HMAC yang stabil (tanda id chat dipertahankan: grup tetap negatif), jadi
+  pengelompokan per pengguna, per chat, dan hit cache tetap sama. Pseudonim stabil selama salt sama: semua worker
+  satu run berbagi salt dari supervisor, dan UPDATE_RECORDER_SALT membuatnya stabil lintas restart;
+- nama, username, dan judul dihapus, kecuali username bot sendiri;
+- setiap kata dalam teks diganti kata acak deterministik dengan panjang sama (panjang UTF-16 sama, offset entity
+  tetap valid, teks yang sama menghasilkan teks samaran yang sama); tanda baca/markdown, spasi, /perintah dan
+  @mention bot dipertahankan;
+- callback_data dibuat oleh bot sendiri sehingga disimpan apa adanya.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import UPDATE_RECORDER_PATH, UPDATE_RECORDER_MAX_BYTES, UPDATE_RECORDER_BACKUP_COUNT, UPDATE_RECORDER_SALT, WORKER_PROCESSES
+
+RECORDING_FORMAT_VERSION = 1
+
+_NAME_FIELDS = {"first_name", "last_name", "username", "title", "invite_link", "bio", "description", "sender_signature", "author_signature"}
+_ID_OWNER_FIELDS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat", "new_chat_member", "left_chat_member"}
+_VERBATIM_FIELDS = {"type", "language_code", "data", "date", "edit_date", "message_id", "update_id", "offset", "length", "is_bot"}
+_WORD_PATTERN = re.compile(r"[^\s!-/:-@\[-`{-~]+")
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+_LETTER_TABLE = bytes(ord(_LETTERS[byte % 26]) for byte in range(256))
+_WORD_CACHE_MAX_ENTRIES = 50_000
+_SALT_ENV = "UPDATE_RECORDER_SALT"
+_RANDOM_SALT_WARNING = (
+    "UPDATE_RECORDER_SALT tidak diatur: pseudonim id hanya konsisten sampai bot dimulai ulang, "
+    "rekaman dari run berbeda tidak bisa digabung per pengguna/chat."
+)
+
+
+class UpdateAnonymizer:
+    def __init__(self, salt: bytes, bot_username: Optional[str] = None):
+        self._salt = salt
+        self.bot_username = bot_username
+        self._bot_mention = re.compile(rf"(@{re.escape(bot_username)})\b", re.IGNORECASE) if bot_username else None
+        # Teks percakapan banyak mengulang kata yang sama; HMAC per kata adalah biaya terbesar perekam
+        self._word_cache: Dict[str, str] = {}
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).digest()
+
+    def pseudonym_id(self, value: int) -> int:
+        pseudonym = int.from_bytes(self._digest(f"id:{abs(value)}")[:5], "big") + 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def _word(self, word: str) -> str:
+        pseudonym = self._word_cache.get(word)
+        if pseudonym is not None:
+            return pseudonym
+        digest = self._digest(f"w:{word}")
+        if word.isascii() and word.isalpha():
+            pseudonym = (digest * (len(word) // len(digest) + 1))[:len(word)].translate(_LETTER_TABLE).decode("ascii")
+        else:
+            # Karakter di luar BMP dihitung 2 unit UTF-16 oleh Telegram; diganti karakter astral agar offset entity tidak bergeser
+            pseudonym = "".join(
+                "😀" if ord(char) > 0xFFFF else (str(digest[i % len(digest)] % 10) if char.isdigit() else _LETTERS[digest[i % len(digest)] % 26])
+                for i, char in enumerate(word)
+            )
+        if len(self._word_cache) >= _WORD_CACHE_MAX_ENTRIES:
+            self._word_cache.clear()
+        self._word_cache[word] = pseudonym
+        return pseudonym
+
+    def _words(self, value: str) -> str:
+        def replace(match: re.Match) -> str:
+            start = match.start()
+            if start > 0 and value[start - 1] == "/" and (start == 1 or value[start - 2].isspace()):
+                return match.group(0)  # /perintah
+            return self._word(match.group(0))
+        return _WORD_PATTERN.sub(replace, value)
+
+    def text(self, value: str) -> str:
+        if self._bot_mention is None:
+            return self._words(value)
+        # Bagian ganjil hasil split adalah mention bot yang dipertahankan
+        return "".join(part if index % 2 else self._words(part) for index, part in enumerate(self._bot_mention.split(value)))
+
+    def anonymize(self, value: Any, key: str = "") -> Any:
+        if isinstance(value, dict):
+            is_bot = value.get("is_bot") is True
+            result = {}
+            for field, item in value.items():
+                if field == "id" and isinstance(item, int) and key in _ID_OWNER_FIELDS and not is_bot:
+                    result[field] = self.pseudonym_id(item)
+                elif field in _NAME_FIELDS and isinstance(item, str):
+                    keep = field == "username" and self.bot_username and item.lower() == self.bot_username.lower()
+                    result[field] = item if keep else ("Anonim" if field in ("first_name", "title") else None)
+                else:
+                    result[field] = self.anonymize(item, field)
+            return {field: item for field, item in result.items() if item is not None}
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if isinstance(value, str) and key not in _VERBATIM_FIELDS:
+            return self.text(value)
+        return value
+
+
+class _RecordingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler yang menulis baris header di awal setiap file baru."""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, header: Dict[str, Any]):
+        self.header_line = json.dumps(header, separators=(",", ":")) + "\n"
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+    def _open(self):
+        stream = super()._open()
+        if stream.tell() == 0:
+            stream.write(self.header_line)
+        return stream
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Outer middleware dp.update: merekam update sebelum flood control, jadi update yang ditolak ikut terekam."""
+
+    def __init__(self, path: str, bot_username: Optional[str]):
+        self.path = path
+        if UPDATE_RECORDER_SALT:
+            salt = UPDATE_RECORDER_SALT.encode("utf-8")
+        else:
+            logging.warning(_RANDOM_SALT_WARNING)
+            salt = os.urandom(32)
+        self.anonymizer = UpdateAnonymizer(salt, bot_username)
+        self.recorded = 0
+        self.failed = 0
+        self._logger = logging.getLogger(f"update_recorder.{os.getpid()}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        file_handler = _RecordingFileHandler(
+            path, UPDATE_RECORDER_MAX_BYTES, UPDATE_RECORDER_BACKUP_COUNT,
+            {"recording": RECORDING_FORMAT_VERSION, "bot_username": bot_username},
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._queue_handler = QueueHandler(log_queue)
+        self._logger.addHandler(self._queue_handler)
+        self._listener = QueueListener(log_queue, file_handler)
+        self._listener.start()
+        logging.info(f"Perekam update aktif: {path} (rotasi {UPDATE_RECORDER_MAX_BYTES} byte x {UPDATE_RECORDER_BACKUP_COUNT}).")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            arrived_at = time.time()
+            try:
+                raw = event.model_dump(mode="json", by_alias=True, exclude_none=True, exclude_defaults=True)
+                line = json.dumps({"t": round(arrived_at, 4), "u": self.anonymizer.anonymize(raw)}, ensure_ascii=False, separators=(",", ":"))
+                self._logger.info(line)
+                self.recorded += 1
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f"Gagal merekam update {event.update_id}: {e}")
+        return await handler(event, data)
+
+    def close(self):
+        self._listener.stop()
+        self._logger.removeHandler(self._queue_handler)
+        for handler in self._listener.handlers:
+            handler.close()
+        logging.info(f"Perekam update dihentikan: {self.recorded} update direkam, {self.failed} gagal.")
+
+
+_recorder: Optional[UpdateRecorderMiddleware] = None
+
+
+def share_salt_with_workers():
+    """
+    Dipanggil supervisor sebelum worker dijalankan. Tanpa UPDATE_RECORDER_SALT setiap worker akan memakai salt acak
+    sendiri, sehingga pengguna yang sama mendapat pseudonim berbeda di file tiap worker (dan setelah worker di-restart).
+    Supervisor membuat satu salt dan mewariskannya lewat environment proses worker (spawn, config dibaca ulang).
+    """
+    if UPDATE_RECORDER_PATH and not os.getenv(_SALT_ENV):
+        logging.warning(_RANDOM_SALT_WARNING)
+        os.environ[_SALT_ENV] = secrets.token_hex(32)
+
+
+def recording_path() -> str:
+    """Dengan WORKER_PROCESSES > 1 setiap worker menulis file sendiri (akhiran pid); replay menggabungkan berdasarkan waktu."""
+    if WORKER_PROCESSES <= 1:
+        return UPDATE_RECORDER_PATH
+    root, extension = os.path.splitext(UPDATE_RECORDER_PATH)
+    return f"{root}-{os.getpid()}{extension}"
+
+
+def create_update_recorder(bot_username: Optional[str]) -> Optional[UpdateRecorderMiddleware]:
+    global _recorder
+    if not UPDATE_RECORDER_PATH:
+        return None
+    if _recorder is None:
+        directory = os.path.dirname(os.path.abspath(UPDATE_RECORDER_PATH))
+        os.makedirs(directory, exist_ok=True)
+        _recorder = UpdateRecorderMiddleware(recording_path(), bot_username)
+    return _recorder
+
+
+def close_update_recorder():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
@@ -0,0 +1,137 @@
+"""
+Mode webhook sebagai alternatif long polling.
+
+Update dari Telegram diterima lewat aiohttp, diverifikasi dengan secret token, di-deduplikasi berdasarkan update_id
+(retry Telegram tidak memicu panggilan Mistral kedua), lalu langsung dijawab 200 sementara pemrosesan berjalan
+di background task.
+
+Tanpa WEBHOOK_BASE_URL webhook tidak didaftarkan ke Telegram, sehingga server bisa diuji offline dengan POST
+update rekaman, misalnya:
+    curl -X POST -H "Content-Type: application/json" -H "X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>" \\
+         -d @update.json http://127.0.0.1:8080/telegram/webhook
+"""
+import asyncio
+import logging
+import secrets
+from typing import Any, Callable, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from cache_utils import LruTtlCache
+from config import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN_HOST,
+    WEBHOOK_LISTEN_PORT,
+    WEBHOOK_DEDUP_SIZE
+)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookUpdateHandler:
+    """
+    Handler aiohttp untuk update webhook: verifikasi secret, deduplikasi update_id, ack cepat.
+    Jika update_sink diberikan (mode supervisor), update diteruskan ke sink alih-alih diproses di proses ini.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret_token: Optional[str], dedup_size: int,
+                 update_sink: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.dp = dp
+        self.bot = bot
+        self.update_sink = update_sink
+        self.secret_token = secret_token
+        self._seen_update_ids: LruTtlCache[int, bool] = LruTtlCache(max_size=dedup_size)
+        self._tasks: Set[asyncio.Task] = set()
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and not secrets.compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token):
+            self.rejected += 1
+            logging.warning(f"Webhook: secret token tidak valid dari {request.remote}.")
+            return web.Response(status=401)
+        try:
+            payload: Dict[str, Any] = await request.json()
+        except Exception:
+            self.rejected += 1
+            return web.Response(status=400)
+
+        update_id = payload.get("update_id")
+        if update_id is not None:
+            if self._seen_update_ids.peek(update_id):
+                self.duplicates += 1
+                logging.info(f"Webhook: update {update_id} duplikat (retry Telegram), diabaikan.")
+                return web.Response(status=200)
+            self._seen_update_ids.set(update_id, True)
+
+        self.accepted += 1
+        if self.update_sink is not None:
+            self.update_sink(payload)
+            return web.Response(status=200)
+        task = asyncio.create_task(self._process(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, payload: Dict[str, Any]):
+        try:
+            await self.dp.feed_raw_update(self.bot, payload)
+        except Exception as e:
+            logging.error(f"Webhook: error saat memproses update {payload.get('update_id')}: {e}", exc_info=True)
+
+    async def wait_pending(self, timeout: float = 30.0):
+        """Menunggu update yang masih diproses (dipanggil saat shutdown)."""
+        if self._tasks:
+            logging.info(f"Webhook: menunggu {len(self._tasks)} update yang masih diproses...")
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "in_flight": len(self._tasks),
+        }
+
+
+def create_webhook_app(update_handler: WebhookUpdateHandler) -> web.Application:
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, update_handler.handle)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, update_sink: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """Menjalankan server webhook sampai task dibatalkan. Webhook didaftarkan saat start dan dihapus saat berhenti."""
+    update_handler = WebhookUpdateHandler(dp, bot, WEBHOOK_SECRET, WEBHOOK_DEDUP_SIZE, update_sink=update_sink)
+    runner = web.AppRunner(create_webhook_app(update_handler))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT)
+    await site.start()
+    logging.info(f"Server webhook mendengarkan di {WEBHOOK_LISTEN_HOST}:{WEBHOOK_LISTEN_PORT}{WEBHOOK_PATH}")
+
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    webhook_registered = False
+    try:
+        if WEBHOOK_BASE_URL:
+            webhook_url = WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH
+            await bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET, allowed_updates=dp.resolve_used_update_types())
+            webhook_registered = True
+            logging.info(f"Webhook didaftarkan ke Telegram: {webhook_url}")
+        else:
+            logging.warning("WEBHOOK_BASE_URL tidak diatur: webhook tidak didaftarkan ke Telegram (mode uji lokal).")
+        await asyncio.Event().wait()
+    finally:
+        if webhook_registered:
+            try:
+                await bot.delete_webhook()
+                logging.info("Webhook dihapus dari Telegram.")
+            except Exception as e:
+                logging.error(f"Gagal menghapus webhook: {e}")
+        await runner.cleanup()
+        await update_handler.wait_pending()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        logging.info(f"Server webhook dihentikan. Statistik: {update_handler.stats()}")
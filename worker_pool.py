@@ -0,0 +1,294 @@
+"""
+Mode supervisor multi-proses.
+
+Supervisor mengambil update (long polling, atau webhook bila BOT_MODE=webhook) lalu membaginya ke WORKER_PROCESSES
+proses worker berdasarkan hash from_user.id / chat.id. Semua update dari satu pengguna selalu masuk ke worker yang
+sama dan diproses berurutan di sana, sedangkan pengguna berbeda diproses paralel di banyak core.
+Worker mengirim heartbeat beserta statistik; supervisor me-restart worker yang mati atau macet.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+
+from config import (
+    BOT_MODE, WORKER_PROCESSES, WORKER_HEALTH_INTERVAL_SECONDS, WORKER_HEARTBEAT_TIMEOUT_SECONDS, METRICS_HOST, METRICS_PORT,
+    LOOP_WATCHDOG_ENABLED
+)
+
+_POLLING_TIMEOUT_SECONDS = 30
+# Batas waktu sampai heartbeat pertama (import modul + setup dispatcher di proses baru bisa lambat)
+_STARTUP_TIMEOUT_SECONDS = 120
+_STOP = None
+
+
+def routing_key(update: Dict[str, Any]) -> int:
+    """Kunci sharding update: id pengguna, lalu id chat, lalu update_id sebagai cadangan."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        from_user = value.get("from")
+        if isinstance(from_user, dict) and "id" in from_user:
+            return int(from_user["id"])
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return int(update.get("update_id", 0))
+
+
+# --- Sisi worker ---
+
+class _KeyedSerializer:
+    """Menjamin update dengan kunci yang sama diproses berurutan (FIFO), kunci berbeda tetap paralel."""
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    async def run(self, key: int, coro):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                return await coro
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+
+def _worker_main(index: int, inbox: multiprocessing.Queue, status_queue: multiprocessing.Queue):
+    try:
+        asyncio.run(_worker_loop(index, inbox, status_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(index: int, inbox: multiprocessing.Queue, status_queue: multiprocessing.Queue):
+    # Import di sini: setiap proses worker menyiapkan dispatcher, klien dan cache-nya sendiri
+    from main import configure_logging, setup_dispatcher
+    from bot_setup import bot, dp, i18n
+    from storage_service import start_history_writer, stop_history_writer, start_retention_job, stop_retention_job, close_storage
+    from response_cache import response_cache
+    from mistral_integration import close_mistral_pool
+    from telegram_outbound import outbound_scheduler
+    from metrics import start_metrics_server
+    from loop_watchdog import loop_watchdog, register_loop_watchdog_endpoints
+    from update_recorder import close_update_recorder
+
+    configure_logging()
+    await setup_dispatcher()
+    start_history_writer()
+    # Tiap worker menghapus sesi lama penggunanya sendiri; sweep retensi cukup dijalankan satu worker
+    start_retention_job(run_sweeps=index == 0)
+    if LOOP_WATCHDOG_ENABLED:
+        register_loop_watchdog_endpoints()
+        loop_watchdog.start()
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + 1 + index if METRICS_PORT > 0 else 0)
+    logging.info(f"Worker {index} (pid {os.getpid()}) siap memproses update.")
+
+    loop = asyncio.get_running_loop()
+    serializer = _KeyedSerializer()
+    tasks = set()
+    stats = {"processed": 0, "failed": 0}
+
+    async def process(update: Dict[str, Any]):
+        try:
+            await serializer.run(routing_key(update), dp.feed_raw_update(bot, update))
+            stats["processed"] += 1
+        except Exception as e:
+            stats["failed"] += 1
+            logging.error(f"Worker {index}: error saat memproses update {update.get('update_id')}: {e}", exc_info=True)
+
+    def send_heartbeat():
+        status_queue.put(("heartbeat", index, os.getpid(), {**stats, "in_flight": len(tasks)}))
+
+    last_heartbeat = 0.0
+    try:
+        while True:
+            if time.monotonic() - last_heartbeat >= WORKER_HEALTH_INTERVAL_SECONDS:
+                send_heartbeat()
+                last_heartbeat = time.monotonic()
+            try:
+                update = await loop.run_in_executor(None, inbox.get, True, WORKER_HEALTH_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            if update is _STOP:
+                break
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.wait(set(tasks), timeout=30)
+        await stop_history_writer()
+        await stop_retention_job()
+        await outbound_scheduler.close()
+        await bot.session.close()
+        i18n.stop_watching()
+        await close_storage()
+        await response_cache.close()
+        await close_mistral_pool()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        loop_watchdog.stop()
+        close_update_recorder()
+        send_heartbeat()
+        logging.info(f"Worker {index} berhenti. Statistik: {stats}")
+
+
+# --- Sisi supervisor ---
+
+class WorkerSupervisor:
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes: List[multiprocessing.Queue] = [self._context.Queue() for _ in range(worker_count)]
+        self._status_queue: multiprocessing.Queue = self._context.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * worker_count
+        self._started_at: List[float] = [0.0] * worker_count
+        self._last_heartbeat: List[Optional[float]] = [None] * worker_count
+        self._worker_stats: List[Dict[str, Any]] = [{} for _ in range(worker_count)]
+        self.dispatched = [0] * worker_count
+        self.restarts = [0] * worker_count
+
+    def start(self):
+        for index in range(self.worker_count):
+            self._start_worker(index)
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=_worker_main, args=(index, self._inboxes[index], self._status_queue),
+            name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        self._last_heartbeat[index] = None
+        logging.info(f"Worker {index} dijalankan (pid {process.pid}).")
+
+    def dispatch(self, update: Dict[str, Any]):
+        index = routing_key(update) % self.worker_count
+        self._inboxes[index].put(update)
+        self.dispatched[index] += 1
+
+    def _drain_status(self):
+        while True:
+            try:
+                kind, index, pid, stats = self._status_queue.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "heartbeat":
+                self._last_heartbeat[index] = time.monotonic()
+                self._worker_stats[index] = {"pid": pid, **stats}
+
+    async def check_health(self):
+        """Me-restart worker yang mati atau macet. join() berjalan di thread agar event loop supervisor tidak tertahan."""
+        self._drain_status()
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            last_heartbeat = self._last_heartbeat[index]
+            if not process.is_alive():
+                logging.error(f"Worker {index} (pid {process.pid}) mati dengan exit code {process.exitcode}. Me-restart...")
+            elif last_heartbeat is None and now - self._started_at[index] > _STARTUP_TIMEOUT_SECONDS:
+                logging.error(f"Worker {index} (pid {process.pid}) tidak siap dalam {_STARTUP_TIMEOUT_SECONDS}s. Me-restart...")
+                process.kill()
+                await asyncio.to_thread(process.join, 5)
+            elif last_heartbeat is not None and now - last_heartbeat > WORKER_HEARTBEAT_TIMEOUT_SECONDS:
+                logging.error(f"Worker {index} (pid {process.pid}) tidak mengirim heartbeat selama {WORKER_HEARTBEAT_TIMEOUT_SECONDS}s. Me-restart...")
+                process.kill()
+                await asyncio.to_thread(process.join, 5)
+            else:
+                continue
+            self.restarts[index] += 1
+            self._start_worker(index)
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL_SECONDS)
+            await self.check_health()
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistik gabungan semua worker beserta rincian per worker."""
+        totals = {"processed": 0, "failed": 0, "in_flight": 0}
+        for worker_stats in self._worker_stats:
+            for key in totals:
+                totals[key] += worker_stats.get(key, 0)
+        return {
+            **totals,
+            "dispatched": sum(self.dispatched),
+            "restarts": sum(self.restarts),
+            "workers": [
+                {"index": index, "alive": bool(process and process.is_alive()), "dispatched": self.dispatched[index],
+                 "restarts": self.restarts[index], **self._worker_stats[index]}
+                for index, process in enumerate(self._processes)
+            ],
+        }
+
+    async def stop(self, timeout: float = 30.0):
+        """Meminta semua worker berhenti lalu menunggunya (join di thread, event loop tetap melayani request lain)."""
+        for inbox in self._inboxes:
+            inbox.put(_STOP)
+        await asyncio.to_thread(self._join_workers, timeout)
+        self._drain_status()
+        logging.info(f"Semua worker dihentikan. Statistik: {self.stats()}")
+
+    def _join_workers(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.warning(f"Worker {index} tidak berhenti tepat waktu, dihentikan paksa.")
+                process.kill()
+                process.join(timeout=5)
+
+
+async def _poll_updates(bot: Bot, supervisor: WorkerSupervisor, allowed_updates: List[str]):
+    """Satu fetcher long polling yang membagikan update ke worker."""
+    offset: Optional[int] = None
+    backoff = 1.0
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=_POLLING_TIMEOUT_SECONDS, allowed_updates=allowed_updates)
+            backoff = 1.0
+        except Exception as e:
+            logging.error(f"Supervisor: gagal mengambil update: {e}. Mencoba lagi dalam {backoff:.0f}s.")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            supervisor.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher):
+    """Menjalankan WORKER_PROCESSES worker dan satu sumber update (polling atau webhook) sampai dibatalkan."""
+    import handlers.message_handlers # Diperlukan agar resolve_used_update_types mengenali handler
+
+    from update_recorder import share_salt_with_workers
+
+    share_salt_with_workers()
+    supervisor = WorkerSupervisor(WORKER_PROCESSES)
+    supervisor.start()
+    monitor_task = asyncio.create_task(supervisor.monitor())
+    try:
+        if BOT_MODE == "webhook":
+            from webhook_server import run_webhook
+            logging.info(f"Supervisor: menerima update via webhook untuk {WORKER_PROCESSES} worker.")
+            await run_webhook(dp, bot, update_sink=supervisor.dispatch)
+        else:
+            logging.info(f"Supervisor: long polling untuk {WORKER_PROCESSES} worker.")
+            await _poll_updates(bot, supervisor, dp.resolve_used_update_types())
+    finally:
+        monitor_task.cancel()
+        await supervisor.stop()